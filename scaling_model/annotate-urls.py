@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+annotate-urls.py
+Purpose: add the news domain, its ideology score and its social media 
+		 accounts to each URL of a browsing trace, reading and writing one
+		 URL at a time. See plnews/domains.py for how URLs are matched.
+
+Parameters: 
+    [REQUIRED] --input:     A file with one URL per line, or a csv with a 
+                              column of URLs (see --colname); '-' for stdin
+    [OPTIONAL] --output:    A csv where to write the annotated URLs 
+                              (default: stdout)
+    [OPTIONAL] --colname:   The name of the column with the URLs, if the 
+                              input is a csv
+    [OPTIONAL] --matched:   Only write out the URLs on listed domains
+    [OPTIONAL] --benchmark: Instead, annotate a synthetic trace of this many
+                              URLs and report the URLs per second
+
+Example:
+python annotate-urls.py \
+    --input data/trace-urls.csv \
+    --colname url \
+    --output data/trace-urls-annotated.csv
+python annotate-urls.py --benchmark 5000000
+"""
+
+#==============================================================================    
+# MODULES -- DEPENDENCIES
+#==============================================================================
+import argparse
+import csv
+import sys
+from itertools import tee
+from plnews.domains import Domain, benchmark, load_index, synthetic_trace
+
+#==============================================================================    
+# COMMAND LINE ARGUMENTS
+#==============================================================================
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--input', 
+                        help='a file with one URL per line, or a csv of URLs',
+                        required = False)
+    parser.add_argument('--output', 
+                        help='a csv where to write the annotated URLs',
+                        required = False)
+    parser.add_argument('--colname', 
+                        help='the name of the column with the URLs',
+                        required = False)
+    parser.add_argument('--matched', 
+                        help='only write out the URLs on listed domains',
+                        action = 'store_true')
+    parser.add_argument('--benchmark', 
+                        help='annotate a synthetic trace of this many URLs',
+                        type = int,
+                        required = False)
+    args = parser.parse_args(argv)
+    if args.input is None and args.benchmark is None:
+        parser.error('one of --input or --benchmark is required')
+    return(args)
+
+#==============================================================================    
+# MAIN
+#==============================================================================
+def main(args):
+    index = load_index()
+    if args.benchmark:
+        urls = synthetic_trace(index, args.benchmark, seed = 1)
+        result = benchmark(index, urls)
+        print('{} domains; annotated {urls} URLs ({matched} on listed '
+              'domains) in {seconds} secs: {urls_per_sec} URLs/sec'.format(
+                  len(index), **result))
+        return
+    infile = sys.stdin if args.input == '-' else open(args.input)
+    outfile = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        # - the two copies are read in step, so only one URL is held
+        urls, urls_copy = tee(read_urls(infile, args.colname))
+        writer = csv.writer(outfile)
+        writer.writerow(['url'] + list(Domain._fields))
+        empty = [''] * len(Domain._fields)
+        for url, record in zip(urls_copy, index.annotate(urls)):
+            if record is not None:
+                writer.writerow([url] + ['' if x is None else x 
+                                         for x in record])
+            elif not args.matched:
+                writer.writerow([url] + empty)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+#==============================================================================    
+# FUNCTIONS
+#==============================================================================
+def read_urls(infile, colname = None):
+    """
+    Yields the URLs in the input, one at a time: those in the column 
+    'colname' of a csv, or one per line
+    """
+    if colname:
+        for row in csv.DictReader(infile):
+            yield(row[colname])
+    else:
+        for line in infile:
+            line = line.strip()
+            if line:
+                yield(line)
+
+
+if __name__ == "__main__":
+    main(parse_args())
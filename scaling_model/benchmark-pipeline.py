@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark-pipeline.py
+Purpose: measure the matrix-building pipeline on synthetic follower data at
+		 several scales, and save wall time, peak memory and edges per
+		 second of each stage to a json file, to compare runs over time.
+
+The synthetic media and politician follower directories mimic the real ones
+(see plnews/synthetic.py): the same accounts with 'scale' times as many
+followers. Each stage runs as its own process, so that its peak resident
+memory can be measured:
+- pack:        pack-follower-store.py on the media and politician csvs
+- build-csv:   the matrix builder on the csv directories (--full, text)
+- build-store: the matrix builder on the follower stores (--full, binary),
+               into a directory of its own, as a run in the binary format
+               removes the text files of the same run
+- update:      the matrix builder on the stores again, with nothing changed
+               (reuses the previous matrix, see plnews/manifest.py)
+- export:      export-matrix.py on the text output of build-csv
+
+The builder also runs with --stats, and the records of its own stages
+(read, degree, intense-followers, small-media, sampling, linking, matrix,
+export; see plnews/stages.py) are saved with the result of each build
+stage, under 'builder_stages', with their wall and cpu time, peak memory
+and rows or edges handled.
+
+Parameters:
+    [REQUIRED] --output:  The json file where to save the results
+    [OPTIONAL] --media:   The real media followers, to take the stats from
+                            (default: data/PL-media-followers/)
+    [OPTIONAL] --pol:     The real politician followers (default:
+                            data/PL-politicians-followers/)
+    [OPTIONAL] --scales:  Scales to run, relative to the real data
+                            (default: 1 10 100)
+    [OPTIONAL] --base:    A factor applied to all scales, e.g. 0.1 for a
+                            quick run (default 1)
+    [OPTIONAL] --stages:  The stages to run (default: all)
+    [OPTIONAL] --workers: Workers for the matrix builder (default 1)
+    [OPTIONAL] --seed:    Seed for the synthetic data and the builder
+    [OPTIONAL] --workdir: Where to write the synthetic data and the outputs
+                            (default: a temporary directory, removed at the
+                            end)
+
+Example:
+python benchmark-pipeline.py \
+    --output benchmarks/pipeline-2021-05-01.json \
+    --scales 1 10
+"""
+
+#==============================================================================
+# MODULES -- DEPENDENCIES
+#==============================================================================
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+from plnews.matrix import load_matrix, matrix_file
+from plnews.store import open_followers
+from plnews.synthetic import (EXPONENT, UserPool, follower_stats,
+                              generate_followers)
+
+#==============================================================================
+# CONSTANTS
+#==============================================================================
+STAGES = ['pack', 'build-csv', 'build-store', 'update', 'export']
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+BUILDER = 'build-bipartite-matrix-media-politician-followers.py'
+
+#==============================================================================
+# COMMAND LINE ARGUMENTS
+#==============================================================================
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--output',
+                        help='the json file where to save the results',
+                        required = True)
+    parser.add_argument('--media',
+                        help='the real media followers',
+                        default = 'data/PL-media-followers/')
+    parser.add_argument('--pol',
+                        help='the real politician followers',
+                        default = 'data/PL-politicians-followers/')
+    parser.add_argument('--scales',
+                        help='scales to run, relative to the real data',
+                        type = float,
+                        nargs = '+',
+                        default = [1, 10, 100])
+    parser.add_argument('--base',
+                        help='a factor applied to all scales',
+                        type = float,
+                        default = 1.0)
+    parser.add_argument('--stages',
+                        help='the stages to run',
+                        nargs = '+',
+                        choices = STAGES,
+                        default = STAGES)
+    parser.add_argument('--workers',
+                        help='workers for the matrix builder',
+                        type = int,
+                        default = 1)
+    parser.add_argument('--seed',
+                        help='seed for the synthetic data and the builder',
+                        type = int,
+                        default = 1)
+    parser.add_argument('--workdir',
+                        help='where to write the synthetic data and the outputs',
+                        required = False)
+    return(parser.parse_args(argv))
+
+#==============================================================================
+# MAIN
+#==============================================================================
+def main(args):
+    print('Reading the stats of the real follower data')
+    media_stats = follower_stats(args.media)
+    pol_stats = follower_stats(args.pol)
+    users = union_users(args.media, args.pol)
+    print('\t {} media and {} politician accounts, {} follows, {} users'
+          .format(len(media_stats['counts']), len(pol_stats['counts']),
+                  media_stats['follows'] + pol_stats['follows'], users))
+    results = {
+        'created': str(datetime.now()).split('.')[0],
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'settings': {'scales': args.scales, 'base': args.base,
+                     'stages': args.stages, 'workers': args.workers,
+                     'seed': args.seed, 'exponent': EXPONENT},
+        'real_data': {'media_accounts': len(media_stats['counts']),
+                      'pol_accounts': len(pol_stats['counts']),
+                      'follows': media_stats['follows'] + pol_stats['follows'],
+                      'users': users},
+        'data': [],
+        'results': []}
+    workdir = args.workdir if args.workdir else tempfile.mkdtemp()
+    try:
+        for scale in args.scales:
+            run_scale(args, scale, workdir, media_stats, pol_stats, users,
+                      results)
+            # - keep the results so far in case a larger scale fails
+            write_results(args.output, results)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir)
+    print('\nResults saved in {}'.format(args.output))
+
+
+#==============================================================================
+# FUNCTIONS
+#==============================================================================
+def run_scale(args, scale, workdir, media_stats, pol_stats, users, results):
+    """
+    Generates the data for one scale and runs the stages of 'args' on it
+    """
+    factor = scale * args.base
+    path = os.path.join(workdir, 'scale-{:g}'.format(scale), '')
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    media_path = os.path.join(path, 'media', '')
+    pol_path = os.path.join(path, 'pols', '')
+    csv_out = os.path.join(path, 'graph-csv', '')
+    store_out = os.path.join(path, 'graph-store', '')
+    export_out = os.path.join(path, 'export', '')
+    for x in [csv_out, store_out, export_out]:
+        os.makedirs(x)
+    print('\nScale {:g} (x{:g} the real data)'.format(scale, factor))
+    print(str(datetime.now()).split('.')[0])
+    start = time.time()
+    pool = UserPool(max(int(users * factor), 1), seed = args.seed)
+    media_rows = generate_followers(media_path, media_stats['counts'], pool,
+                                    factor, seed = args.seed)
+    pol_rows = generate_followers(pol_path, pol_stats['counts'], pool,
+                                  factor, seed = args.seed + 1)
+    data = {'scale': scale, 'factor': factor, 'users': len(pool),
+            'media_rows': media_rows, 'pol_rows': pol_rows,
+            'generate_secs': round(time.time() - start, 2)}
+    results['data'].append(data)
+    print('\t generated {} media and {} politician follower rows in {} secs'
+          .format(media_rows, pol_rows, data['generate_secs']))
+
+    builder = [BUILDER, '--run', '1', '--country', 'SYN', '--seed',
+               str(args.seed), '--workers', str(args.workers)]
+    # - (stage, commands, the directory of the matrix it writes)
+    stages = [
+        ('pack', [['pack-follower-store.py', '--input', media_path,
+                   '--output', path + 'media.bin'],
+                  ['pack-follower-store.py', '--input', pol_path,
+                   '--output', path + 'pols.bin']], None),
+        ('build-csv', [builder + ['--output', csv_out, '--media', media_path,
+                                  '--pol', pol_path, '--full', '--format',
+                                  'text']], csv_out),
+        ('build-store', [builder + ['--output', store_out, '--media',
+                                    path + 'media.bin', '--pol',
+                                    path + 'pols.bin', '--full', '--format',
+                                    'binary']], store_out),
+        ('update', [builder + ['--output', store_out, '--media',
+                               path + 'media.bin', '--pol', path + 'pols.bin',
+                               '--format', 'binary']], store_out),
+        ('export', [['export-matrix.py', '--input', csv_out, '--run', '1',
+                     '--country', 'SYN', '--output', export_out]],
+         export_out)]
+    for stage, commands, out_path in stages:
+        if stage not in args.stages:
+            continue
+        wall, rss = 0.0, 0.0
+        stats = '{}{}.stats'.format(path, stage)
+        for command in commands:
+            log = '{}{}.log'.format(path, stage)
+            if command[0] == BUILDER:
+                command = command + ['--stats', stats]
+            secs, peak = run_stage(command, log)
+            wall += secs
+            rss = max(rss, peak)
+        edges = count_edges(out_path) if out_path else None
+        result = {'scale': scale, 'stage': stage,
+                  'wall_time': round(wall, 3), 'peak_rss_mb': round(rss, 1),
+                  'edges': edges,
+                  'edges_per_sec': round(edges / wall) if edges else None}
+        if stage == 'pack':
+            result['rows_per_sec'] = round((media_rows + pol_rows) / wall)
+        if os.path.exists(stats):
+            result['builder_stages'] = read_stage_stats(stats)
+        results['results'].append(result)
+        print('\t {:12} {:8.2f} secs {:8.1f} MB peak{}'.format(
+            stage, wall, rss, '' if edges is None else
+            ', {} edges/sec'.format(result['edges_per_sec'])))
+        for x in result.get('builder_stages', []):
+            print('\t   {:17} {:8.2f} secs {:8.1f} MB peak'.format(
+                x['stage'], x['wall_time'], x['peak_rss_mb']))
+
+
+def run_stage(command, log):
+    """
+    Runs one of the scripts of the pipeline in a new process, through 
+    plnews/measure.py so that the memory of this process is not counted. 
+    Returns the wall time and the peak resident memory (MB) of the stage.
+    """
+    command = [sys.executable, '-m', 'plnews.measure', log, sys.executable,
+               os.path.join(SCRIPT_PATH, command[0])] + command[1:]
+    output = subprocess.check_output(command, cwd = SCRIPT_PATH)
+    result = json.loads(output.decode().strip().split('\n')[-1])
+    if result['returncode'] != 0:
+        raise RuntimeError('{} failed, see {}'.format(command[6], log))
+    return(result['wall_time'], result['peak_rss_mb'])
+
+
+def read_stage_stats(fname):
+    """
+    Returns the records of the stages of the builder in a --stats file,
+    without the run label, country and start time they all share
+    """
+    records = []
+    with open(fname) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                for key in ['country', 'run', 'started']:
+                    record.pop(key, None)
+                records.append(record)
+    return(records)
+
+
+def count_edges(out_path):
+    """Returns the number of edges in the latest matrix in 'out_path'"""
+    fname = matrix_file(out_path, 'SYN', '1', 'graph', 'npz')
+    if os.path.exists(fname):
+        return(int(load_matrix(fname)[0].nnz))
+    fname = matrix_file(out_path, 'SYN', '1', 'indices')
+    if os.path.exists(fname):
+        with open(fname, 'rb') as f:
+            return(sum(x.count(b'\n') for x in iter(lambda: f.read(1 << 20),
+                                                    b'')))
+    return(None)
+
+
+def union_users(*paths):
+    """Returns the number of distinct followers over several sources"""
+    ids = []
+    for path in paths:
+        source = open_followers(path)
+        ids.extend(source.followers(x) for x in source.accounts)
+    return(len(np.unique(np.concatenate(ids))))
+
+
+def git_commit():
+    """Returns the commit of the code being measured, if in a git repo"""
+    try:
+        return(subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd = SCRIPT_PATH,
+            stderr = subprocess.DEVNULL).decode().strip())
+    except (OSError, subprocess.CalledProcessError):
+        return(None)
+
+
+def write_results(fname, results):
+    out_dir = os.path.dirname(fname)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    with open(fname, 'w') as f:
+        json.dump(results, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main(parse_args())
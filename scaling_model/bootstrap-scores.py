@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+bootstrap-scores.py
+Purpose: bootstrap intervals for the ideology of the news domains, from
+         resamples of the followers in a bipartite matrix, without
+         refitting the model in R. See plnews/bootstrap.py for the
+         estimator.
+
+The followers with more than --min-edges follows are scored against the
+fitted account parameters (as in score-followers.py). Each replicate draws
+them with replacement and rescores every account of the matrix. The output
+has one row per domain of the Twitter list (pl-news-twitter-v1.0.0.csv)
+whose account is in the matrix, with the 'domain' column to join it to
+pl-news-domains-v1.0.0.csv.csv:
+- zeta:        the ideology of the account, rescored on all the followers
+- zeta_fitted: the ideology fitted in R, if the account has one
+- zeta_sd:     the standard deviation over the replicates
+- zeta_lower, zeta_upper: the percentile interval at --level
+- followers:   the followers of the account among the users resampled
+- replicates:  the replicates in which the account had any followers
+
+Parameters:
+    [REQUIRED] --params:     A csv with the fitted account parameters
+                               ('account', 'zeta', 'gamma', 'omega')
+    [REQUIRED] --input:      The directory with the matrix (text or binary
+                               files, as written by the matrix builder)
+    [REQUIRED] --run:        The run label in the matrix file names
+    [REQUIRED] --country:    The country prefix in the matrix file names
+    [REQUIRED] --output:     A csv where to write the intervals by domain
+    [OPTIONAL] --accounts:   A csv where to write the intervals of every
+                               account (media and politicians)
+    [OPTIONAL] --hyper:      A csv with the priors of the users ('name',
+                               'value')
+    [OPTIONAL] --poisson:    Score and rescore with a Poisson model if
+                               --params has no dispersion ('omega'), as
+                               exported before it was added; otherwise
+                               such params are refused
+    [OPTIONAL] --replicates: Number of bootstrap replicates (default 200)
+    [OPTIONAL] --level:      Level of the intervals (default 0.9)
+    [OPTIONAL] --min-edges:  Only followers with more than this many follows
+                               are resampled (default 50, as in the model)
+    [OPTIONAL] --workers:    Number of worker processes (default 1). The
+                               results do not depend on it.
+    [OPTIONAL] --seed:       Seed for the resamples (default 1)
+
+Example:
+python bootstrap-scores.py \
+    --params data/PL-account-params_03.csv \
+    --hyper data/PL-model-hyper_03.csv \
+    --input data/PL-graph/ \
+    --run 3 \
+    --country PL \
+    --workers 4 \
+    --output data/PL-domain-intervals-3.csv
+"""
+
+#==============================================================================
+# MODULES -- DEPENDENCIES
+#==============================================================================
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from plnews.bootstrap import (LEVEL, MIN_EDGES, REPLICATES, Users,
+                              account_omega, bootstrap_accounts, intervals)
+from plnews.domains import TWITTER_FILE
+from plnews.handles import HandleRegistry, normalize
+from plnews.matrix import read_matrix
+from plnews.scoring import read_params, score_rows
+
+#==============================================================================
+# COMMAND LINE ARGUMENTS
+#==============================================================================
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--params',
+                        help='a csv with the fitted account parameters',
+                        required = True)
+    parser.add_argument('--input',
+                        help='the directory with the matrix',
+                        required = True)
+    parser.add_argument('--run',
+                        help='the run label in the matrix file names',
+                        required = True)
+    parser.add_argument('--country',
+                        help='the country prefix in the matrix file names',
+                        required = True)
+    parser.add_argument('--output',
+                        help='a csv where to write the intervals by domain',
+                        required = True)
+    parser.add_argument('--accounts',
+                        help='a csv where to write the intervals by account',
+                        required = False)
+    parser.add_argument('--hyper',
+                        help='a csv with the priors of the users',
+                        required = False)
+    parser.add_argument('--poisson',
+                        help='a Poisson model if the params have no omega',
+                        action = 'store_true')
+    parser.add_argument('--replicates',
+                        help='number of bootstrap replicates',
+                        type = int,
+                        default = REPLICATES)
+    parser.add_argument('--level',
+                        help='level of the intervals',
+                        type = float,
+                        default = LEVEL)
+    parser.add_argument('--min-edges',
+                        help='only resample followers with more follows than this',
+                        type = int,
+                        default = MIN_EDGES)
+    parser.add_argument('--workers',
+                        help='number of worker processes (default 1)',
+                        type = int,
+                        default = 1)
+    parser.add_argument('--seed',
+                        help='seed for the resamples',
+                        type = int,
+                        default = 1)
+    return(parser.parse_args(argv))
+
+#==============================================================================
+# MAIN
+#==============================================================================
+def main(args):
+    params = read_params(args.params, args.hyper, poisson = args.poisson)
+    mat, rownames, colnames = read_matrix(args.input, args.country,
+                                          str(args.run))
+    mat = mat.tocsr()
+    rows = np.flatnonzero(mat.getnnz(axis = 1) > args.min_edges)
+    print('{} x {} matrix; {} followers with more than {} follows'.format(
+        mat.shape[0], mat.shape[1], len(rows), args.min_edges))
+
+    # - the ideology and activity of the followers, from the fitted accounts
+    start = time.time()
+    scores = score_rows(mat[rows], colnames, params)
+    scored = scores['theta'].notnull().values
+    users = Users(mat[rows[scored]], scores['theta'].values[scored],
+                  scores['alpha'].values[scored])
+    print('Scored {} followers in {:.1f} secs'.format(
+        len(users), time.time() - start))
+
+    start = time.time()
+    # - the accounts are rescored under the dispersion of the model the
+    #   users were scored with (none with --poisson)
+    estimates, draws = bootstrap_accounts(users, args.replicates,
+                                          args.workers, args.seed,
+                                          omega = account_omega(params,
+                                                                colnames))
+    elapsed = time.time() - start
+    print('{} replicates in {:.1f} secs ({:.1f} per sec)'.format(
+        args.replicates, elapsed, args.replicates / max(elapsed, 1e-9)))
+
+    accounts = intervals(estimates, draws, args.level)
+    accounts.insert(0, 'account', colnames)
+    fitted = HandleRegistry(params.accounts)
+    accounts.insert(2, 'zeta_fitted', [
+        np.nan if fitted.get(x) is None else params.zeta[fitted.get(x)]
+        for x in colnames])
+    if args.accounts:
+        accounts.to_csv(args.accounts, index = False)
+    domains = join_domains(accounts)
+    domains.to_csv(args.output, index = False)
+    print('Intervals for {} domains saved in {}'.format(len(domains),
+                                                        args.output))
+
+
+#==============================================================================
+# FUNCTIONS
+#==============================================================================
+def join_domains(accounts, twitter_file = TWITTER_FILE):
+    """
+    Returns the intervals of the accounts of the news domains, one row per
+    domain of 'twitter_file' whose account is a column of the matrix.
+    Handles are matched without the '@' and regardless of case, as on
+    Twitter (see plnews/handles.py).
+    """
+    handles = pd.read_csv(twitter_file, dtype = str).dropna()
+    handles['key'] = [normalize(x) for x in handles['twitter_handle']]
+    accounts = accounts.assign(key = [normalize(x) 
+                                      for x in accounts['account']])
+    accounts = accounts.drop_duplicates('key')
+    out = handles.merge(accounts, on = 'key', how = 'inner')
+    out = out.drop(columns = ['key', 'account'])
+    return(out.sort_values('domain').reset_index(drop = True))
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -6,8 +6,68 @@ Purpose: build a bipartite matrix for the network of followers of media and
 		 politician accounts.
 
 Parameters: 
-    [REQUIRED] --output: Path to an output file.
-                              
+    [REQUIRED] --output:  Path to an output file.
+    [REQUIRED] --run:     A label for this run, used in the output file names
+                            (optional with --config)
+    [REQUIRED] --country: A country prefix, used in the output file names
+                            (optional with --config)
+    [REQUIRED] --media:   Directory with one csv of followers per media
+                            account, or a follower store with the same data
+                            (see pack-follower-store.py; optional with
+                            --config)
+    [REQUIRED] --pol:     Directory with one csv of followers per politician,
+                            or a follower store with the same data (optional
+                            with --config)
+    [OPTIONAL] --seed:    Seed for the random sample of followers of the big
+                            media accounts. Runs with the same seed and the
+                            same input files write identical outputs.
+    [OPTIONAL] --workers: Number of worker processes used to parse follower
+                            csv files and to link small media accounts to
+                            followers (default 1). The outputs do not 
+                            depend on it.
+    [OPTIONAL] --format:  'text' (default) writes the indices, pointers, 
+                            values, rownames and colnames text files; 
+                            'binary' writes a compressed .npz and a gzipped
+                            Matrix Market file, both with the row and column
+                            names; 'both' writes all of them. See 
+                            plnews/matrix.py
+    [OPTIONAL] --full:    Rebuild the matrix from scratch. By default, if a
+                            previous run with the same --output, --country 
+                            and --run left a manifest (see 
+                            plnews/manifest.py), only the accounts whose 
+                            followers changed since are read again and the
+                            rest of the previous matrix is reused.
+    [OPTIONAL] --stats:   A file to append the time, data handled (rows 
+                            read, edges added) and peak memory of each stage
+                            of the run to, one json line per stage (see 
+                            plnews/stages.py)
+    [OPTIONAL] --profile: A directory where to save a cProfile of each stage
+    [OPTIONAL] --tmpdir:  Where to spill the followers of small media while
+                            counting how many of them each follower follows
+                            (see plnews/degree.py), and those of the 
+                            accounts in the matrix, read from csv files, to
+                            a follower store (default: the system temporary
+                            directory)
+    [OPTIONAL] --config:  A json file with a batch of runs that vary the
+                            parameters below. The follower files are read
+                            once for all the runs, which link the accounts
+                            from what was kept of them; --run, 
+                            --country, --media, --pol and --seed give the 
+                            defaults of the runs. Runs in a batch are 
+                            always full rebuilds.
+
+Batch config: a json object with "runs", a list of runs, and/or "grid", a
+dict from parameter names to lists of values, which adds one run for every
+combination of them. A run can set its "run" label, "country", "media",
+"pol", "seed" and any of "thres", "min_followers", "min_degree" and
+"sample_size" (see CONSTANTS); runs without a label are named after --run
+(or 'batch') and the parameters they set, e.g. '3-thres20000-min_degree5'.
+Runs with the same media and politician followers share the counts of
+followers and the degree counts of the same small media. For example:
+
+    {"grid": {"thres": [20000, 30000, 50000], "min_degree": [5, 10]},
+     "runs": [{"run": "3-big-sample", "sample_size": 1000}]}
+
 Author/s: 
  - Andreu Casas | github.com/CasAndreu | a.casassalleras@vunl
  - Bernhard Clemm | github.com/bernhardclemm | b.f.d.clemm@uva.nl
@@ -17,251 +77,777 @@ Author/s:
 #==============================================================================    
 # MODULES -- DEPENDENCIES
 #==============================================================================
-print('Loading packages')
-import os
-import pandas as pd
-import networkx as nx
-from networkx.algorithms import bipartite
 import argparse
-import re
-from datetime import datetime
-import numpy as np
-import random
+import itertools
+import json
+import os
+import shutil
+import tempfile
+from plnews.stages import StageLog
+# - numpy, pandas, scipy and the plnews modules that use them are imported
+#   by the functions that need them, so that --help starts quickly
+
+#==============================================================================    
+# CONSTANTS
+#==============================================================================
+# - accounts with this many followers or fewer are left out of the graph
+MIN_FOLLOWERS = 250
+# - subjective number of followers separating "small" from "big" media
+THRES = 30000
+# - followers of small media need to follow more than this many of them
+MIN_DEGREE = 10
+# - number of new followers sampled for each big media account
+SAMPLE_SIZE = 300
+# - the parameters a batch config can vary, and the other settings of a run
+PARAM_KEYS = ['thres', 'min_followers', 'min_degree', 'sample_size', 'seed']
+RUN_KEYS = ['run', 'country', 'media', 'pol']
 
 #==============================================================================    
 # COMMAND LINE ARGUMENTS
 #==============================================================================
-parser = argparse.ArgumentParser()
-parser.add_argument('--output', 
-                    help='a path to an output file',
-                    required = True)
-parser.add_argument('--run', 
-                    help='a csv with user ids for which to get followers',
-                    required = True)
-parser.add_argument('--country', 
-                    help='a csv with user ids for which to get followers',
-                    required = True)
-parser.add_argument('--media', 
-                    help='a csv with user ids for which to get followers',
-                    required = True)
-parser.add_argument('--pol', 
-                    help='a csv with user ids for which to get followers',
-                    required = True)
-args = parser.parse_args()
-output_path = args.output
-run_number = args.run
-run_number = str(run_number)
-country = args.country
-media_path = args.media
-pol_path = args.pol
+def parse_args(argv = None, prog = None):
+	"""
+	Returns the arguments in 'argv' (default: the command line), with 'prog'
+	as the name of the command in the usage (default: the script)
+	"""
+	parser = argparse.ArgumentParser(prog = prog)
+	parser.add_argument('--output', 
+	                    help='a path to an output file',
+	                    required = True)
+	parser.add_argument('--run', 
+	                    help='a label for this run, used in the output file names',
+	                    required = False)
+	parser.add_argument('--country', 
+	                    help='a country prefix, used in the output file names',
+	                    required = False)
+	parser.add_argument('--media', 
+	                    help='the followers of the media accounts (a directory or a store)',
+	                    required = False)
+	parser.add_argument('--pol', 
+	                    help='the followers of the politicians (a directory or a store)',
+	                    required = False)
+	parser.add_argument('--seed', 
+	                    help='a seed for sampling followers of big media accounts',
+	                    type = int,
+	                    required = False)
+	parser.add_argument('--workers', 
+	                    help='number of worker processes (default 1)',
+	                    type = int,
+	                    default = 1)
+	parser.add_argument('--format', 
+	                    help='the output format: text, binary or both',
+	                    choices = ['text', 'binary', 'both'],
+	                    default = 'text')
+	parser.add_argument('--full', 
+	                    help='rebuild the matrix from scratch',
+	                    action = 'store_true')
+	parser.add_argument('--stats', 
+	                    help='a file to append the stats of each stage to',
+	                    required = False)
+	parser.add_argument('--profile', 
+	                    help='a directory where to save a profile of each stage',
+	                    required = False)
+	parser.add_argument('--tmpdir', 
+	                    help='where to spill followers while counting degrees',
+	                    required = False)
+	parser.add_argument('--config', 
+	                    help='a json file with a batch of runs to build',
+	                    required = False)
+	args = parser.parse_args(argv)
+	if args.config is None:
+		for name in ['run', 'country', 'media', 'pol']:
+			if getattr(args, name) is None:
+				parser.error('--{} is required without --config'.format(name))
+	return(args)
 
 #==============================================================================    
 # MAIN
 #==============================================================================
-print('\nChecking for which accounts we need to build the network graph')
-print(str(datetime.now()).split('.')[0])
-# - a list of the follower files for the media accounts
-media_list = ['{}{}'.format(media_path, x) for x in os.listdir(media_path)]
-
-# - create a dataframe with the numbers of followers of each domain
-media_df = pd.DataFrame()
-counter = 0
-for f in media_list:
-	counter += 1
-	if (counter % 10 == 0):
-		print('\t {}/{}'.format(counter, len(media_list)))
-	new_df = pd.read_csv(f)
-	outlet = re.sub('.csv', '', f.split('/')[-1])
-	new_row = pd.DataFrame({'outlet':outlet, 'fname':f, 'n':len(new_df)},
-		index = [0])
-	media_df = pd.concat((media_df, new_row))
-
-# - only move forward with those domains that have at least 250 followers
-media_df02 = media_df[media_df['n'] > 250]
-media_df02 = media_df02.sort_values('n')
-
-# - distinguish between "small" and "big" media accounts, based on a 
-#   subjective number of follower threshold
-thres = 30000
-small_media = list(media_df02[media_df02['n'] < thres]['outlet'])
-big_media = list(media_df02[media_df02['n'] >= thres]['outlet'])
-
-# - create a network graph with the followers of small media
-Gsmall = nx.Graph()
-counter = 0
-total = len(small_media)
-for account in small_media:
-	f = media_df02[media_df02['outlet'] == account]['fname'].iloc[0]
-	# - add this account as a node in the network graph. Note that we use the 
-	#	'bipartite' argument to keep track that this is a media/politician 
-	#	account and NOT a follower. So, "bipartite = 0". We'll use 
-	#   "bipartite = 1" for followers
-	Gsmall.add_nodes_from([account], bipartite=0)
-	# - update counter and report progress
-	counter += 1
-	print('{}/{}: {}'.format(counter, total, account))
-	print(str(datetime.now()).split('.')[0])
-	# - read in the followers of this account
-	df = pd.read_csv(f, dtype = str)
-	print('\t {} followers'.format(len(df)))
-	# - if the account has at least 1 follower, proceed
-	if len(df) > 0:
-		# - create a list of users and add them as new graph nodes
-		followers = set(df['follower_id'])
-		Gsmall.add_nodes_from(followers, bipartite = 1)
-		# - create a list of tuples reflecting the edges between these 
-		#   followers and the account they follow. 
-		tuple_list = [(follower, account) for follower in followers]
-		Gsmall.add_edges_from(tuple_list)
-		print('\t {} overall users so far...'.format(Gsmall.number_of_nodes()))
-
-# - now pull the users who at leat follow 10 of the small media accounts
-small_intensefollowers = [z for z in Gsmall.nodes if (Gsmall.degree[z] > 10) and
-						  (z not in small_media)]
-
-# - initialize a new (final) network graph with the data from these intense
-#   followers of small accounts
-G = nx.Graph()
-# - add edges for the small media accounts we have already explored
-G.add_nodes_from(small_media, bipartite = 0)
-# - add edges for the intense followers of small accounts
-G.add_nodes_from(small_intensefollowers, bipartite = 1)
-node_count = G.number_of_nodes()
-# - rebuild the edges between these
-for follower in small_intensefollowers:
-	follower_edges = [(v,c) for c,v in  Gsmall.edges(follower)]
-	G.add_edges_from(follower_edges)
-
-# - now proceed with adding followers (and edges) for the big accounts
-counter = 0
-total = len(big_media)
-newsample = []
-for account in big_media:
-	f = media_df02[media_df02['outlet'] == account]['fname'].iloc[0]
-	# - add this account as a node in the network graph. Note that we use the 
-	#	'bipartite' argument to keep track that this is a media/politician 
-	#	account and NOT a follower. So, "bipartite = 0". We'll use 
-	#   "bipartite = 1" for followers
-	G.add_nodes_from([account], bipartite = 0)
-	# - update counter and report progress
-	counter += 1
-	print('{}/{}: {}'.format(counter, total, account))
-	print(str(datetime.now()).split('.')[0])
-	# - read in the followers of this account
-	df = pd.read_csv(f, dtype = str)
-	print('\t {} followers'.format(len(df)))
-	# - first check if the 'intense' followers follow also this account
-	#   and if so, add the additional edges to the graph
-	if len(df) > 0:
-		followers = set(df['follower_id'])
-		current_nodes = set(G.nodes)
-		intersect = followers & current_nodes
-		diffset = followers - current_nodes
-		add_edges = [(follower, account) for follower in intersect]
-		G.add_edges_from(add_edges)
-		# - finally, sample an additional 300 followers that are not yet
-		#   yet in the graph and add them to it
-		addfollowers_sample = random.sample(diffset, 300)
-		G.add_nodes_from(addfollowers_sample, bipartite = 1)
-		print('\t number of nodes: {}'.format(G.number_of_nodes()))
-		print('\t number of edges: {}'.format(G.number_of_edges()))
-		newsample.extend(addfollowers_sample)
-
-# - iterate through the big accounts again and this time build the edges
-#   for all the newly sampled users
-newsample = set(newsample)
-counter = 0
-total = len(big_media)
-for account in big_media:
-	f = media_df02[media_df02['outlet'] == account]['fname'].iloc[0]
-	# - update counter and report progress
-	counter += 1
-	print('{}/{}: {}'.format(counter, total, account))
-	print(str(datetime.now()).split('.')[0])
-	# - read in the followers of this account
-	df = pd.read_csv(f, dtype = str)
-	print('\t {} followers'.format(len(df)))
-	if len(df) > 0:
-		followers = set(df['follower_id'])
-		newsample_found = followers & newsample
-		tuple_list = [(follower, account) for follower in newsample_found]		
-		G.add_edges_from(tuple_list)
-		print('\t number of nodes: {}'.format(G.number_of_nodes()))
-		print('\t number of edges: {}'.format(G.number_of_edges()))
-		del(df)
-
-# - delete graph with info only about small outlets; not needed anymore 
-#   plus it take up memory space
-del(Gsmall)
-
-# - to make the network graph a bit more dense, as well as to add more 
-#   politically meaningful/relevant information. Adding members of Congress
-#   as additional top-level accounts, and adding edges between followers and
-#   these members of Congress; in contrast to code for US, delete politicians 
-#   with very few followers, otherwise graph is not connected
-
-pol_list = ['{}{}'.format(pol_path, x) for x in os.listdir(pol_path)]
-counter = 0
-total = len(pol_list)
-for f in pol_list:
-	# - read in the followers of this account
-	df = pd.read_csv(f, dtype = str)
-	print('\t {} followers'.format(len(df)))
-	# - only proceed if account has more than 25 followers:
-	if len(df) > 250:
-	# -  pull the name of the politician account
-		account = re.sub('.csv', '', f.split('/')[-1])
-		# - add this additional top-level node to the graph
-		G.add_nodes_from([account], bipartite = 0)
-		# - first check if the followers follow also this account
-		#   and if so, add the additional edges to the graph
-		followers = set(df['follower_id'])
-		current_nodes = set(G.nodes)
-		intersect = followers & current_nodes
-		diffset = followers - current_nodes
-		add_edges = [(follower, account) for follower in intersect]
-		G.add_edges_from(add_edges)
-		print('\t number of nodes: {}'.format(G.number_of_nodes()))
-		print('\t number of edges: {}'.format(G.number_of_edges()))
-		del(df)
-	# - report progress
-	counter += 1
-	print('{}/{}: {}'.format(counter, total, account))
-	print(str(datetime.now()).split('.')[0])	
-
-
-print('\nPulling bipartite matrix from network graph')
-print(str(datetime.now()).split('.')[0])
-# - pull now the final list of unique followers and unique media/politician 
-#   account in the network graph
-follower_nodes, account_nodes = bipartite.sets(G)
-
-# - create adjacency matrix from network graph. Make sure that in the first
-#   rows and columns we have the followers, and in the last rows and columns
-#   the information about the accounts. This way we can easily pull a
-#   bipartitie rectangular matrix where each row is a follower and each column
-#   is a media/politician account
-rowcolnames = list(follower_nodes) + list(account_nodes)
-sq_mat = nx.adjacency_matrix(G, rowcolnames)
-rect_mat = sq_mat[:len(follower_nodes),len(follower_nodes):]
-
-print('\nOutput bipartite sparse matrix')
-print(str(datetime.now()).split('.')[0])
-# - save the data about this sparse matrix in a way that can be read later in R
-np.savetxt('{}{}-indices-{}.txt'.format(output_path, country, run_number), rect_mat.indices, fmt='%.0f')
-np.savetxt('{}{}-pointers-{}.txt'.format(output_path, country, run_number), rect_mat.indptr, fmt='%.0f')
-np.savetxt('{}{}-values-{}.txt'.format(output_path, country, run_number), rect_mat.data, fmt='%.0f')
-
-with open('{}{}-rownames-{}.txt'.format(output_path, country, run_number), 'w') as f:
-    for item in list(follower_nodes):
-        f.write("%s\n" % item)
-
-with open('{}{}-colnames-{}.txt'.format(output_path, country, run_number), 'w') as f:
-    for item in list(account_nodes):
-        f.write("%s\n" % item)
+def main(args):
+	from plnews.manifest import read_manifest
+	from plnews.matrix import matrix_file
+	from plnews.store import open_followers
+	output_path = args.output
+	run_number = None if args.run is None else str(args.run)
+	country = args.country
+	stages = StageLog(args.stats, args.profile, 
+					  info = {'country': country, 'run': run_number or 'batch'})
+	if args.config is not None:
+		defaults = {'run': run_number, 'country': country, 
+					'media': args.media, 'pol': args.pol, 'seed': args.seed}
+		build_batch(read_config(args.config, defaults), output_path, stages, 
+					args.format, args.workers, args.tmpdir, args.stats, 
+					args.profile)
+		return
+
+	# - the followers of the media and politician accounts, either in csv 
+	#   files or in a binary follower store
+	media_source = open_followers(args.media)
+	pol_source = open_followers(args.pol)
+
+	# - unless asked for a full rebuild, try to update the matrix of the 
+	#   previous run with the same name, if only big media or politician 
+	#   accounts changed since
+	manifest_name = matrix_file(output_path, country, run_number, 'manifest',
+								'json')
+	params = build_params(args.seed)
+	result = None
+	if not args.full:
+		manifest = read_manifest(manifest_name)
+		if manifest is None:
+			print('\t no manifest from a previous run: full rebuild')
+		elif manifest['params'] != params:
+			print('\t parameters changed since the previous run: full rebuild')
+		else:
+			result = update_matrix(media_source, pol_source, manifest, stages,
+								   output_path, country, run_number)
+	if result is None:
+		result = build_full(media_source, pol_source, params, stages, 
+							args.workers, args.tmpdir)
+	write_outputs(result, output_path, country, run_number, args.format, 
+				  stages)
+	print('\nRead {:.1f} MB of follower data'.format(
+		(media_source.bytes_read + pol_source.bytes_read) / 1e6))
+	stages.close()
+
+
+def build_batch(runs, output_path, stages, output_format = 'text', 
+				workers = 1, tmp_path = None, stats = None, profile = None):
+	"""
+	Builds the matrix of each of the 'runs' of a batch config (see 
+	'read_config'). The follower files of each pair of media and politician
+	sources are read once for all the runs that use them, to count the
+	followers of every account and the degrees of the followers of small
+	media and to keep those of the accounts to link in a follower store 
+	(see 'ingest_followers'), from which each run then links them. Prints
+	the time each run took.
+
+	'output_path' = (string) Where to write the matrices
+	'stages' = (StageLog)   Where to time the reading of the followers
+	'stats', 'profile' = (string) A file to append the stats of each stage
+							of each run to and a directory where to save 
+							their profiles (see plnews/stages.py)
+	"""
+	import pandas as pd
+	from plnews.store import open_followers
+	summary = []
+	sources = []
+	for run in runs:
+		if (run['media'], run['pol']) not in sources:
+			sources.append((run['media'], run['pol']))
+	for media, pol in sources:
+		group = [x for x in runs if (x['media'], x['pol']) == (media, pol)]
+		media_source = open_followers(media)
+		pol_source = open_followers(pol)
+		# - count the followers of the small media of every run at once
+		print('\nReading the followers in {} and {} for {} runs'.format(
+			media, pol, len(group)))
+		with stages.stage('read') as stage:
+			data = ingest_followers(media_source, pol_source, 
+									[x['params'] for x in group], workers,
+									tmp_path)
+			stage.add('accounts', len(data.counts))
+			stage.add('rows_read', sum(data.counts.values()))
+		try:
+			for run in group:
+				print('\nRun {} ({})'.format(run['run'], ', '.join(
+					'{} {}'.format(k, run['params'][k]) for k in PARAM_KEYS)))
+				log = StageLog(stats, 
+							   os.path.join(profile, run['run'])
+							   if profile else None,
+							   info = {'country': run['country'], 
+									   'run': run['run']})
+				result = build_variant(data, run['params'], log)
+				write_outputs(result, output_path, run['country'], run['run'],
+							  output_format, log)
+				log.close()
+				row = dict(run['params'], country = run['country'], 
+						   run = run['run'])
+				row.update({'rows': result[0].shape[0], 
+							'cols': result[0].shape[1],
+							'edges': result[0].nnz, 
+							'secs': log.records[-1]['wall_time']})
+				summary.append(row)
+				del(result)
+		finally:
+			data.close()
+		print('\nRead {:.1f} MB of follower data'.format(
+			(media_source.bytes_read + pol_source.bytes_read) / 1e6))
+	stages.close()
+	print('\nTime per run (the follower data took {:.2f} secs to read)'.format(
+		sum(x['wall_time'] for x in stages.records if x['stage'] == 'read')))
+	summary = pd.DataFrame(summary, columns = ['country', 'run'] + PARAM_KEYS + 
+						   ['rows', 'cols', 'edges', 'secs'])
+	print(summary.to_string(index = False))
+
+
+def build_full(media_source, pol_source, params, log, workers = 1, 
+			   tmp_path = None):
+	"""
+	Builds the matrix from scratch with the parameters 'params' (see 
+	'build_params'), timing each stage in 'log' (a StageLog), with 
+	'workers' processes to parse follower csv files and spilling the 
+	followers of small media under 'tmp_path'. Returns the matrix, the row
+	and column names and the manifest of this run.
+	"""
+	# - read every follower file once, keeping the number of followers of 
+	#   each account and spilling the followers of small media to disk, to 
+	#   count how many of them each follower follows, and those of the 
+	#   accounts to link to a follower store
+	print('\nReading the followers of all media and politician accounts')
+	with log.stage('read') as stage:
+		data = ingest_followers(media_source, pol_source, [params], workers,
+								tmp_path)
+		stage.add('accounts', len(data.counts))
+		stage.add('rows_read', sum(data.counts.values()))
+	try:
+		return(build_variant(data, params, log))
+	finally:
+		data.close()
+
+
+def build_variant(data, params, log):
+	"""
+	Builds the matrix of one run from what 'ingest_followers' kept ('data',
+	a FollowerData object, left unchanged so that several runs can share 
+	it), taking the followers of the accounts it links from its memory-
+	mapped stores, one account at a time. Returns the same as 'build_full'.
+
+	'params' = (dict)   The parameters of the run (see 'build_params')
+	'log' = (StageLog)  Where to time the stages of the run
+	"""
+	import numpy as np
+	from plnews.handles import HandleRegistry
+	from plnews.manifest import new_manifest
+	from plnews.matrix import (RowIndex, link_followers, 
+							   sample_new_followers)
+	# - only move forward with those domains that have at least 250 
+	#   followers, and distinguish between "small" and "big" media accounts,
+	#   based on a subjective number of follower threshold
+	small_media, big_media = split_media(data.media, data.counts, params)
+
+	# - the followers of small media that follow more than 10 of them,
+	#   counted one partition of the spilled followers at a time
+	intense = find_intense(data, params, log)
+
+	# - instead of a network graph, we keep the bipartite matrix as a list of
+	#   edges between rows (followers) and columns (media/politician accounts).
+	#   Follower ids get consecutive row numbers in the order in which they 
+	#   enter the matrix, and so do account names in the columns. Edges are
+	#   kept as arrays of row numbers, one array per column.
+	rows = RowIndex()
+	cols = HandleRegistry()
+	edge_rows = []
+	edge_cols = []
+
+	print('\nBuilding bipartite sparse matrix')
+	# - now pull the users who at leat follow 10 of the small media accounts
+	#   and add them as the first rows of the matrix, in the order in which
+	#   they first appear among the followers of the small media
+	#   (only the intense followers of each account are kept, which are its
+	#   edges in the matrix)
+	with log.stage('intense-followers') as stage:
+		found = []
+		for account, followers in data.read(small_media):
+			found.append(followers[np.isin(followers, intense, 
+										   assume_unique = True)])
+			stage.add('rows_scanned', len(followers))
+			del(followers)
+		if len(found) > 0:
+			rows.add(np.concatenate(found))
+		del(intense)
+		stage.add('rows_added', len(rows))
+	print('\t {} intense followers of small media'.format(len(rows)))
+
+	# - add the small media accounts as the first columns, and the edges 
+	#   between them and their intense followers
+	with log.stage('small-media') as stage:
+		for account in small_media:
+			cols.add(account)
+		add_edges(small_media, link_followers(rows, found, data.workers), 
+				  cols, edge_rows, edge_cols)
+		del(found)
+		stage.add('edges_added', sum(len(x) for x in edge_rows))
+
+	# - now proceed with the big accounts: sample an additional 300 followers
+	#   of each of them that are not yet in the matrix, with a reservoir 
+	#   sample over their followers (see plnews/matrix.py)
+	with log.stage('sampling') as stage:
+		rng = np.random.default_rng(params['seed'])
+		samples = {}
+		for account, followers in data.read(big_media):
+			cols.add(account)
+			samples[account] = sample_new_followers(
+				rows, followers, params['sample_size'], rng)
+			rows.add(samples[account])
+			stage.add('rows_scanned', len(followers))
+			stage.add('rows_added', len(samples[account]))
+			del(followers)
+	print('\t {} rows after sampling followers of big media'.format(len(rows)))
+
+	# - to make the network graph a bit more dense, as well as to add more 
+	#   politically meaningful/relevant information. Adding members of 
+	#   Congress as additional columns, and adding edges between followers and
+	#   these members of Congress; in contrast to code for US, delete 
+	#   politicians with very few followers, otherwise graph is not connected
+	pols = [x for x in data.pols if data.counts[x] > params['min_followers']]
+	for account in pols:
+		cols.add(account)
+
+	# - build the edges between the big accounts and the politicians and all
+	#   the followers in the matrix, including the newly sampled ones, one
+	#   account at a time
+	with log.stage('linking') as stage:
+		n_edges = sum(len(x) for x in edge_rows)
+		for account, followers in data.read(big_media + pols):
+			add_edges([account], link_followers(rows, [followers]), cols, 
+					  edge_rows, edge_cols)
+			stage.add('rows_scanned', len(followers))
+			del(followers)
+		stage.add('edges_added', sum(len(x) for x in edge_rows) - n_edges)
+	print('\t {} edges'.format(sum(len(x) for x in edge_rows)))
+
+	# - each row is a follower and each column is a media/politician account
+	with log.stage('matrix') as stage:
+		rect_mat = build_matrix(edge_rows, edge_cols, len(rows), len(cols))
+		stage.add('edges', rect_mat.nnz)
+
+	# - keep track of what this matrix was built from
+	manifest = new_manifest(params)
+	for group, names in (('media', data.media), ('pols', data.pols)):
+		for account in names:
+			n = data.counts[account]
+			entry = {'kind': account_kind(group, n, params), 'n': n, 
+					 'stat': data.stats[account], 
+					 'digest': data.digests[account]}
+			if account in samples:
+				entry['sample'] = samples[account].tolist()
+			manifest[group][account] = entry
+	return(rect_mat, rows.ids.tolist(), cols.names, manifest)
+
+
+def update_matrix(media_source, pol_source, manifest, log, output_path, 
+				  country, run_number):
+	"""
+	Updates the matrix of the previous run, described by 'manifest' (the 
+	run 'run_number' of 'country' in 'output_path'), reading only the 
+	follower files that changed since. Returns the same as 'build_full', or
+	None if the changes require a full rebuild.
+
+	Politicians can be added, removed or changed, and the followers of big
+	media accounts can change as long as they stay big. Their columns are 
+	linked again to the rows of the previous matrix. The rows themselves are
+	kept, including the followers sampled for big media in the previous run
+	(use --full to draw a new sample). Any change to the small media 
+	accounts, which determine the intense followers, or to which media 
+	accounts are small or big, means a full rebuild.
+	"""
+	import numpy as np
+	from plnews.handles import HandleRegistry
+	from plnews.manifest import follower_digest, new_manifest
+	from plnews.matrix import RowIndex, link_followers, read_matrix
+	print('\nChecking which accounts changed since the previous run')
+	with log.stage('check') as stage:
+		media = unique_accounts(media_source)
+		pols = unique_accounts(pol_source)
+		if set(media) != set(manifest['media']):
+			print('\t media accounts added or removed: full rebuild')
+			return(None)
+		try:
+			prev_mat, rownames, colnames = read_matrix(output_path, country, 
+													   run_number)
+		except (IOError, OSError, ValueError):
+			print('\t cannot read the previous matrix: full rebuild')
+			return(None)
+		if list(prev_mat.shape) != manifest['shape']:
+			print('\t previous matrix does not match its manifest: '
+				  'full rebuild')
+			return(None)
+
+		# - compare each account with the manifest: first cheaply, by file 
+		#   size and time (or position in the store), then by reading its 
+		#   followers. The followers of a changed account are linked to the 
+		#   rows of the previous matrix as soon as they are read.
+		rows = RowIndex()
+		rows.add(np.array(rownames, dtype = np.uint64))
+		new = new_manifest(manifest['params'])
+		changed = {}
+		for group, source, names in (('media', media_source, media), 
+									 ('pols', pol_source, pols)):
+			for account in names:
+				entry = manifest[group].get(account)
+				stat = source.stat(account)
+				if entry is not None and entry['stat'] == stat:
+					new[group][account] = entry
+					continue
+				n, followers = source.read(account)
+				stage.add('rows_read', n)
+				digest = follower_digest(followers)
+				if (entry is not None and entry['n'] == n and 
+						entry['digest'] == digest):
+					new[group][account] = dict(entry, stat = stat)
+					continue
+				kind = account_kind(group, n, manifest['params'])
+				if group == 'media' and (kind != 'big' or 
+										 entry['kind'] != 'big'):
+					print('\t {} ({} media, now {}) changed: full rebuild'
+						  .format(account, entry['kind'], kind))
+					return(None)
+				print('\t {} changed: {} followers'.format(account, n))
+				new[group][account] = {'kind': kind, 'n': n, 'stat': stat, 
+									   'digest': digest}
+				if entry is not None and 'sample' in entry:
+					new[group][account]['sample'] = entry['sample']
+				if kind != 'skip':
+					changed[account] = link_followers(rows, [followers])[0]
+				del(followers)
+
+	# - the columns in the order of a full build: small media, big media 
+	#   (both by number of followers) and politicians
+	counts = dict((x, new['media'][x]['n']) for x in media)
+	small_media, big_media = split_media(media, counts, manifest['params'])
+	new_pols = [x for x in pols if new['pols'][x]['kind'] == 'pol']
+	new_colnames = small_media + big_media + new_pols
+	prev_cols = HandleRegistry(colnames)
+	if any(x not in prev_cols for x in new_colnames if x not in changed):
+		print('\t previous matrix does not match its manifest: full rebuild')
+		return(None)
+	print('\t {} accounts changed'.format(len(changed)))
+
+	# - the edges of the changed accounts to the rows of the previous matrix,
+	#   and those of all the others reused
+	cols = HandleRegistry()
+	for account in new_colnames:
+		cols.add(account)
+	edge_rows = []
+	edge_cols = []
+	with log.stage('linking') as stage:
+		add_edges(list(changed), list(changed.values()), cols, edge_rows, 
+				  edge_cols)
+		stage.add('edges_added', sum(len(x) for x in edge_rows))
+		prev_mat = prev_mat.tocsc()
+		for account in new_colnames:
+			if account not in changed:
+				j = prev_cols.get(account)
+				edge_rows.append(prev_mat.indices[prev_mat.indptr[j]:
+												  prev_mat.indptr[j + 1]])
+				edge_cols.append(np.full(len(edge_rows[-1]), 
+										 cols.get(account), dtype = np.int64))
+	with log.stage('matrix') as stage:
+		rect_mat = build_matrix(edge_rows, edge_cols, len(rows), len(cols))
+		stage.add('edges', rect_mat.nnz)
+	return(rect_mat, rownames, cols.names, new)
+
+
+#==============================================================================    
+# FUNCTIONS
+#==============================================================================
+def build_params(seed, **changes):
+	"""
+	Returns the parameters of a run, as recorded in the manifest: the 
+	'seed' of the command line and the constants above, with any 'changes'
+	(e.g. thres = 20000)
+	"""
+	params = {'seed': seed, 'sampler': 'reservoir', 
+			  'min_followers': MIN_FOLLOWERS, 'thres': THRES,
+			  'min_degree': MIN_DEGREE, 'sample_size': SAMPLE_SIZE}
+	params.update(changes)
+	return(params)
+
+
+def read_config(fname, defaults):
+	"""
+	Returns the runs of a batch config file (see the top of this script), 
+	each a dict with its 'run' label, 'country', 'media' and 'pol' 
+	followers and its build 'params'. 'defaults' (dict) has the 'run', 
+	'country', 'media', 'pol' and 'seed' given on the command line, which 
+	may be None.
+	"""
+	with open(fname) as f:
+		config = json.load(f)
+	entries = [dict(x) for x in config.get('runs', [])]
+	grid = config.get('grid', {})
+	if len(grid) > 0:
+		for values in itertools.product(*grid.values()):
+			entries.append(dict(zip(grid.keys(), values)))
+	runs = []
+	for entry in entries:
+		unknown = [x for x in entry if x not in PARAM_KEYS + RUN_KEYS]
+		if len(unknown) > 0:
+			raise ValueError('unknown settings in {}: {}'.format(
+				fname, ', '.join(unknown)))
+		changes = dict((x, entry[x]) for x in PARAM_KEYS if x in entry)
+		label = entry.get('run')
+		if label is None:
+			label = '-'.join([defaults['run'] or 'batch'] + 
+							 ['{}{}'.format(x, y) for x, y in changes.items()])
+		run = {'run': str(label), 
+			   'country': entry.get('country', defaults['country']),
+			   'media': entry.get('media', defaults['media']),
+			   'pol': entry.get('pol', defaults['pol']),
+			   'params': build_params(defaults['seed'], **changes)}
+		for x in ['country', 'media', 'pol']:
+			if run[x] is None:
+				raise ValueError('no {} for run {} in {}: set it in the '
+								 'config or with --{}'.format(
+									 x, run['run'], fname, x))
+		runs.append(run)
+	if len(runs) == 0:
+		raise ValueError('no runs in {}'.format(fname))
+	names = [(x['country'], x['run']) for x in runs]
+	repeated = sorted(set(x for x in names if names.count(x) > 1))
+	if len(repeated) > 0:
+		raise ValueError('runs with the same name in {}: {}'.format(
+			fname, ', '.join('{}-{}'.format(*x) for x in repeated)))
+	return(runs)
+
+
+def account_kind(group, n, params):
+	"""
+	Returns the role of an account with 'n' followers in the matrix built
+	with 'params': 'skip' (too few followers), 'small' or 'big' for media 
+	('group' = 'media'), and 'pol' for politicians ('group' = 'pols')
+	"""
+	if n <= params['min_followers']:
+		return('skip')
+	if group == 'pols':
+		return('pol')
+	return('small' if n < params['thres'] else 'big')
+
+
+def unique_accounts(source):
+	"""
+	Returns the accounts of a follower source, sorted, each once whatever 
+	its case (see plnews/handles.py). Of several files of the same account,
+	the first in sort order is read.
+	"""
+	from plnews.handles import HandleRegistry
+	accounts = HandleRegistry()
+	for account in sorted(source.accounts):
+		if account in accounts:
+			print('\t {} is the same account as {}: skipped'.format(
+				account, accounts.name(account)))
+		accounts.add(account)
+	return(accounts.names)
+
+
+def split_media(media, counts, params):
+	"""
+	Returns the lists of small and big media accounts with more than 
+	'min_followers' followers, each sorted by number of followers ('counts')
+	"""
+	import pandas as pd
+	media_df = pd.DataFrame({'outlet':media, 'n':[counts[x] for x in media]})
+	media_df02 = media_df[media_df['n'] > params['min_followers']]
+	media_df02 = media_df02.sort_values('n', kind = 'mergesort')
+	small_media = list(media_df02[media_df02['n'] < params['thres']]['outlet'])
+	big_media = list(media_df02[media_df02['n'] >= params['thres']]['outlet'])
+	return(small_media, big_media)
+
+
+class FollowerData(object):
+	"""
+	What the builder keeps from reading all follower files once: no follower
+	ids in memory. The followers of the accounts that the runs link are in 
+	memory-mapped follower stores ('read'): their source itself if it is a
+	FollowerStore, or else a store they were spilled to as their csv files 
+	were parsed, so that no csv is parsed twice.
+
+	'media', 'pols' = (list)  Names of the media and politician accounts
+	'counts' = (dict)         Number of followers of each account
+	'stats', 'digests' = (dict) Fingerprints of the followers of each 
+							  account, for the manifest
+	'sources' = (dict)        The follower store of each account kept
+	'degrees' = (dict)        DegreeCounters of the followers of the small 
+							  media, by the 'small_band' of the runs 
+							  (see 'find_intense')
+	'path' = (string)         The temporary directory of the spilled stores
+	"""
+	def __init__(self):
+		self.media = []
+		self.pols = []
+		self.counts = {}
+		self.stats = {}
+		self.digests = {}
+		self.sources = {}
+		self.degrees = {}
+		self.path = None
+		self.workers = 1
+
+	def read(self, accounts):
+		"""
+		Yields each of the 'accounts' and its sorted unique follower ids 
+		(uint64, a view into its follower store), one account at a time
+		"""
+		for account in accounts:
+			yield((account, self.sources[account].followers(account)))
+
+	def close(self):
+		"""Removes the spilled followers"""
+		for degree in self.degrees.values():
+			degree.close()
+		self.sources = {}
+		if self.path is not None and os.path.exists(self.path):
+			shutil.rmtree(self.path)
+
+
+def small_band(params):
+	"""
+	Returns the numbers of followers, (min_followers, thres), between which
+	a media account is a small one in a run with 'params'
+	"""
+	return((params['min_followers'], params['thres']))
+
+
+def ingest_followers(media_source, pol_source, runs_params, workers = 1,
+					 tmp_path = None):
+	"""
+	Reads the followers of every media and politician account once and 
+	returns what the builder keeps of them, a FollowerData object. The 
+	followers of the accounts that are small media in any of the runs with 
+	'runs_params' (list of dicts) are spilled, as they are read, to a 
+	DegreeCounter for each set of small media. Those of the accounts with 
+	more than 'min_followers' in any run are spilled to a follower store,
+	if their source is a directory of csv files.
+
+	'media_source', 'pol_source' = (FollowerDir or FollowerStore)  See 
+								   plnews/store.py
+	'workers' = (int)         Processes to parse follower csv files with
+	'tmp_path' = (string)     Where to spill the followers (default: the 
+							  system temporary directory)
+	"""
+	from plnews.degree import DegreeCounter
+	from plnews.store import (FollowerStore, append_followers, 
+							  create_store)
+	data = FollowerData()
+	data.workers = workers
+	data.media = unique_accounts(media_source)
+	data.pols = unique_accounts(pol_source)
+	bands = sorted(set(small_band(x) for x in runs_params))
+	min_followers = min(x['min_followers'] for x in runs_params)
+	try:
+		for band in bands:
+			data.degrees[band] = DegreeCounter(tmp_path)
+		data.path = tempfile.mkdtemp(prefix = 'followers-', dir = tmp_path)
+		for group, source, names in (('media', media_source, data.media), 
+									 ('pols', pol_source, data.pols)):
+			accounts = _ingest_accounts(data, source, names, 
+										bands if group == 'media' else [])
+			if isinstance(source, FollowerStore):
+				for _ in accounts:
+					pass
+				for account in names:
+					data.sources[account] = source
+				continue
+			# - the store is written as the csv files are parsed, and mapped
+			#   once they all are
+			fname = os.path.join(data.path, group)
+			create_store(fname)
+			append_followers(fname, (x for x in accounts 
+									 if x[2] > min_followers))
+			store = FollowerStore(fname)
+			for account in store.accounts:
+				data.sources[account] = store
+	except BaseException:
+		data.close()
+		raise
+	return(data)
+
+
+def _ingest_accounts(data, source, names, bands):
+	"""
+	Yields (account, follower ids, number of followers) for each of the 
+	accounts 'names' of 'source', as they are read, after recording their 
+	counts and fingerprints in 'data' (a FollowerData) and spilling their
+	followers to the DegreeCounters of the 'bands' they are small media in
+	"""
+	from plnews.manifest import follower_digest
+	from plnews.store import read_accounts
+	total = len(data.media) + len(data.pols)
+	for account, n, followers in read_accounts(source, names, data.workers):
+		print('{}/{}: {}'.format(len(data.counts) + 1, total, account))
+		print('\t {} followers'.format(n))
+		data.counts[account] = n
+		data.stats[account] = source.stat(account)
+		data.digests[account] = follower_digest(followers)
+		for low, high in bands:
+			if low < n < high:
+				data.degrees[(low, high)].add(followers)
+		yield((account, followers, n))
+
+
+def find_intense(data, params, log):
+	"""
+	Returns the sorted ids of the followers of more than 'min_degree' of the
+	small media accounts, from the DegreeCounter (see plnews/degree.py) to 
+	which 'ingest_followers' spilled their followers, which the runs with 
+	the same small media and another 'min_degree' share
+	"""
+	with log.stage('degree') as stage:
+		degree = data.degrees[small_band(params)]
+		intense = degree.frequent(params['min_degree'])
+		stage.add('rows_counted', degree.rows)
+	print('\t {} follows of small media'.format(degree.rows))
+	return(intense)
+
+
+def write_outputs(result, output_path, out_country, run, output_format, 
+				  log):
+	"""
+	Writes the matrix, its row and column names and its manifest (a 
+	'result' of 'build_full') for the run 'run' of 'out_country' in 
+	'output_path', in the 'output_format' of --format
+	"""
+	from plnews.manifest import write_manifest
+	from plnews.matrix import matrix_file, write_matrix
+	rect_mat, rownames, colnames, manifest = result
+	print('\t {} x {} matrix, {} edges'.format(
+		rect_mat.shape[0], rect_mat.shape[1], rect_mat.nnz))
+
+	print('\nOutput bipartite sparse matrix')
+	with log.stage('export') as stage:
+		write_matrix(output_path, out_country, run, rect_mat, rownames,
+					 colnames, output_format)
+		manifest['shape'] = list(rect_mat.shape)
+		write_manifest(matrix_file(output_path, out_country, run, 'manifest',
+								   'json'), manifest)
+
 
+def add_edges(accounts, found, cols, edge_rows, edge_cols):
+	"""
+	Appends an edge between each of the 'accounts' and each of the rows of 
+	its followers in the matrix (see 'link_followers' in plnews/matrix.py).
 
+	'accounts' = (list)            Names of accounts that are columns
+	'found' = (list)               The rows (int64) of each account
+	'cols' = (HandleRegistry)      The accounts in the matrix
+	'edge_rows', 'edge_cols' = (list) Arrays of row and column numbers, one
+								   pair of arrays per account
+	"""
+	import numpy as np
+	for account, account_rows in zip(accounts, found):
+		edge_rows.append(account_rows)
+		edge_cols.append(np.full(len(account_rows), cols.get(account), 
+								 dtype = np.int64))
 
 
+def build_matrix(edge_rows, edge_cols, nrows, ncols):
+	"""
+	Returns a binary sparse matrix (CSR, with sorted column indices in each
+	row) from lists of arrays of row and column indices. Repeated edges 
+	count once.
+	"""
+	import numpy as np
+	from scipy import sparse
+	edge_rows = np.concatenate(edge_rows + [np.empty(0, dtype = np.int64)])
+	edge_cols = np.concatenate(edge_cols + [np.empty(0, dtype = np.int64)])
+	values = np.ones(len(edge_rows), dtype = np.int64)
+	mat = sparse.csr_matrix((values, (edge_rows, edge_cols)),
+							shape = (nrows, ncols))
+	mat.sum_duplicates()
+	mat.data[:] = 1
+	return(mat)
 
 
+if __name__ == "__main__":
+	main(parse_args())
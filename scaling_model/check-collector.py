@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+check-collector.py
+Purpose: check that get-twitter-followers.py collects every follower of
+         every account when the API fails, by running it against the mock
+         API (plnews/mock_twitter.py) with a share of failed requests, and
+         comparing what it saved with the followers served.
+
+A few accounts of --followers are served, one of them protected, and the
+collector is asked for them (with '@' and in another case, as in the lists
+of accounts) and for an account that does not exist. With few --retries,
+some collections give up half-way and must be resumed: the collector is
+run again, as many as --runs times, while any collection is left
+unfinished (a checkpoint in the output directory). Then:
+- every account must have a csv with exactly the followers served, in
+  order; the protected one an empty csv
+- the account that does not exist must have no csv
+- no part files or checkpoints may be left
+Exits with status 1 if any of these fails.
+
+Parameters:
+    [OPTIONAL] --followers:   A directory of follower csvs to serve (default:
+                                data/PL-media-followers/)
+    [OPTIONAL] --accounts:    Number of accounts to serve, half of them the
+                                largest (default 6)
+    [OPTIONAL] --fail-rate:   Share of requests failing (default 0.2)
+    [OPTIONAL] --fail-status: HTTP status of the failures: 503 for code 130
+                                in json, others with an HTML page (default
+                                502)
+    [OPTIONAL] --retries:     Server errors in a row after which the
+                                collector leaves a user to resume (default
+                                2)
+    [OPTIONAL] --runs:        Maximum runs of the collector (default 10)
+    [OPTIONAL] --workdir:     Where to write the keys and the collected
+                                followers (default: a temporary directory,
+                                removed at the end)
+
+Example:
+python check-collector.py --fail-rate 0.3 --fail-status 500
+"""
+
+#==============================================================================
+# MODULES -- DEPENDENCIES
+#==============================================================================
+import argparse
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import pandas as pd
+from plnews.checkpoint import (CHECKPOINT_EXT, PART_EXT, completed_users,
+                               partial_users)
+from plnews.handles import file_registry
+from plnews.mock_twitter import MockTwitter, start_server
+
+#==============================================================================
+# CONSTANTS
+#==============================================================================
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+COLLECTOR = os.path.join(SCRIPT_PATH, 'get-twitter-followers.py')
+MISSING_ACCOUNT = 'no_such_account_pl'
+KEYS = ['key0', 'key1']
+
+#==============================================================================
+# COMMAND LINE ARGUMENTS
+#==============================================================================
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--followers',
+                        help='a directory of follower csvs to serve',
+                        default = 'data/PL-media-followers/')
+    parser.add_argument('--accounts',
+                        help='number of accounts to serve',
+                        type = int,
+                        default = 6)
+    parser.add_argument('--fail-rate',
+                        help='share of requests failing',
+                        type = float,
+                        default = 0.2)
+    parser.add_argument('--fail-status',
+                        help='HTTP status of the failures',
+                        type = int,
+                        default = 502)
+    parser.add_argument('--retries',
+                        help='server errors in a row before a user is left',
+                        type = int,
+                        default = 2)
+    parser.add_argument('--runs',
+                        help='maximum runs of the collector',
+                        type = int,
+                        default = 10)
+    parser.add_argument('--workdir',
+                        help='where to write the keys and the followers',
+                        required = False)
+    return(parser.parse_args(argv))
+
+#==============================================================================
+# MAIN
+#==============================================================================
+def main(args):
+    followers = pick_accounts(args.followers, args.accounts)
+    protected = min(followers, key = lambda x: len(followers[x]))
+    workdir = args.workdir if args.workdir else tempfile.mkdtemp()
+    try:
+        errors = run_check(args, followers, protected, workdir)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors = True)
+    if errors:
+        print('FAILED:')
+        for x in errors:
+            print('\t {}'.format(x))
+        sys.exit(1)
+    print('OK: all {} accounts collected completely'.format(len(followers)))
+
+
+#==============================================================================
+# FUNCTIONS
+#==============================================================================
+def pick_accounts(path, n):
+    """
+    Returns the followers of 'n' accounts of the directory 'path', half of
+    them the largest (several pages each) and half the smallest
+    """
+    fnames = sorted([x for x in os.listdir(path) if x.endswith('.csv')],
+                    key = lambda x: os.path.getsize(os.path.join(path, x)))
+    picked = fnames[-(n - n // 2):] + fnames[:n // 2]
+    followers = {}
+    for fname in picked:
+        df = pd.read_csv(os.path.join(path, fname), dtype = str)
+        followers[fname[:-len('.csv')]] = df['follower_id'].tolist()
+    return(followers)
+
+
+def run_check(args, followers, protected, workdir):
+    """
+    Serves 'followers', runs the collector (with the settings of 'args')
+    until nothing is left to resume and returns the list of problems found
+    (empty if none)
+    """
+    keypath = os.path.join(workdir, 'keys', '')
+    output = os.path.join(workdir, 'followers', '')
+    for path in [keypath, output]:
+        if not os.path.exists(path):
+            os.makedirs(path)
+    for name in KEYS:
+        with open(keypath + name, 'wb') as f:
+            pickle.dump({'consumer_key': name, 'consumer_secret': 'secret',
+                         'access_token': 'token',
+                         'access_token_secret': 'secret'}, f)
+    accounts = ['@' + x.upper() if i % 2 else x
+                for i, x in enumerate(sorted(followers))]
+    input_file = os.path.join(workdir, 'accounts.csv')
+    pd.DataFrame({'twitter': accounts + [MISSING_ACCOUNT]}).to_csv(
+        input_file, index = False)
+
+    api = MockTwitter(followers, limit = 50, window = 1.0,
+                      protected = [protected], fail_rate = args.fail_rate,
+                      seed = 1, fail_status = args.fail_status)
+    server, url = start_server(api)
+    try:
+        for run in range(args.runs):
+            subprocess.check_call([
+                sys.executable, COLLECTOR, '--input', input_file,
+                '--output', output, '--keypath', keypath, '--keys'] + KEYS +
+                ['--colname', 'twitter', '--api-url', url, '--backoff',
+                 '0.05', '--retries', str(args.retries)],
+                cwd = SCRIPT_PATH, stdout = subprocess.DEVNULL)
+            unfinished = partial_users(output)
+            print('Run {} of the collector: {} users left to resume'.format(
+                run + 1, len(unfinished)))
+            if len(unfinished) == 0:
+                break
+    finally:
+        server.shutdown()
+    print('{} requests to the mock API'.format(api.requests))
+    return(compare(followers, protected, output))
+
+
+def compare(followers, protected, output):
+    """Returns the differences between the followers served and saved"""
+    errors = []
+    # - the csvs are named after the handles as written in the input
+    saved_files = file_registry(completed_users(output))
+    for user, ids in sorted(followers.items()):
+        fname = saved_files.file(user)
+        if fname is None:
+            errors.append('{}: no csv'.format(user))
+            continue
+        saved = pd.read_csv(os.path.join(output, fname),
+                            dtype = str)['follower_id'].tolist()
+        expected = [] if user == protected else ids
+        if saved != expected:
+            errors.append('{}: {} followers saved, {} served'.format(
+                user, len(saved), len(expected)))
+    if MISSING_ACCOUNT in saved_files:
+        errors.append('{}: csv for an account that does not exist'.format(
+            MISSING_ACCOUNT))
+    left = [x for x in os.listdir(output)
+            if x.endswith(PART_EXT) or x.endswith(CHECKPOINT_EXT)]
+    if left:
+        errors.append('unfinished files left: {}'.format(', '.join(left)))
+    return(errors)
+
+
+if __name__ == "__main__":
+    main(parse_args())
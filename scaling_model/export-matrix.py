@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+export-matrix.py
+Purpose: convert a bipartite matrix written by the matrix builder as text 
+		 files (indices, pointers, values, rownames, colnames) into the 
+		 compact binary format: a compressed .npz file with the row and 
+		 column names, and a gzipped Matrix Market file for R with the 
+		 names in its comment lines (see plnews/matrix.py).
+
+Parameters: 
+    [REQUIRED] --input:   The directory with the text files of the matrix
+    [REQUIRED] --run:     The run label in the file names
+    [REQUIRED] --country: The country prefix in the file names
+    [OPTIONAL] --output:  The directory where to write the binary files 
+                            (default: --input)
+
+Example:
+python export-matrix.py \
+    --input data/PL-graph/ \
+    --run 3 \
+    --country PL
+"""
+
+#==============================================================================    
+# MODULES -- DEPENDENCIES
+#==============================================================================
+import argparse
+import os
+from plnews.matrix import (load_matrix, matrix_file, read_mtx, read_text,
+                           write_binary)
+
+#==============================================================================    
+# COMMAND LINE ARGUMENTS
+#==============================================================================
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--input', 
+                        help='the directory with the text files of the matrix',
+                        required = True)
+    parser.add_argument('--run', 
+                        help='the run label in the file names',
+                        required = True)
+    parser.add_argument('--country', 
+                        help='the country prefix in the file names',
+                        required = True)
+    parser.add_argument('--output', 
+                        help='the directory where to write the binary files',
+                        required = False)
+    return(parser.parse_args(argv))
+
+#==============================================================================    
+# MAIN
+#==============================================================================
+def main(args):
+    input_path = args.input
+    run_number = str(args.run)
+    country = args.country
+    output_path = args.output if args.output else input_path
+    mat, rownames, colnames = read_text(input_path, country, run_number)
+    print('{} x {} matrix, {} edges'.format(mat.shape[0], mat.shape[1], 
+                                            mat.nnz))
+    write_binary(output_path, country, run_number, mat, rownames, colnames)
+    # - check that the binary copies read back as the same matrix
+    fname = matrix_file(output_path, country, run_number, 'graph', 'npz')
+    mtx_fname = matrix_file(output_path, country, run_number, 'graph',
+                            'mtx.gz')
+    for reader, x in [(load_matrix, fname), (read_mtx, mtx_fname)]:
+        mat2, rownames2, colnames2 = reader(x)
+        if (mat2 != mat).nnz > 0 or rownames2 != rownames or \
+                colnames2 != colnames:
+            raise ValueError('{} does not match the text files'.format(x))
+    text_size = sum(os.path.getsize(matrix_file(input_path, country, 
+                                                run_number, x))
+                    for x in ['indices', 'pointers', 'values', 'rownames',
+                              'colnames'])
+    print('text files: {:.1f} MB, npz: {:.1f} MB'.format(
+        text_size / 1e6, os.path.getsize(fname) / 1e6))
+
+
+if __name__ == "__main__":
+    main(parse_args())
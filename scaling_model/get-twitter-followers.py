@@ -8,11 +8,34 @@ Parameters:
     [REQUIRED] --input:       A csv with user ids for which to get their list 
                                 of followers
     [REQUIRED] --output:      An output directory where to write out the list 
-                                of followers       
+                                of followers. The followers of a user are 
+                                written page by page as they come in, with a
+                                checkpoint to resume from if the script stops
+                                half-way (see plnews/checkpoint.py)
     [REQUIRED] --keypath:     The path where the keys are located
     [REQUIRED] --colname:     The name of the column containing Twitter handles
     [OPTIONAL] --summarypath: The path where to save a file summarizing the 
                                 info pulled for all users
+    [OPTIONAL] --store:       A follower store (see pack-follower-store.py) 
+                                to append the followers to, instead of 
+                                writing one csv per user to --output
+    [OPTIONAL] --workers:     Number of processes used to count the followers
+                                already collected in --output (default 1)
+    [OPTIONAL] --threads:     Number of users whose followers are collected at
+                                the same time (default 4). All threads share
+                                the keys (see plnews/twitter.py)
+    [OPTIONAL] --keys:        Names of the key files in --keypath to use 
+                                (default: the KEYS constant below)
+    [OPTIONAL] --api-url:     Base url of the API, e.g. of a local mock server
+                                (see plnews/mock_twitter.py)
+    [OPTIONAL] --metricspath: The path where to save, for each key, the 
+                                requests sent, the errors, and the time spent
+                                waiting for it
+    [OPTIONAL] --backoff:     Seconds to wait after a server error (5xx, or 
+                                an answer that is not json; default 5)
+    [OPTIONAL] --retries:     Server errors in a row after which the
+                                collection of a user is left to resume in 
+                                the next run (default 10)
                               
 Author/s: 
  - Andreu Casas | github.com/CasAndreu | a.casassalleras@vunl
@@ -30,14 +53,18 @@ python 01-get-twitter-followers.py \
 # MODULES -- DEPENDENCIES
 #==============================================================================
 import pandas as pd
-import tweepy
 import argparse
-import pickle
-import random
-import time
 import os
-import re
-import ast
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from plnews.checkpoint import (PartialFollowers, completed_users, 
+                               partial_users)
+from plnews.handles import HandleRegistry, file_registry
+from plnews.store import (FollowerStore, append_followers, 
+                          count_csv_rows_parallel, read_follower_csv)
+from plnews.twitter import (API_URL, SERVER_BACKOFF, SERVER_RETRIES,
+                            KeyScheduler, TwitterError, get_user,
+                            iter_follower_pages, load_clients)
 
 #==============================================================================    
 # CONSTANTS
@@ -49,143 +76,160 @@ import ast
 #==============================================================================    
 # PARSING COMMAND LINE ARGUMENTS
 #==============================================================================
-parser = argparse.ArgumentParser()
-parser.add_argument('--output', 
-                    help='a path where to output the list of followers',
-                    required = True)
-parser.add_argument('--input', 
-                    help='a csv with user ids for which to get followers',
-                    required = True)
-parser.add_argument('--keypath', 
-                    help='The path where the keys are located',
-                    required = True)
-parser.add_argument('--colname', 
-                    help='Name of variable containing twitter handles',
-                    required = True)
-parser.add_argument('--summarypath', 
-                    help='The path where to save a summary file',
-                    required = False)
-args = parser.parse_args()
-input_file = args.input
-#input_file = '/Users/andreu/Desktop/repos/vu_dutch_election2021/data/elite-handles-twitter-ALL.csv'
-output_path = args.output
-#output_path = '/Users/andreu/Desktop/vu_dutch_election2021_DATA/elite_followers/'
-keys_path = args.keypath
-#keys_path = '/Users/andreu/keys/'
-sumpath = args.summarypath
-#sumpath = '/Users/andreu/Desktop/vu_dutch_election2021_DATA/summary-get-followers-elites01.csv'
-tw_colname = args.colname
-#tw_colname = 'twitter'
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--output', 
+                        help='a path where to output the list of followers',
+                        required = True)
+    parser.add_argument('--input', 
+                        help='a csv with user ids for which to get followers',
+                        required = True)
+    parser.add_argument('--keypath', 
+                        help='The path where the keys are located',
+                        required = True)
+    parser.add_argument('--colname', 
+                        help='Name of variable containing twitter handles',
+                        required = True)
+    parser.add_argument('--summarypath', 
+                        help='The path where to save a summary file',
+                        required = False)
+    parser.add_argument('--store', 
+                        help='A follower store to append the followers to',
+                        required = False)
+    parser.add_argument('--workers', 
+                        help='Number of processes to count collected followers',
+                        type = int,
+                        default = 1)
+    parser.add_argument('--threads', 
+                        help='Number of users to collect at the same time',
+                        type = int,
+                        default = 4)
+    parser.add_argument('--keys', 
+                        help='Names of the key files to use (default: KEYS)',
+                        nargs = '+',
+                        required = False)
+    parser.add_argument('--api-url', 
+                        help='Base url of the Twitter API',
+                        default = API_URL)
+    parser.add_argument('--metricspath', 
+                        help='The path where to save the metrics of each key',
+                        required = False)
+    parser.add_argument('--backoff', 
+                        help='Seconds to wait after a server error',
+                        type = float,
+                        default = SERVER_BACKOFF)
+    parser.add_argument('--retries', 
+                        help='Server errors in a row before a user is left',
+                        type = int,
+                        default = SERVER_RETRIES)
+    return(parser.parse_args(argv))
 
 #==============================================================================    
 # MAIN
 #==============================================================================
-def main():
+def main(args):
+    input_file = args.input
+    #input_file = '/Users/andreu/Desktop/repos/vu_dutch_election2021/data/elite-handles-twitter-ALL.csv'
+    output_path = args.output
+    #output_path = '/Users/andreu/Desktop/vu_dutch_election2021_DATA/elite_followers/'
+    keys_path = args.keypath
+    #keys_path = '/Users/andreu/keys/'
+    sumpath = args.summarypath
+    #sumpath = '/Users/andreu/Desktop/vu_dutch_election2021_DATA/summary-get-followers-elites01.csv'
+    tw_colname = args.colname
+    #tw_colname = 'twitter'
+    store_path = args.store
+    workers = args.workers
+    threads = args.threads
+    api_url = args.api_url
+    # - appending to the follower store is not thread-safe
+    store_lock = threading.Lock()
+
     print('Loading data')
     # - read the input file (csv)
     db = pd.read_csv(input_file)
     
-    # - count the number of twitter keys to use
-    max_keys = len(KEYS)
-    print('Using {} keys.'.format(max_keys))
+    # - load every key once, with one client per key shared by all threads
+    key_names = args.keys if args.keys else KEYS
+    print('Using {} keys.'.format(len(key_names)))
+    clients = load_clients(keys_path, key_names, api_url)
+    scheduler = KeyScheduler(clients, backoff = args.backoff,
+                             retries = args.retries)
     
-    # - connect to twitter API
-    key_name = random.choice(KEYS)
-    api = connect_to_twitter_api(keys_path, key_name)
-    
-    # - create unique list of users
-    users = list(set(list(db[tw_colname].dropna())))
-    users = [re.sub('@', '', x) for x in users]
+    # - create unique list of users, each once whatever its case or '@'
+    users = HandleRegistry(db[tw_colname].dropna()).names
     users_n = len(users)
     print('{} users. Pulling followers and saving the output in: {}.'.format(
             users_n, output_path))
     
-    # - initializing a data object summarizing info for all users
-    sumdb = []
-    
-    # - a list of the users for which we have already downloaded their followers
-    #   and so for which we have already a csv in the data output directory
-    users_done = os.listdir(output_path)
-    if len(users_done) > 0:
-        users_done_lower = [x.split('.')[0].lower() for x in users_done]
+    # - the users for which we have already downloaded their followers, and 
+    #   so for which we have already a csv in the data output directory (or 
+    #   an account in the follower store), by handle. Users whose collection
+    #   was interrupted only have a partial file and are resumed below
+    if store_path and os.path.exists(store_path):
+        store = FollowerStore(store_path)
+        users_done = HandleRegistry()
+        for account in store.accounts:
+            users_done.add(account, account)
     else:
-        users_done_lower = users_done
+        store = None
+        users_done = file_registry([] if store_path else 
+                                   completed_users(output_path))
+    users_partial = HandleRegistry(partial_users(output_path))
+    
+    # - count the followers already collected for the users in the input
+    #   file, without parsing the csv files and in parallel if more than one
+    #   worker
+    done_counts = {}
+    if store is None and len(users_done) > 0:
+        done_files = [users_done.file(x) for x in users if x in users_done]
+        counts = count_csv_rows_parallel(
+            ['{}{}'.format(output_path, x) for x in done_files], workers)
+        done_counts = dict(zip(done_files, counts))
     
-    # - iterate through users, pull followers, and save output
-    user_counter = 0
+    # - summary info for the users already collected, and a list of the
+    #   users still to collect
+    user_sums = {}
+    users_todo = []
     for user in users:
-        user_counter += 1
-        print('\t user {}/{}: {}'.format(
-                user_counter, users_n, user))
-        # - initializing a data object with summary info for this user
-        user_sum = {}
-        user_sum['user'] = user
-        # - check if already downloaded this user's followers
-        outname = '{}{}.csv'.format(output_path, user)
-        already_done = user.lower() in users_done_lower
-        
-        if already_done:
-            print('\t\t already collected followers. Moving to next user.')
-            matched_user = [users_done[i] for i in range(0,len(users_done))
-                       if users_done_lower[i] == user.lower()][0]
-            prev_outname = '{}{}'.format(output_path, matched_user)
-            collected_df = pd.read_csv(prev_outname)
-            user_sum['followers_n'] = len(collected_df )
-            user_sum['exists'] = 1
-        else:                            
-            # - check first if screen_name exists
-            print('\t\t checking if user exists.')
-            verify_tries = 0
-            verify_done = False
-            while not verify_done:
-                key_name = random.choice(KEYS)
-                api = connect_to_twitter_api(keys_path, key_name)
-                verify_tries += 1
-                try:
-                    user_info = api.get_user(user)
-                    followers_count = user_info._json['followers_count']
-                    exists = True
-                    verify_done = True
-                    del(user_info)
-                    print('\t\t users DOES exist.')
-                except tweepy.TweepError as error:
-                    print(error)
-                    error = ast.literal_eval(str(error))
-                    # - check error is not just because key/Twitter not operative
-                    if error[0]['code'] in [88, 32, 89, 130, 503]:
-                        if verify_tries < max_keys:
-                            print('\t\t {}{}'.format(
-                                    'key/server issues. ',
-                                    'Sleeping 5 secs and connecting using another key'))
-                            time.sleep(5)
-                        else:
-                            print('\t\t {}{}'.format(
-                                    'have tried all keys already. ',
-                                    'Sleeping 60 secs and trying again.'))
-                            verify_tries = 0
-                    else:
-                        exists = False
-                        verify_done = True
-                        print('\t\t users DOES NOT exist. Moving to next user.')
-            user_sum['exists'] = int(exists)
-            
-            # - if the user exists, pull followers, and save output
-            if exists:            
-                user_followers = get_followers(user = user,
-                                             followers_count = followers_count,
-                                             keys_path = keys_path,
-                                             keys_list = KEYS)
-                # - transform all folloer ids to strings
-                if len(user_followers) > 0:
-                    user_followers = [str(x) for x in user_followers]
-                user_sum['followers_n'] = len(user_followers)
-                # - write out a csv with the followers of this user
-                out_db = pd.DataFrame({'follower_id':user_followers})            
-                out_db.to_csv(outname, index = False)
+        if user in users_done:
+            print('\t user {}: already collected followers.'.format(user))
+            matched_user = users_done.file(user)
+            user_sum = {'user': user, 'exists': 1}
+            if store is not None:
+                user_sum['followers_n'] = store.count(matched_user)
             else:
-                user_sum['followers_n'] = None
-        # - update summary info for all users
-        sumdb.append(user_sum)
+                user_sum['followers_n'] = done_counts[matched_user]
+            user_sums[user] = user_sum
+        else:
+            if user in users_partial:
+                print('\t user {}: resuming interrupted collection.'.format(
+                    user))
+            users_todo.append(user)
+    
+    # - pull the followers of the remaining users, several at a time, and
+    #   save the output. An interrupted collection is resumed under the 
+    #   handle its partial file was written with
+    print('Collecting the followers of {} users, {} at a time.'.format(
+        len(users_todo), threads))
+    pool = ThreadPoolExecutor(max_workers = threads)
+    futures = [pool.submit(collect_user, users_partial.name(user) or user,
+                           scheduler, i + 1, len(users_todo), output_path,
+                           store_path, store_lock)
+               for i, user in enumerate(users_todo)]
+    for user, future in zip(users_todo, futures):
+        user_sums[user] = future.result()
+    pool.shutdown()
+    sumdb = [user_sums[user] for user in users]
+    unfinished = partial_users(output_path)
+    if unfinished:
+        print('The collection of {} users was interrupted: {}. Run again '
+              'to resume it.'.format(len(unfinished), ', '.join(unfinished)))
+    
     # - if path to a summary file provided, outputing one
     if sumpath:
         if len(sumdb) == 1:
@@ -193,102 +237,88 @@ def main():
         else:
             sumdf = pd.DataFrame(sumdb)
         sumdf.to_csv(sumpath, index = False)
+    
+    # - report how the keys were used, and how much of the run was spent
+    #   waiting for them
+    metrics = pd.DataFrame(scheduler.metrics_table())
+    print('Key usage:')
+    print(metrics.to_string(index = False))
+    if args.metricspath:
+        metrics.to_csv(args.metricspath, index = False)
         
 
 #==============================================================================    
 # FUNCTIONS
 #==============================================================================
-def connect_to_twitter_api(keys_path, key_name):
+def collect_user(user, scheduler, user_counter, users_n, output_path,
+                 store_path = None, store_lock = None):
     """
-    This function connets to the Twitter API via tweepy and returns an API
-    object.
+    Pulls the followers of a user and saves them. Returns a dictionary with
+    summary info for this user.
     
-    'keys_path' = (string)  Path where your key is located
-    'key_name' = (string)   Name of the key object. Pickle file containing a
-                            dictionary with the following keys: 'ckey', 
-                            'csecret', 'atoken', and 'asecret'.
+    'user' = (string)             A Twitter 'screen_name'
+    'scheduler' = (KeyScheduler)  The keys shared by all threads
+    'output_path' = (string)      Where to write the followers
+    'store_path' = (string)       A follower store to append them to instead
+    'store_lock' = (Lock)         Held while appending to the store
     """
-    # - import pickle file with the key
-    key = pickle.load(open('%s%s'%(keys_path, key_name), 'rb'))
-    auth = tweepy.OAuthHandler(key['consumer_key'],key['consumer_secret'])
-    auth.set_access_token(key['access_token'],key['access_token_secret'])
-    api = tweepy.API(auth)
-    return(api)    
-    
-    
-def get_followers(user, followers_count, keys_path, keys_list):
+    print('\t user {}/{}: {}'.format(user_counter, users_n, user))
+    # - initializing a data object with summary info for this user
+    user_sum = {}
+    user_sum['user'] = user
+    # - pick up the pages written before an interruption, if any
+    partial = PartialFollowers(output_path, user)
+    if partial.resumed:
+        print('\t\t {}: resuming after {} pages ({} followers)'.format(
+            user, partial.pages, partial.followers_n))
+    try:
+        # - check first if screen_name exists
+        user_info = get_user(scheduler, user)
+        user_sum['exists'] = int(user_info is not None)
+        if user_info is None:
+            print('\t\t {} DOES NOT exist. Moving to next user.'.format(
+                user))
+            user_sum['followers_n'] = None
+            partial.discard()
+            return(user_sum)
+        followers_count = user_info['followers_count']
+        
+        # - if the user exists, pull followers page by page, writing every
+        #   page to disk as it comes in
+        for ids, cursor in iter_follower_pages(scheduler, user, 
+                                               partial.cursor):
+            partial.add_page(ids, cursor)
+            print('\t\t {} ... + {}'.format(user, len(ids)))
+    except TwitterError as error:
+        # - the pages written so far and the checkpoint stay, to resume 
+        #   from in the next run; the csv is only written once the last
+        #   page (or a definite error about the account) is in
+        print('\t\t {}: interrupted after {} followers ({}). Left to '
+              'resume.'.format(user, partial.followers_n, error))
+        user_sum['exists'] = None
+        user_sum['followers_n'] = None
+        return(user_sum)
+    print('\t\t {}: {}/{} followers'.format(user, partial.followers_n, 
+                                            followers_count))
+    user_sum['followers_n'] = partial.followers_n
+    save_followers(partial, store_path, store_lock)
+    return(user_sum)
+
+
+def save_followers(partial, store_path = None, store_lock = None):
     """
-    Returns a list of all followers by this user
-    
-    'user' = (string)       A Twitter 'screen_name'
-    'followers_count' = (int) Number of followers to collect for this user
-    'keys_path' = (string)  Path where your key is located
-    'key_name' = (string)   Name of the key object. Pickle file containing a
-                            dictionary with the following keys: 'ckey', 
-                            'csecret', 'atoken', and 'asecret'.
-    """    
-    # - initialize some necessary variables and data obects
-    max_keys = len(keys_list)
-    done = False        
-    followers_ids = []
-    page_num = 0
-    keys_used = 0
-    key_i = 0    
-    
-    while not done: 
-        # - try to pull the Followers' IDs, if Rate Limit Error, switch key.
-        try:
-            # - connect to the API
-            # - start always trying with the first key of the list
-            key_name = KEYS[key_i]
-            print(key_name)
-            api = connect_to_twitter_api(keys_path, key_name)
-            keys_used += 1
-            
-            # - if we are just starting to pull this user's followers, start
-            #   from frist 'page'
-            if page_num == 0:
-                cursor = tweepy.Cursor(api.followers_ids, id = user)
-            # - otherwise, start from the page in which you got the rate limit
-            else:
-                cursor = tweepy.Cursor(api.followers_ids, id = user, 
-                                       cursor = next_cursor)
-            # - iterate through the pages in this cursor and pull 5,000 
-            #   followers at a time
-            for page in cursor.pages():                
-                followers_ids.extend(page)
-                print('\t\t ... + {}: {}/{}'.format(len(page), len(followers_ids),
-                      followers_count))
-                # - keeping track of the "page", so we can re-start from there 
-                #  if needed (if time limit reached in the middle)
-                next_cursor = cursor.iterator.next_cursor
-                page_num += 1
-            done = True
-        except tweepy.TweepError as error:
-            print(error)
-            # 
-            if 'Not authorized' in str(error) or '401' in str(error):
-                # - this means this user is protected and we can't get its 
-                #   followers list
-                done = True
-            else:
-                error = ast.literal_eval(str(error))
-                # - if it's a Rate Limit error, switch keys and/or wait)
-                if error[0]['code'] in [88, 32, 89, 130, 503]:
-                    # - if still some keys to try, switch, otherwise sleep 60 secs
-                    if keys_used < max_keys:
-                        print('\t\t reached limit for key {}. Using next key'.format(
-                                key_name))
-                        key_i += 1
-                        #keys_used += 1
-                    else:
-                        print('\t\t all keys are exhausted. Sleeping for 60 secs.')
-                        time.sleep(60)
-                        key_i = 0
-                        keys_used = 0
-                else:
-                    done = True
-    return(followers_ids)
+    Turns the followers written so far for a user (PartialFollowers) into 
+    its final csv, or appends them to the follower store 'store_path'
+    """
+    if store_path:
+        user_followers = read_follower_csv(partial.part_fname)
+        with store_lock:
+            append_followers(store_path, [(partial.user, user_followers,
+                                           len(user_followers))])
+        partial.discard()
+    else:
+        partial.finish()
+
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(parse_args())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+pack-follower-store.py
+Purpose: pack a directory with one csv of followers per account (as written
+		 by get-twitter-followers.py) into a single binary follower store 
+		 that the matrix builder can memory-map instead of parsing csv files.
+
+Parameters: 
+    [REQUIRED] --input:  A directory with one csv of followers per account
+    [REQUIRED] --output: The path of the follower store to create
+
+Example:
+python pack-follower-store.py \
+    --input data/PL-media-followers/ \
+    --output data/PL-media-followers.bin
+"""
+
+#==============================================================================    
+# MODULES -- DEPENDENCIES
+#==============================================================================
+import argparse
+import os
+from datetime import datetime
+from plnews.store import FollowerStore, pack_directory
+
+#==============================================================================    
+# COMMAND LINE ARGUMENTS
+#==============================================================================
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--input', 
+                        help='a directory with one csv of followers per account',
+                        required = True)
+    parser.add_argument('--output', 
+                        help='the path of the follower store to create',
+                        required = True)
+    return(parser.parse_args(argv))
+
+#==============================================================================    
+# MAIN
+#==============================================================================
+def main(args):
+    input_path = args.input
+    output_file = args.output
+    print('Packing {} into {}'.format(input_path, output_file))
+    print(str(datetime.now()).split('.')[0])
+    n = pack_directory(input_path, output_file)
+    store = FollowerStore(output_file)
+    print('{} accounts, {} unique followers per account on average, {} MB'.format(
+        n, int(store.lengths.mean()) if n > 0 else 0,
+        round(os.path.getsize(output_file) / 1e6, 1)))
+    print(str(datetime.now()).split('.')[0])
+
+
+if __name__ == "__main__":
+    main(parse_args())
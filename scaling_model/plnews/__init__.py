@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+plnews
+Purpose: shared code for the scripts in 'scaling_model' that collect the
+		 Twitter followers of Polish news and politician accounts and build
+		 the bipartite follower matrix.
+"""
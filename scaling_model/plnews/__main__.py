@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""The 'plnews' command: 'python -m plnews --help' (see plnews/cli.py)"""
+
+import sys
+
+from plnews.cli import main
+
+if __name__ == "__main__":
+	sys.exit(main())
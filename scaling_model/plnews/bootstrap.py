@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+"""
+bootstrap.py
+Purpose: bootstrap intervals for the ideology of the media and politician
+		 accounts (the columns of a bipartite matrix), from resamples of
+		 its followers (the rows), without refitting the model in R.
+
+The model is the one in plnews/scoring.py, with the negative binomial
+likelihood of the dispersion 'omega' of each account:
+
+	mu_ij = exp(alpha_i + gamma_j - (theta_i - zeta_j)^2)
+
+or a Poisson likelihood if there is no dispersion, as when the users are
+scored with 'poisson' (see 'read_params').
+
+The users are first scored against the fitted account parameters
+('score_rows'). Each replicate then draws the rows with replacement and
+rescores every account: with the users fixed, the accounts are independent
+of each other, and the (zeta_j, gamma_j) of all of them take Fisher scoring
+steps together, as the users do in 'score_rows'. The intervals are the
+percentiles of the replicates, so they reflect which followers happen to be
+in the matrix, given where the users are.
+
+Under the Poisson likelihood, an account needs two kinds of sums over the
+resampled users: over its followers, which are sparse matrix-vector
+products with the CSC arrays of the matrix, and over all users, for the
+expected follows. The latter are taken over 'bins' groups of users with
+close ideologies (the weighted mean ideology of each group, weighted by
+exp(alpha_i)), so a step costs accounts x bins rather than accounts x
+users. The negative binomial is not linear in exp(alpha_i), so the groups
+are split further into 'alpha_bins' of close activities, and the followers
+of each account are counted by group (a sparse matrix product), at the
+weighted mean ideology and activity of the group.
+
+With more than one worker, the CSC arrays and the user scores are copied
+once into shared memory blocks that every worker process maps, and the
+replicates are split among the workers. Replicate r draws from its own
+random generator, seeded with (seed, r), so the results do not depend on
+the number of workers.
+"""
+
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from plnews.scoring import MAX_ETA, MAX_ITER, TOL
+
+REPLICATES = 200
+LEVEL = 0.9
+BINS = 1024
+ALPHA_BINS = 8
+# - only users with more than this many follows are resampled, as in the
+#   rows used to fit the model (PL-ideo-scaling-model.R)
+MIN_EDGES = 50
+# - weakly informative priors of the account parameters
+ACCOUNT_PRIOR = {'mu_zeta': 0.0, 'sigma_zeta': 2.0, 'mu_gamma': 0.0,
+				 'sigma_gamma': 10.0}
+
+
+#==============================================================================
+# SHARED MEMORY
+#==============================================================================
+class SharedArrays(object):
+	"""
+	Numpy arrays copied into shared memory blocks, which worker processes
+	map without copying them ('attach'). 'specs' describes the blocks and
+	is what the workers are given. Call 'close' to free the blocks.
+	"""
+	def __init__(self, arrays):
+		self.blocks = []
+		self.specs = {}
+		try:
+			for name, x in arrays.items():
+				x = np.ascontiguousarray(x)
+				block = SharedMemory(create = True, size = max(x.nbytes, 1))
+				self.blocks.append(block)
+				np.ndarray(x.shape, x.dtype, buffer = block.buf)[...] = x
+				self.specs[name] = (block.name, x.shape, x.dtype.str)
+		except Exception:
+			self.close()
+			raise
+
+	def close(self):
+		for block in self.blocks:
+			block.close()
+			block.unlink()
+		self.blocks = []
+
+
+def attach(specs):
+	"""
+	Returns the arrays described by the 'specs' of a SharedArrays, and the
+	blocks they live in (which have to be kept open while they are used)
+	"""
+	arrays = {}
+	blocks = []
+	for name, (block_name, shape, dtype) in specs.items():
+		block = SharedMemory(name = block_name)
+		blocks.append(block)
+		arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer = block.buf)
+	return(arrays, blocks)
+
+
+#==============================================================================
+# ESTIMATOR
+#==============================================================================
+class Users(object):
+	"""
+	The resampled rows of a matrix: a CSC matrix of them ('mat', users x
+	accounts) and their fitted 'theta' and 'alpha', with the group of close
+	ideologies ('bin') and of close activities ('alpha_bin') of each user
+	"""
+	def __init__(self, mat, theta, alpha, bins = BINS,
+				 alpha_bins = ALPHA_BINS):
+		self.mat = sparse.csc_matrix(mat, dtype = np.float64, copy = True)
+		# - a follow counts once, as in the workers (see 'from_arrays')
+		self.mat.data[:] = 1
+		self.theta = np.asarray(theta, dtype = np.float64)
+		self.alpha = np.asarray(alpha, dtype = np.float64)
+		edges = np.linspace(self.theta.min(), self.theta.max(), bins + 1)
+		self.bin = np.clip(np.searchsorted(edges, self.theta) - 1, 0,
+						   bins - 1).astype(np.int64)
+		edges = np.linspace(self.alpha.min(), self.alpha.max(),
+							alpha_bins + 1)
+		self.alpha_bin = np.clip(np.searchsorted(edges, self.alpha) - 1, 0,
+								 alpha_bins - 1).astype(np.int64)
+		self.bins = bins
+		self.alpha_bins = alpha_bins
+
+	def __len__(self):
+		return(len(self.theta))
+
+	def arrays(self):
+		"""The arrays that describe the users, to share with workers"""
+		return({'indptr': self.mat.indptr, 'indices': self.mat.indices,
+				'theta': self.theta, 'alpha': self.alpha, 'bin': self.bin,
+				'alpha_bin': self.alpha_bin,
+				'shape': np.array(self.mat.shape + (self.bins,
+													self.alpha_bins),
+								  dtype = np.int64)})
+
+	@classmethod
+	def from_arrays(cls, arrays):
+		"""Rebuilds the users from 'arrays', without copying them"""
+		users = cls.__new__(cls)
+		nrows, ncols, bins, alpha_bins = (int(x) for x in arrays['shape'])
+		data = np.ones(len(arrays['indices']), dtype = np.float64)
+		users.mat = sparse.csc_matrix((data, arrays['indices'],
+									   arrays['indptr']),
+									  shape = (nrows, ncols),
+									  copy = False)
+		users.theta = arrays['theta']
+		users.alpha = arrays['alpha']
+		users.bin = arrays['bin']
+		users.alpha_bin = arrays['alpha_bin']
+		users.bins = bins
+		users.alpha_bins = alpha_bins
+		return(users)
+
+
+def rescore_accounts(users, weights, prior = ACCOUNT_PRIOR, omega = None,
+					 max_iter = MAX_ITER, tol = TOL):
+	"""
+	Returns the MAP estimates of the zeta and gamma of every account (column
+	of 'users.mat') and its number of (weighted) followers, with each user
+	counted 'weights' times (e.g. how many times it was drawn). 'omega' is
+	the dispersion of each account, or None for a Poisson likelihood.
+	Accounts without followers get NaN.
+	"""
+	theta = users.theta
+	# - sums over the followers of each account: sparse products with the
+	#   CSC matrix
+	stats = users.mat.T.dot(np.column_stack((weights, weights * theta,
+											 weights * theta ** 2)))
+	c, t1, t2 = stats[:, 0], stats[:, 1], stats[:, 2]
+	followed = c > 0
+	zeta = np.full(len(c), np.nan)
+	gamma = np.full(len(c), np.nan)
+	if not followed.any():
+		return(zeta, gamma, c)
+	if omega is None:
+		# - the users grouped by ideology, for the expected follows
+		u = weights * np.exp(users.alpha)
+		uk = np.bincount(users.bin, weights = u, minlength = users.bins)
+		tk = np.bincount(users.bin, weights = u * theta,
+						 minlength = users.bins)
+		keep = uk > 0
+		uk, tk = uk[keep], tk[keep] / uk[keep]
+		model = _PoissonModel(c[followed], t1[followed], t2[followed], tk, uk)
+	else:
+		# - the users grouped by ideology and activity, and the followers of
+		#   each account in each group
+		group = users.bin * users.alpha_bins + users.alpha_bin
+		size = users.bins * users.alpha_bins
+		uk = np.bincount(group, weights = weights, minlength = size)
+		keep = uk > 0
+		tk = np.bincount(group, weights = weights * theta,
+						 minlength = size)[keep] / uk[keep]
+		ak = np.bincount(group, weights = weights * users.alpha,
+						 minlength = size)[keep] / uk[keep]
+		uk = uk[keep]
+		drawn = np.flatnonzero(weights > 0)
+		index = np.cumsum(keep) - 1
+		groups = sparse.csr_matrix((weights[drawn],
+									(drawn, index[group[drawn]])),
+								   shape = (len(users), len(uk)))
+		ck = users.mat[:, followed].T.dot(groups).toarray()
+		model = _NegBinModel(ck, tk, ak, uk, omega[followed])
+	z, g = _map_accounts(model, prior, max_iter, tol)
+	zeta[followed] = z
+	gamma[followed] = g
+	return(zeta, gamma, c)
+
+
+def _map_accounts(model, prior, max_iter, tol):
+	"""
+	Fisher scoring for the (zeta, gamma) of every account, with the
+	likelihood of 'model' (a _PoissonModel or a _NegBinModel)
+	"""
+	prec_z = 1.0 / prior['sigma_zeta'] ** 2
+	prec_g = 1.0 / prior['sigma_gamma'] ** 2
+	zeta, gamma = model.start()
+	idx = np.arange(len(zeta))
+	logpost = model.loglik(idx, zeta, gamma) - \
+		0.5 * _prior(zeta, gamma, prior)
+	active = np.ones(len(zeta), dtype = bool)
+	for it in range(max_iter):
+		idx = np.flatnonzero(active)
+		if len(idx) == 0:
+			break
+		z, g = zeta[idx], gamma[idx]
+		g_g, g_z, i_gg, i_gz, i_zz = model.score(idx, z, g)
+		g_g = g_g - prec_g * (g - prior['mu_gamma'])
+		g_z = g_z - prec_z * (z - prior['mu_zeta'])
+		i_gg = i_gg + prec_g
+		i_zz = i_zz + prec_z
+		det = i_gg * i_zz - i_gz ** 2
+		step_g = (i_zz * g_g - i_gz * g_z) / det
+		step_z = (i_gg * g_z - i_gz * g_g) / det
+		# - halve the steps of the accounts whose posterior gets worse
+		scale = np.ones(len(idx))
+		old = logpost[idx]
+		for _ in range(20):
+			nz, ng = z + scale * step_z, g + scale * step_g
+			new = model.loglik(idx, nz, ng) - 0.5 * _prior(nz, ng, prior)
+			worse = new < old - 1e-12
+			if not worse.any():
+				break
+			scale[worse] *= 0.5
+		better = ~worse
+		zeta[idx[better]] = z[better] + scale[better] * step_z[better]
+		gamma[idx[better]] = g[better] + scale[better] * step_g[better]
+		logpost[idx[better]] = new[better]
+		done = (np.abs(scale * step_z) < tol) & (np.abs(scale * step_g) < tol)
+		active[idx[done | worse]] = False
+	return(zeta, gamma)
+
+
+def _prior(zeta, gamma, prior):
+	"""Returns minus twice the log prior (up to a constant)"""
+	return(((zeta - prior['mu_zeta']) / prior['sigma_zeta']) ** 2 +
+		   ((gamma - prior['mu_gamma']) / prior['sigma_gamma']) ** 2)
+
+
+class _PoissonModel(object):
+	"""
+	The Poisson likelihood of the accounts, from the sums over their
+	followers ('c', 't1', 't2': of the weights, the weighted theta and
+	theta^2) and the groups of users ('tk', 'uk': ideology and total
+	weight times exp(alpha))
+	"""
+	def __init__(self, c, t1, t2, tk, uk):
+		self.c, self.t1, self.t2 = c, t1, t2
+		self.tk, self.uk = tk, uk
+
+	def start(self):
+		"""
+		The mean ideology of the followers, and the popularity that matches
+		their number
+		"""
+		zeta = self.t1 / self.c
+		gamma = np.log(self.c) - np.log(self.expected(zeta)[0])
+		return(zeta, gamma)
+
+	def expected(self, zeta):
+		"""
+		Returns, for each zeta, the sums over the groups of users of
+		uk * exp(-d^2), uk * d * exp(-d^2) and uk * d^2 * exp(-d^2), where
+		d = tk - zeta
+		"""
+		d = self.tk[None, :] - zeta[:, None]
+		k = self.uk[None, :] * np.exp(-d ** 2)
+		return(k.sum(axis = 1), (k * d).sum(axis = 1),
+			   (k * d ** 2).sum(axis = 1))
+
+	def score(self, idx, zeta, gamma):
+		"""
+		Returns the gradient of the log likelihood of the accounts 'idx'
+		(by gamma and zeta) and their Fisher information (gamma-gamma,
+		gamma-zeta and zeta-zeta)
+		"""
+		c, t1 = self.c[idx], self.t1[idx]
+		s0, s1, s2 = self.expected(zeta)
+		e = np.exp(np.minimum(gamma, MAX_ETA))
+		return(c - e * s0, 2.0 * (t1 - zeta * c) - 2.0 * e * s1, e * s0,
+			   2.0 * e * s1, 4.0 * e * s2)
+
+	def loglik(self, idx, zeta, gamma):
+		"""Returns the log likelihood (up to a constant) of the accounts"""
+		c, t1, t2 = self.c[idx], self.t1[idx], self.t2[idx]
+		s0 = self.expected(zeta)[0]
+		return(c * gamma - (t2 - 2.0 * zeta * t1 + zeta ** 2 * c) -
+			   np.exp(np.minimum(gamma, MAX_ETA)) * s0)
+
+
+class _NegBinModel(object):
+	"""
+	The negative binomial likelihood of the accounts, with the dispersion
+	'omega' of each account, from the (weighted) followers of each account
+	in each group of users ('ck': accounts x groups) and the groups
+	('tk', 'ak', 'uk': ideology, activity and total weight)
+	"""
+	def __init__(self, ck, tk, ak, uk, omega):
+		self.ck, self.tk, self.ak, self.uk = ck, tk, ak, uk
+		self.omega = omega
+
+	def start(self):
+		"""
+		The mean ideology of the followers, and the popularity that matches
+		their number (as under Poisson)
+		"""
+		c = self.ck.sum(axis = 1)
+		zeta = self.ck.dot(self.tk) / c
+		d = self.tk[None, :] - zeta[:, None]
+		s0 = (self.uk[None, :] * np.exp(self.ak[None, :] - d ** 2)).sum(
+			axis = 1)
+		return(zeta, np.log(c) - np.log(s0))
+
+	def terms(self, zeta, gamma):
+		"""The d = tk - zeta, mu and eta of the accounts in each group"""
+		d = self.tk[None, :] - zeta[:, None]
+		eta = self.ak[None, :] + gamma[:, None] - d ** 2
+		return(d, np.exp(np.minimum(eta, MAX_ETA)), eta)
+
+	def score(self, idx, zeta, gamma):
+		"""
+		Returns the gradient of the log likelihood of the accounts 'idx'
+		(by gamma and zeta) and their Fisher information (gamma-gamma,
+		gamma-zeta and zeta-zeta)
+		"""
+		ck, omega = self.ck[idx], self.omega[idx, None]
+		d, mu, _ = self.terms(zeta, gamma)
+		p = mu / (mu + omega)
+		r = ck - (ck + omega * self.uk[None, :]) * p
+		w = self.uk[None, :] * omega * p
+		return(r.sum(axis = 1), 2.0 * (r * d).sum(axis = 1), w.sum(axis = 1),
+			   2.0 * (w * d).sum(axis = 1), 4.0 * (w * d ** 2).sum(axis = 1))
+
+	def loglik(self, idx, zeta, gamma):
+		"""Returns the log likelihood (up to a constant) of the accounts"""
+		ck, omega = self.ck[idx], self.omega[idx, None]
+		d, mu, eta = self.terms(zeta, gamma)
+		return((ck * eta - (ck + omega * self.uk[None, :]) *
+				np.log(mu + omega)).sum(axis = 1))
+
+
+def account_omega(params, colnames):
+	"""
+	Returns the dispersion of each column of the matrix ('colnames') from
+	the AccountParams 'params', or None if they have none (a Poisson model,
+	see 'read_params'). Columns without fitted parameters get the 'omega'
+	hyperparameter, or else the median dispersion of the fitted accounts.
+	"""
+	if params.omega is None:
+		return(None)
+	positions, missing = params.align(colnames)
+	default = params.hyper['omega']
+	if default is None:
+		default = np.median(params.omega)
+	omega = np.full(len(colnames), default, dtype = np.float64)
+	keep = positions >= 0
+	omega[positions[keep]] = params.omega[keep]
+	return(omega)
+
+
+#==============================================================================
+# BOOTSTRAP
+#==============================================================================
+def bootstrap_accounts(users, replicates = REPLICATES, workers = 1,
+					   seed = None, prior = ACCOUNT_PRIOR, omega = None):
+	"""
+	Rescores the accounts on the users as they are and on 'replicates'
+	resamples of them. Returns the estimates (zeta, gamma and followers of
+	each account) and the zeta of each replicate (replicates x accounts).
+
+	'users' = (Users)    The rows of the matrix and their scores
+	'omega' = (array)    The dispersion of each account (see
+						 'account_omega'), or None for a Poisson model
+	'workers' = (int)    Number of worker processes. With more than one,
+						 the users are shared with them through shared
+						 memory and the replicates are split among them.
+	"""
+	seed = 0 if seed is None else seed
+	zeta, gamma, followers = rescore_accounts(users, np.ones(len(users)),
+											  prior, omega)
+	if workers <= 1:
+		draws = _replicates(users, range(replicates), seed, prior, omega)
+	else:
+		chunks = [list(range(i, replicates, workers))
+				  for i in range(workers)]
+		shared = SharedArrays(users.arrays())
+		try:
+			pool = Pool(workers, initializer = _init_worker,
+						initargs = (shared.specs,))
+			try:
+				found = pool.starmap(_worker_replicates,
+									 [(x, seed, prior, omega)
+									  for x in chunks])
+			finally:
+				pool.close()
+				pool.join()
+		finally:
+			shared.close()
+		draws = np.empty((replicates, len(zeta)))
+		for chunk, x in zip(chunks, found):
+			draws[chunk] = x
+	return(pd.DataFrame({'zeta': zeta, 'gamma': gamma,
+						 'followers': followers}), draws)
+
+
+def _replicates(users, replicates, seed, prior, omega):
+	"""Returns the zeta of the accounts in each of the 'replicates'"""
+	n = len(users)
+	draws = []
+	for r in replicates:
+		rng = np.random.default_rng([seed, r])
+		weights = np.bincount(rng.integers(0, n, n), minlength = n)
+		draws.append(rescore_accounts(users, weights.astype(np.float64),
+									  prior, omega)[0])
+	return(np.array(draws).reshape(-1, users.mat.shape[1]))
+
+
+_worker_users = None
+_worker_blocks = None
+
+
+def _init_worker(specs):
+	"""Maps the shared users in a worker process"""
+	global _worker_users, _worker_blocks
+	arrays, _worker_blocks = attach(specs)
+	_worker_users = Users.from_arrays(arrays)
+
+
+def _worker_replicates(replicates, seed, prior, omega):
+	return(_replicates(_worker_users, replicates, seed, prior, omega))
+
+
+def intervals(estimates, draws, level = LEVEL):
+	"""
+	Adds to 'estimates' (from 'bootstrap_accounts') the standard deviation
+	('zeta_sd') and the percentile interval ('zeta_lower', 'zeta_upper') of
+	the zeta of each account over the replicates, and the number of
+	replicates in which it had followers ('replicates')
+	"""
+	out = estimates.copy()
+	valid = ~np.isnan(draws)
+	out['replicates'] = valid.sum(axis = 0)
+	tails = [50.0 * (1 - level), 50.0 * (1 + level)]
+	with np.errstate(invalid = 'ignore'):
+		any_valid = valid.any(axis = 0)
+		bounds = np.full((2, draws.shape[1]), np.nan)
+		sd = np.full(draws.shape[1], np.nan)
+		if any_valid.any():
+			bounds[:, any_valid] = np.nanpercentile(draws[:, any_valid],
+													tails, axis = 0)
+			sd[any_valid] = np.nanstd(draws[:, any_valid], axis = 0,
+									  ddof = 1)
+	out['zeta_sd'] = sd
+	out['zeta_lower'] = bounds[0]
+	out['zeta_upper'] = bounds[1]
+	return(out)
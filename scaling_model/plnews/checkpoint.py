@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+checkpoint.py
+Purpose: write the followers of an account to disk page by page while they
+		 are being collected, so that a collection that stops half-way
+		 through a large account can pick up where it left off.
+
+While the followers of an account are being collected, the output
+directory has two files for it:
+- '<user>.csv.part': the follower csv so far (header and one id per line)
+- '<user>.checkpoint.json': the cursor of the next page to request, the
+  number of pages and followers written, and the size of the part file
+  after the last complete page
+
+Each page is appended and synced to the part file before the checkpoint is
+replaced, so the checkpoint never points past what is on disk; anything
+written after the last checkpoint is cut off when resuming. Once the last
+page is in, the part file is renamed to '<user>.csv' and the checkpoint is
+removed, so a '<user>.csv' file always holds a complete collection.
+"""
+
+import json
+import os
+
+PART_EXT = '.csv.part'
+CHECKPOINT_EXT = '.checkpoint.json'
+HEADER = 'follower_id\n'
+
+
+def completed_users(path):
+	"""Returns the file names of the complete follower csvs in 'path'"""
+	return([x for x in os.listdir(path) if x.endswith('.csv')])
+
+
+def partial_users(path):
+	"""
+	Returns the users (as in the file names) whose collection was left
+	unfinished in 'path'
+	"""
+	return([x[:-len(CHECKPOINT_EXT)] for x in os.listdir(path)
+			if x.endswith(CHECKPOINT_EXT)])
+
+
+class PartialFollowers(object):
+	"""
+	The followers of 'user' collected so far in the directory 'path'. A new
+	collection starts at cursor -1; if a checkpoint exists, 'cursor',
+	'pages' and 'followers_n' are restored from it and the next page is
+	appended to the ids already written.
+	"""
+	def __init__(self, path, user):
+		self.user = user
+		self.part_fname = os.path.join(path, user + PART_EXT)
+		self.checkpoint_fname = os.path.join(path, user + CHECKPOINT_EXT)
+		self.csv_fname = os.path.join(path, user + '.csv')
+		self.cursor = -1
+		self.pages = 0
+		self.followers_n = 0
+		self.nbytes = len(HEADER)
+		self.resumed = False
+		if os.path.exists(self.checkpoint_fname):
+			with open(self.checkpoint_fname) as f:
+				checkpoint = json.load(f)
+			if os.path.exists(self.part_fname) and (
+					os.path.getsize(self.part_fname) >= checkpoint['nbytes']):
+				self.cursor = checkpoint['cursor']
+				self.pages = checkpoint['pages']
+				self.followers_n = checkpoint['followers_n']
+				self.nbytes = checkpoint['nbytes']
+				self.resumed = True
+		if self.resumed:
+			# - drop a page that was written but not checkpointed
+			with open(self.part_fname, 'r+b') as f:
+				f.truncate(self.nbytes)
+		else:
+			with open(self.part_fname, 'w') as f:
+				f.write(HEADER)
+			self.save()
+
+	def add_page(self, ids, cursor):
+		"""
+		Appends a page of follower ids (strings) and records 'cursor' as
+		the next page to request
+		"""
+		data = ''.join('{}\n'.format(x) for x in ids).encode('utf-8')
+		with open(self.part_fname, 'ab') as f:
+			f.write(data)
+			f.flush()
+			os.fsync(f.fileno())
+		self.cursor = cursor
+		self.pages += 1
+		self.followers_n += len(ids)
+		self.nbytes += len(data)
+		self.save()
+
+	def save(self):
+		"""Replaces the checkpoint file with the current state"""
+		checkpoint = {'user': self.user, 'cursor': self.cursor,
+					  'pages': self.pages, 'followers_n': self.followers_n,
+					  'nbytes': self.nbytes}
+		with open(self.checkpoint_fname + '.tmp', 'w') as f:
+			json.dump(checkpoint, f)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(self.checkpoint_fname + '.tmp', self.checkpoint_fname)
+
+	def finish(self):
+		"""
+		Turns the part file into the final '<user>.csv' and removes the
+		checkpoint. Returns the name of the csv.
+		"""
+		os.replace(self.part_fname, self.csv_fname)
+		os.remove(self.checkpoint_fname)
+		return(self.csv_fname)
+
+	def discard(self):
+		"""Removes the part file and the checkpoint"""
+		for fname in [self.part_fname, self.checkpoint_fname]:
+			if os.path.exists(fname):
+				os.remove(fname)
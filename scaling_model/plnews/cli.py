@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+cli.py
+Purpose: the 'plnews' command, with one subcommand per stage of the
+		 pipeline, run from the 'scaling_model' directory as
+
+python -m plnews <command> [arguments of the stage]
+
+- collect:  get-twitter-followers.py
+- build:    build-bipartite-matrix-media-politician-followers.py
+- prune:    prune-matrix.py
+- export:   export-matrix.py
+- score:    score-followers.py
+- annotate: annotate-urls.py
+
+The arguments after the command go to the script of the stage unchanged,
+so 'python -m plnews build --help' lists the arguments of the builder.
+Each script parses its arguments with 'parse_args(argv)' and runs with
+'main(args)', and only parses the command line itself when run as a
+script. The script of the command given is imported (as a module named
+after it, see 'load_script') and only then: pandas, scipy and the Twitter
+client are imported by the stages that use them, so 'python -m plnews
+--help' and 'annotate' (which needs none of them) start as fast as the
+interpreter does.
+
+Each stage is also a function of this module that takes the arguments as
+a list, to run the pipeline from Python, e.g.
+
+from plnews.cli import build, export
+build(['--config', 'data/PL-grid.json'])
+export(['--input', 'data/PL-graph/', '--country', 'PL', '--run', '3'])
+
+As on the command line, invalid arguments raise SystemExit. The functions
+of a script can also be called directly, e.g.
+
+from plnews.cli import load_script
+builder = load_script('build')
+builder.main(builder.parse_args(['--config', 'data/PL-grid.json']))
+"""
+
+import os
+import sys
+
+SCRIPT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# - (command, script, help), in the order of the pipeline
+COMMANDS = [
+	('collect', 'get-twitter-followers.py',
+	 'collect the Twitter followers of the media and politician accounts'),
+	('build', 'build-bipartite-matrix-media-politician-followers.py',
+	 'build the bipartite matrix of followers by accounts'),
+	('prune', 'prune-matrix.py',
+	 'drop the followers and accounts with few edges from a matrix'),
+	('export', 'export-matrix.py',
+	 'convert a matrix between the text and binary formats'),
+	('score', 'score-followers.py',
+	 'score the ideology of the followers from the fitted accounts'),
+	('annotate', 'annotate-urls.py',
+	 'add the news domain and its ideology to the URLs of a trace'),
+]
+
+USAGE = 'usage: python -m plnews <command> [arguments]'
+
+
+def load_script(command):
+	"""
+	Returns the script of a 'command' as a module, importing it the first
+	time. The names of the scripts are not valid module names, so each is
+	imported from its file as 'plnews_<command>', and kept in sys.modules
+	under that name so that worker processes can find its functions.
+	"""
+	name = 'plnews_' + command
+	if name not in sys.modules:
+		# - imported here, as it takes longer to import than this module
+		import importlib.util
+		fname = os.path.join(SCRIPT_PATH, _script(command))
+		spec = importlib.util.spec_from_file_location(name, fname)
+		module = importlib.util.module_from_spec(spec)
+		sys.modules[name] = module
+		try:
+			spec.loader.exec_module(module)
+		except BaseException:
+			del sys.modules[name]
+			raise
+	return(sys.modules[name])
+
+
+def run_command(command, argv = ()):
+	"""
+	Runs the script of a 'command' with the arguments 'argv' (list), as on
+	the command line
+	"""
+	module = load_script(command)
+	args = module.parse_args(list(argv), prog = 'python -m plnews ' + command)
+	module.main(args)
+
+
+def collect(argv = ()):
+	"""Collects the followers (get-twitter-followers.py)"""
+	run_command('collect', argv)
+
+
+def build(argv = ()):
+	"""Builds the matrix (build-bipartite-matrix-...-followers.py)"""
+	run_command('build', argv)
+
+
+def prune(argv = ()):
+	"""Prunes a matrix (prune-matrix.py)"""
+	run_command('prune', argv)
+
+
+def export(argv = ()):
+	"""Converts a matrix (export-matrix.py)"""
+	run_command('export', argv)
+
+
+def score(argv = ()):
+	"""Scores the followers (score-followers.py)"""
+	run_command('score', argv)
+
+
+def annotate(argv = ()):
+	"""Annotates the URLs of a trace (annotate-urls.py)"""
+	run_command('annotate', argv)
+
+
+def _script(command):
+	return(dict((x, y) for x, y, z in COMMANDS)[command])
+
+
+def usage():
+	"""Returns the help of the command"""
+	lines = [USAGE, '', 'commands:']
+	for command, script, text in COMMANDS:
+		lines.append('  {:<10}{}'.format(command, text))
+	lines += ['', "'python -m plnews <command> --help' for the arguments of "
+			  'a command']
+	return('\n'.join(lines))
+
+
+def main(argv = None):
+	"""Runs the command in 'argv' (default: the command line)"""
+	argv = sys.argv[1:] if argv is None else list(argv)
+	if not argv or argv[0] in ('-h', '--help'):
+		print(usage())
+		return(0 if argv else 2)
+	functions = {'collect': collect, 'build': build, 'prune': prune,
+				 'export': export, 'score': score, 'annotate': annotate}
+	if argv[0] not in functions:
+		sys.stderr.write('{}\nplnews: error: unknown command {!r} (choose '
+						 'from {})\n'.format(USAGE, argv[0],
+											 ', '.join(functions)))
+		return(2)
+	functions[argv[0]](argv[1:])
+	return(0)
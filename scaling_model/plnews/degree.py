@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+degree.py
+Purpose: count how many accounts each follower follows without holding all
+		 the follows in memory at once, to find the followers that follow
+		 many of them (the intense followers of small media).
+
+The follower ids of each account are spilled to disk as they are read,
+split into partitions by a hash of the id, so that all the occurrences of a
+follower end up in the same partition file. The partitions are then counted
+one at a time, which needs memory for one partition (about 1/'partitions'
+of all the follows) rather than for all of them.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+PARTITIONS = 64
+# - Fibonacci hashing spreads ids that share their low bits (e.g. ids
+#   handed out in blocks) evenly over the partitions
+HASH = np.uint64(0x9E3779B97F4A7C15)
+
+
+class DegreeCounter(object):
+	"""
+	Counts the occurrences of follower ids added with 'add', spilling them
+	to partition files in a temporary directory under 'path' (the system
+	default if None). Call 'close' (or use it in a 'with' block) to remove
+	the files.
+	"""
+	def __init__(self, path = None, partitions = PARTITIONS):
+		self.partitions = partitions
+		self.path = tempfile.mkdtemp(prefix = 'degree-', dir = path)
+		self.fnames = [os.path.join(self.path, '{}.u8'.format(i))
+					   for i in range(partitions)]
+		self.rows = 0
+
+	def __enter__(self):
+		return(self)
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def partition(self, ids):
+		"""Returns the partition of each id"""
+		with np.errstate(over = 'ignore'):
+			h = (ids * HASH) >> np.uint64(32)
+		# - maps the top 32 bits of the hash evenly onto the partitions
+		return(((h * np.uint64(self.partitions)) >> np.uint64(32))
+			   .astype(np.int64))
+
+	def add(self, ids):
+		"""Adds one occurrence of each of the follower 'ids' (uint64)"""
+		ids = np.asarray(ids, dtype = np.uint64)
+		part = self.partition(ids)
+		order = np.argsort(part, kind = 'stable')
+		bounds = np.searchsorted(part[order], np.arange(self.partitions + 1))
+		ids = ids[order]
+		for i in range(self.partitions):
+			if bounds[i + 1] > bounds[i]:
+				with open(self.fnames[i], 'ab') as f:
+					f.write(ids[bounds[i]:bounds[i + 1]].astype('<u8')
+							.tobytes())
+		self.rows += len(ids)
+
+	def frequent(self, min_count):
+		"""
+		Returns the sorted ids that were added more than 'min_count' times,
+		reading one partition at a time
+		"""
+		found = []
+		for fname in self.fnames:
+			if not os.path.exists(fname):
+				continue
+			ids = np.fromfile(fname, dtype = '<u8')
+			ids, counts = np.unique(ids, return_counts = True)
+			found.append(ids[counts > min_count])
+		if len(found) == 0:
+			return(np.empty(0, dtype = np.uint64))
+		return(np.sort(np.concatenate(found)).astype(np.uint64))
+
+	def close(self):
+		"""Removes the partition files"""
+		if os.path.exists(self.path):
+			shutil.rmtree(self.path)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+handles.py
+Purpose: match Twitter handles written in different ways (with or without
+		 '@', in any case) across the input lists, the follower files and
+		 the columns of the matrix.
+
+Twitter handles are case-insensitive, but the lists of accounts
+(PL-domains-twitter.csv, PL-politicians-twitter.csv) write them with an
+'@' and in whatever case they were typed, and the follower files and the
+matrix columns keep the case of the list they were collected from. A
+HandleRegistry keeps each handle once, by its normalized form ('normalize'),
+with the spelling it was first added with, its position among the handles
+(e.g. its column in the matrix) and optionally the file its followers are
+in, and looks up any spelling of a handle with one dictionary lookup.
+"""
+
+import pandas as pd
+
+from plnews.store import account_name
+
+
+def normalize(handle):
+	"""
+	Returns the normalized form of a handle: without spaces around it or
+	a leading '@', lowercase. '' for a missing handle (None or NaN).
+	"""
+	if handle is None or (not isinstance(handle, str) and pd.isnull(handle)):
+		return('')
+	return(handle.strip().lstrip('@').lower())
+
+
+class HandleRegistry(object):
+	"""
+	Handles in the order in which they were first added, each once.
+
+	'names' = (list)  The handles as first added, without '@'
+	'index' = (dict)  The position of each handle in 'names', by its
+					  normalized form
+	'files' = (dict)  The file (or follower store account) of each handle
+					  that has one, by its normalized form
+	"""
+	def __init__(self, handles = ()):
+		self.names = []
+		self.index = {}
+		self.files = {}
+		for handle in handles:
+			self.add(handle)
+
+	def __len__(self):
+		return(len(self.names))
+
+	def __contains__(self, handle):
+		return(normalize(handle) in self.index)
+
+	def __iter__(self):
+		return(iter(self.names))
+
+	def add(self, handle, fname = None):
+		"""
+		Returns the position of 'handle', adding it if it is new, and
+		records its file 'fname' if it has none yet. Missing handles are
+		not added (returns None).
+		"""
+		key = normalize(handle)
+		if key == '':
+			return(None)
+		i = self.index.get(key)
+		if i is None:
+			i = len(self.names)
+			self.index[key] = i
+			self.names.append(handle.strip().lstrip('@'))
+		if fname is not None and key not in self.files:
+			self.files[key] = fname
+		return(i)
+
+	def get(self, handle):
+		"""Returns the position of 'handle', or None if it was never added"""
+		return(self.index.get(normalize(handle)))
+
+	def name(self, handle):
+		"""Returns the handle as first added, or None"""
+		i = self.index.get(normalize(handle))
+		return(None if i is None else self.names[i])
+
+	def file(self, handle):
+		"""Returns the file of 'handle', or None"""
+		return(self.files.get(normalize(handle)))
+
+
+def file_registry(fnames):
+	"""
+	Returns a HandleRegistry of the accounts of follower csvs ('fnames',
+	e.g. 'TVN24.csv'), each with its file. Of several files of the same
+	account (e.g. 'TVN24.csv' and 'tvn24.csv'), the first in 'fnames' is
+	kept.
+	"""
+	registry = HandleRegistry()
+	for fname in fnames:
+		registry.add(account_name(fname), fname)
+	return(registry)
+
+
+def read_handles(fname, colname = 'twitter'):
+	"""
+	Returns a HandleRegistry of the handles in the column 'colname' of the
+	csv 'fname' (e.g. PL-domains-twitter.csv), in the order of the file
+	"""
+	df = pd.read_csv(fname, dtype = {colname: str})
+	return(HandleRegistry(df[colname]))
+
+
+def matrix_handles(handles, colnames):
+	"""
+	Returns the columns of the matrix ('colnames') that are among 'handles'
+	(a HandleRegistry, e.g. from 'read_handles'), as written in
+	'colnames', in the order of 'handles'. The same as the handle filtering
+	in PL-ideo-scaling-model.R (gsub("@", "", ...) and %in% colnames(X)),
+	except that handles also match in another case.
+	"""
+	cols = HandleRegistry(colnames)
+	found = []
+	for handle in handles:
+		name = cols.name(handle)
+		if name is not None:
+			found.append(name)
+	return(found)
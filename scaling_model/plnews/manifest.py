@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+manifest.py
+Purpose: record what a run of the matrix builder was built from, so that a 
+		 later run with the same output name can tell which follower files 
+		 changed and update the previous matrix instead of rebuilding it.
+
+A manifest is a json file next to the matrix (e.g. 'PL-manifest-3.json') 
+with the parameters of the run, the shape of the matrix, and for each media
+('media') and politician ('pols') account:
+- 'kind': 'small', 'big' or 'skip' for media, 'pol' or 'skip' for 
+  politicians ('skip' = too few followers to be a column)
+- 'n': the number of followers
+- 'stat': a cheap fingerprint of the follower file or store entry (see the
+  'stat' methods in plnews/store.py)
+- 'digest': a sha1 of the sorted unique follower ids
+- 'sample': for big media, the followers sampled as new rows
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+VERSION = 1
+
+
+def follower_digest(ids):
+	"""Returns the sha1 (hex) of an array of sorted unique follower ids"""
+	ids = np.ascontiguousarray(ids, dtype = '<u8')
+	return(hashlib.sha1(ids.tobytes()).hexdigest())
+
+
+def new_manifest(params):
+	"""Returns an empty manifest for a run with parameters 'params' (dict)"""
+	return({'version': VERSION, 'params': params, 'shape': None, 
+			'media': {}, 'pols': {}})
+
+
+def read_manifest(fname):
+	"""Returns the manifest in 'fname', or None if missing or outdated"""
+	if not os.path.exists(fname):
+		return(None)
+	with open(fname) as f:
+		manifest = json.load(f)
+	if manifest.get('version') != VERSION:
+		return(None)
+	return(manifest)
+
+
+def write_manifest(fname, manifest):
+	"""Writes a manifest, replacing the previous one only once complete"""
+	with open(fname + '.tmp', 'w') as f:
+		json.dump(manifest, f, indent = 1, sort_keys = True)
+	os.replace(fname + '.tmp', fname)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+matrix.py
+Purpose: keep track of the followers in the rows of the bipartite matrix, 
+		 link accounts to them, optionally with a pool of worker processes,
+		 and read/write the matrix.
+
+The matrix can be saved in two ways, both named after a country prefix and
+a run label, e.g. 'PL' and '3':
+- text: the five files 'PL-indices-3.txt', 'PL-pointers-3.txt', 
+  'PL-values-3.txt', 'PL-rownames-3.txt' and 'PL-colnames-3.txt', read in R
+  with 'Matrix::sparseMatrix(j = indices, p = pointers, x = values)'
+- binary: 'PL-graph-3.npz', a compressed file with the CSR arrays and the 
+  row and column names that 'load_matrix' (or 'scipy.sparse.load_npz', 
+  without the names) reads back, plus a gzipped Matrix Market file 
+  'PL-graph-3.mtx.gz' for R, where 'Matrix::readMM(gzfile(...))' reads it
+  as a pattern (0/1) matrix. The row and column names are in its second
+  and third lines, comments that readMM skips: '%rownames' and
+  '%colnames' followed by the names, separated by tabs (see 'read_mtx')
+"""
+
+import gzip
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from scipy import io, sparse
+
+# - followers looked at at a time when sampling
+CHUNK_SIZE = 1 << 16
+
+
+class RowIndex(object):
+	"""
+	The follower ids in the rows of the matrix. 'ids' holds them in row 
+	order; a sorted copy, kept up to date as rows are added, is used to look
+	up the rows of many followers at once with a binary search.
+	"""
+	def __init__(self):
+		self.ids = np.empty(0, dtype = np.uint64)
+		self.sorted_ids = np.empty(0, dtype = np.uint64)
+		self.sorted_rows = np.empty(0, dtype = np.int64)
+
+	def __len__(self):
+		return(len(self.ids))
+
+	def lookup(self, followers):
+		"""Returns the row of each of the 'followers', or -1 if not a row"""
+		followers = np.asarray(followers, dtype = np.uint64)
+		if len(self.ids) == 0:
+			return(np.full(len(followers), -1, dtype = np.int64))
+		pos = np.searchsorted(self.sorted_ids, followers)
+		pos[pos == len(self.sorted_ids)] = 0
+		found = self.sorted_ids[pos] == followers
+		return(np.where(found, self.sorted_rows[pos], -1))
+
+	def contains(self, followers):
+		"""Returns a boolean array, True for the 'followers' that are rows"""
+		return(self.lookup(followers) >= 0)
+
+	def add(self, followers):
+		"""
+		Adds the 'followers' that are not rows yet as new rows, in the order
+		in which they first appear in 'followers'
+		"""
+		followers = np.asarray(followers, dtype = np.uint64)
+		followers = followers[~self.contains(followers)]
+		new_ids, first = np.unique(followers, return_index = True)
+		followers = followers[np.sort(first)]
+		new_rows = len(self.ids) + np.arange(len(followers), dtype = np.int64)
+		order = np.argsort(followers)
+		pos = np.searchsorted(self.sorted_ids, new_ids)
+		self.sorted_ids = np.insert(self.sorted_ids, pos, new_ids)
+		self.sorted_rows = np.insert(self.sorted_rows, pos, new_rows[order])
+		self.ids = np.concatenate((self.ids, followers))
+
+
+def link_followers(rows, followers, workers = 1):
+	"""
+	Returns, for each array of follower ids in 'followers', the rows of the
+	followers that are in 'rows', in the same order as 'followers'.
+
+	'rows' = (RowIndex)     The followers in the matrix
+	'followers' = (list)    Arrays of follower ids (uint64), e.g. one array
+							per account to link
+	'workers' = (int)       Number of worker processes. With more than one,
+							each worker gets a copy of the row index once 
+							and the arrays are split among them.
+	"""
+	if workers <= 1 or len(followers) <= 1:
+		found = [rows.lookup(x) for x in followers]
+	else:
+		pool = Pool(workers, initializer = _init_worker, 
+					initargs = (rows.ids, rows.sorted_ids, rows.sorted_rows))
+		try:
+			found = pool.map(_lookup, followers, chunksize = 1)
+		finally:
+			pool.close()
+			pool.join()
+	return([x[x >= 0] for x in found])
+
+
+def sample_new_followers(rows, followers, k, rng, chunk_size = CHUNK_SIZE):
+	"""
+	Returns a random sample of 'k' of the 'followers' that are not rows yet
+	(all of them if fewer), without building the list of those followers.
+
+	The followers are looked at 'chunk_size' at a time; each one that is
+	not a row gets a random key and the 'k' with the smallest keys so far
+	are kept (a reservoir sample), so memory does not grow with the number
+	of followers. The keys are drawn in order from 'rng' (a numpy
+	Generator), so the sample depends only on the seed of 'rng', not on
+	'chunk_size'. The sample is returned in the order of its keys.
+	"""
+	sample = np.empty(0, dtype = np.uint64)
+	keys = np.empty(0, dtype = np.float64)
+	for start in range(0, len(followers), chunk_size):
+		chunk = np.asarray(followers[start:start + chunk_size], 
+						   dtype = np.uint64)
+		chunk = chunk[~rows.contains(chunk)]
+		sample = np.concatenate((sample, chunk))
+		keys = np.concatenate((keys, rng.random(len(chunk))))
+		if len(keys) > k:
+			keep = np.argpartition(keys, k)[:k]
+			sample, keys = sample[keep], keys[keep]
+	order = np.argsort(keys, kind = 'mergesort')
+	return(sample[order])
+
+
+_worker_rows = None
+
+
+def _init_worker(ids, sorted_ids, sorted_rows):
+	"""Sets up the row index of a worker process"""
+	global _worker_rows
+	_worker_rows = RowIndex()
+	_worker_rows.ids = ids
+	_worker_rows.sorted_ids = sorted_ids
+	_worker_rows.sorted_rows = sorted_rows
+
+
+def _lookup(followers):
+	"""Looks up an array of followers in the row index of a worker process"""
+	return(_worker_rows.lookup(followers))
+
+
+#==============================================================================
+# READING AND WRITING
+#==============================================================================
+def matrix_file(path, country, run, name, ext = 'txt'):
+	"""
+	Returns e.g. 'data/PL-graph/PL-indices-3.txt' for name = 'indices', 
+	whether the directory 'path' ends with a slash or not
+	"""
+	return('{}{}-{}-{}.{}'.format(os.path.join(path, ''), country, name, run,
+								  ext))
+
+
+# - the files of each format, by (name, extension)
+FORMAT_FILES = {
+	'text': [(x, 'txt') for x in ['indices', 'pointers', 'values',
+								  'rownames', 'colnames']],
+	'binary': [('graph', 'npz'), ('graph', 'mtx.gz')],
+}
+
+
+def write_matrix(path, country, run, mat, rownames, colnames, fmt = 'text'):
+	"""
+	Saves the matrix in the format 'fmt' ('text', 'binary' or 'both') and
+	deletes the files of the other format left by earlier runs with the
+	same name, so that 'read_matrix' never reads a stale copy
+	"""
+	if fmt not in ['text', 'binary', 'both']:
+		raise ValueError('unknown format: {}'.format(fmt))
+	for x in FORMAT_FILES:
+		if fmt not in [x, 'both']:
+			for name, ext in FORMAT_FILES[x]:
+				fname = matrix_file(path, country, run, name, ext)
+				if os.path.exists(fname):
+					os.remove(fname)
+	if fmt in ['text', 'both']:
+		write_text(path, country, run, mat, rownames, colnames)
+	if fmt in ['binary', 'both']:
+		write_binary(path, country, run, mat, rownames, colnames)
+
+
+def write_text(path, country, run, mat, rownames, colnames):
+	"""
+	Saves the data about the sparse matrix in a way that can be read later 
+	in R, with 'Matrix::sparseMatrix(j = indices, p = pointers, x = values)'
+	"""
+	np.savetxt(matrix_file(path, country, run, 'indices'), mat.indices, 
+			   fmt='%.0f')
+	np.savetxt(matrix_file(path, country, run, 'pointers'), mat.indptr, 
+			   fmt='%.0f')
+	np.savetxt(matrix_file(path, country, run, 'values'), mat.data, 
+			   fmt='%.0f')
+	write_names(path, country, run, rownames, colnames)
+
+
+def write_names(path, country, run, rownames, colnames):
+	"""Saves the row and column names, one per line"""
+	with open(matrix_file(path, country, run, 'rownames'), 'w') as f:
+		for item in rownames:
+			f.write("%s\n" % item)
+
+	with open(matrix_file(path, country, run, 'colnames'), 'w') as f:
+		for item in colnames:
+			f.write("%s\n" % item)
+
+
+def write_binary(path, country, run, mat, rownames, colnames):
+	"""
+	Saves the sparse matrix as a compressed .npz file with the row and 
+	column names, and as a gzipped Matrix Market file for R with the names
+	in its comment lines
+	"""
+	mat = sparse.csr_matrix(mat)
+	np.savez_compressed(matrix_file(path, country, run, 'graph', 'npz'),
+						format = np.array('csr'),
+						shape = np.array(mat.shape),
+						data = mat.data.astype(np.uint8),
+						indices = mat.indices,
+						indptr = mat.indptr,
+						rownames = np.array([str(x) for x in rownames]),
+						colnames = np.array([str(x) for x in colnames]))
+	with gzip.open(matrix_file(path, country, run, 'graph', 'mtx.gz'), 'wb',
+				   compresslevel = 6) as f:
+		io.mmwrite(f, mat, field = 'pattern', comment = '\n'.join([
+			'\t'.join(['rownames'] + [str(x) for x in rownames]),
+			'\t'.join(['colnames'] + [str(x) for x in colnames])]))
+
+
+def read_text(path, country, run):
+	"""
+	Reads a matrix saved with 'write_text'. Returns the CSR matrix and the 
+	lists of row and column names.
+	"""
+	rownames = read_names(matrix_file(path, country, run, 'rownames'))
+	colnames = read_names(matrix_file(path, country, run, 'colnames'))
+	indices = np.loadtxt(matrix_file(path, country, run, 'indices'), 
+						 dtype = np.int32, ndmin = 1)
+	indptr = np.loadtxt(matrix_file(path, country, run, 'pointers'), 
+						dtype = np.int32, ndmin = 1)
+	data = np.loadtxt(matrix_file(path, country, run, 'values'), 
+					  dtype = np.int64, ndmin = 1)
+	mat = sparse.csr_matrix((data, indices, indptr), 
+							shape = (len(rownames), len(colnames)))
+	return(mat, rownames, colnames)
+
+
+def read_names(fname):
+	"""Reads a file with one row or column name per line"""
+	with open(fname) as f:
+		return([x.rstrip('\n') for x in f])
+
+
+def load_matrix(fname):
+	"""
+	Reads a matrix saved with 'write_binary'. Returns the CSR matrix and the
+	lists of row and column names.
+	"""
+	with np.load(fname) as f:
+		mat = sparse.csr_matrix((f['data'].astype(np.int64), f['indices'], 
+								 f['indptr']), shape = tuple(f['shape']))
+		return(mat, f['rownames'].tolist(), f['colnames'].tolist())
+
+
+def read_mtx(fname):
+	"""
+	Reads a Matrix Market file saved with 'write_binary'. Returns the CSR
+	matrix and the lists of row and column names (from its comment lines).
+	"""
+	names = {}
+	with gzip.open(fname, 'rt') as f:
+		f.readline()
+		for line in f:
+			if not line.startswith('%'):
+				break
+			fields = line[1:].rstrip('\n').split('\t')
+			names[fields[0]] = fields[1:]
+	with gzip.open(fname, 'rb') as f:
+		mat = sparse.csr_matrix(io.mmread(f), dtype = np.int64)
+	return(mat, names.get('rownames', []), names.get('colnames', []))
+
+
+def read_matrix(path, country, run):
+	"""
+	Reads the matrix of a run, from the .npz file if there is one and from 
+	the text files otherwise. If there are both (e.g. written by different
+	runs, before 'write_matrix' deleted the other format), the newer one is
+	read.
+	"""
+	fname = matrix_file(path, country, run, 'graph', 'npz')
+	text_fname = matrix_file(path, country, run, 'indices')
+	if os.path.exists(fname) and not (os.path.exists(text_fname) and
+			os.path.getmtime(text_fname) > os.path.getmtime(fname)):
+		return(load_matrix(fname))
+	return(read_text(path, country, run))
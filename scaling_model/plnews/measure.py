@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+measure.py
+Purpose: run a command and report its wall time and peak resident memory.
+
+A process started by another one inherits the memory high-water mark of its
+parent, so measuring a stage from a process that already holds a lot of 
+data (e.g. the benchmark, after generating the synthetic data) would report
+the memory of the parent. Running the command through this small module
+keeps the parent lean:
+
+	python -m plnews.measure LOG COMMAND [ARGS ...]
+
+runs COMMAND with its output appended to LOG and prints one json line with
+'wall_time' (secs), 'peak_rss_mb' and 'returncode'.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def measure(command, log):
+	"""
+	Runs 'command' (a list) with stdout and stderr appended to the file
+	'log'. Returns a dict with its wall time, peak RSS (MB) and return code.
+	"""
+	with open(log, 'a') as f:
+		start = time.time()
+		process = subprocess.Popen(command, stdout = f,
+								   stderr = subprocess.STDOUT)
+		# - wait4 gives the resource usage of this process alone
+		_, status, usage = os.wait4(process.pid, 0)
+		wall = time.time() - start
+	process.returncode = os.waitstatus_to_exitcode(status)
+	# - ru_maxrss is in kilobytes on Linux, in bytes on macOS
+	rss = usage.ru_maxrss / (1024.0 ** 2 if sys.platform == 'darwin'
+							 else 1024.0)
+	return({'wall_time': wall, 'peak_rss_mb': rss,
+			'returncode': process.returncode})
+
+
+if __name__ == "__main__":
+	if len(sys.argv) < 3:
+		sys.exit('usage: python -m plnews.measure LOG COMMAND [ARGS ...]')
+	print(json.dumps(measure(sys.argv[2:], sys.argv[1])))
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+mock_twitter.py
+Purpose: a local stand-in for the two Twitter v1.1 endpoints the follower
+		 collector uses ('users/show' and 'followers/ids'), to try the
+		 collector without keys or quota.
+
+The server serves the followers in a directory of follower csvs (one per
+account, as written by get-twitter-followers.py) in pages of 5,000 with
+cursors, counts requests per key (the 'oauth_consumer_key' of the request)
+and endpoint in short windows, sends the usual rate-limit headers and
+answers with a 429 / code 88 error once a key has used up a window. It can
+also mark accounts as protected (401) and fail a share of requests, with
+code 130 (over capacity, a 503) or with another 5xx status and an HTML
+page instead of json, as proxies in front of Twitter do. Unknown accounts
+get a 404 / code 50.
+
+Example:
+python -m plnews.mock_twitter --followers data/PL-media-followers/ \
+    --port 8080 --window 5 --limit 3
+python get-twitter-followers.py ... --api-url http://localhost:8080/1.1
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pandas as pd
+
+PAGE_SIZE = 5000
+
+
+class MockTwitter(object):
+	"""
+	The state of the mock API: the followers of each account and the
+	requests made by each key in the current window.
+
+	'followers' = (dict)   Screen name -> list of follower ids (strings)
+	'limit' = (int)        Requests per key, endpoint and window
+	'window' = (float)     Length of a rate-limit window in seconds
+	'protected' = (list)   Screen names whose followers cannot be seen
+	'fail_rate' = (float)  Share of requests failing
+	'fail_status' = (int)  The HTTP status of the failures: 503 answers
+						   with code 130 in json, any other status with
+						   an HTML page
+	"""
+	def __init__(self, followers, limit = 15, window = 60.0, protected = None,
+				 fail_rate = 0.0, seed = None, fail_status = 503):
+		self.followers = dict((x.lower(), (x, y)) for x, y in followers.items())
+		self.limit = limit
+		self.window = window
+		self.protected = set(x.lower() for x in (protected or []))
+		self.fail_rate = fail_rate
+		self.fail_status = fail_status
+		self.rng = random.Random(seed)
+		self.windows = {}
+		self.requests = 0
+		self.lock = threading.Lock()
+
+	def rate_limit(self, key, endpoint):
+		"""
+		Counts a request; returns whether it is allowed and the rate-limit
+		headers to send
+		"""
+		with self.lock:
+			self.requests += 1
+			now = time.time()
+			start, used = self.windows.get((key, endpoint), (now, 0))
+			if now >= start + self.window:
+				start, used = now, 0
+			allowed = used < self.limit
+			if allowed:
+				used += 1
+			self.windows[(key, endpoint)] = (start, used)
+			failed = allowed and self.rng.random() < self.fail_rate
+		headers = {'x-rate-limit-limit': str(self.limit),
+				   'x-rate-limit-remaining': str(self.limit - used),
+				   'x-rate-limit-reset': str(int(start + self.window) + 1)}
+		return(allowed, failed, headers)
+
+	def handle(self, key, endpoint, params):
+		"""
+		Returns the HTTP status, body (a dict to send as json, or a string
+		to send as HTML) and headers for a request
+		"""
+		if key is None:
+			return(401, {'errors': [{'code': 32,
+				'message': 'Could not authenticate you.'}]}, {})
+		allowed, failed, headers = self.rate_limit(key, endpoint)
+		if not allowed:
+			return(429, {'errors': [{'code': 88,
+				'message': 'Rate limit exceeded'}]}, headers)
+		if failed and self.fail_status == 503:
+			return(503, {'errors': [{'code': 130,
+				'message': 'Over capacity'}]}, headers)
+		if failed:
+			return(self.fail_status, '<html><body><h1>{} Server Error</h1>'
+				   '</body></html>\n'.format(self.fail_status), {})
+		user = params.get('screen_name', '').lower()
+		if user not in self.followers:
+			return(404, {'errors': [{'code': 50,
+				'message': 'User not found.'}]}, headers)
+		name, followers = self.followers[user]
+		if endpoint == 'users/show':
+			return(200, {'screen_name': name,
+						 'followers_count': len(followers)}, headers)
+		if user in self.protected:
+			return(401, {'request': '/1.1/followers/ids.json',
+						 'error': 'Not authorized.'}, headers)
+		cursor = int(params.get('cursor', -1))
+		start = 0 if cursor == -1 else cursor
+		count = min(int(params.get('count', PAGE_SIZE)), PAGE_SIZE)
+		end = min(start + count, len(followers))
+		next_cursor = end if end < len(followers) else 0
+		return(200, {'ids': followers[start:end], 'next_cursor': next_cursor,
+					 'previous_cursor': -start if start > 0 else 0}, headers)
+
+
+def make_handler(api):
+	"""Returns a request handler class serving the MockTwitter 'api'"""
+	class Handler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			url = urlparse(self.path)
+			match = re.match(r'^/1\.1/(users/show|followers/ids)\.json$',
+							 url.path)
+			auth = self.headers.get('Authorization', '')
+			key = re.search(r'oauth_consumer_key="([^"]*)"', auth)
+			key = unquote(key.group(1)) if key else None
+			if match is None:
+				status, body, headers = 404, {'errors': [{'code': 34,
+					'message': 'Sorry, that page does not exist.'}]}, {}
+			else:
+				params = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+				status, body, headers = api.handle(key, match.group(1), params)
+			if isinstance(body, str):
+				content_type = 'text/html'
+			else:
+				content_type = 'application/json'
+				body = json.dumps(body)
+			body = body.encode('utf-8')
+			self.send_response(status)
+			self.send_header('Content-Type', content_type)
+			self.send_header('Content-Length', str(len(body)))
+			for k, v in headers.items():
+				self.send_header(k, v)
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			pass
+	return(Handler)
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+def start_server(api, port = 0):
+	"""
+	Serves 'api' on localhost in a background thread. Returns the server
+	(stop it with 'shutdown()') and the base url to give to the collector.
+	"""
+	server = ThreadingServer(('127.0.0.1', port), make_handler(api))
+	thread = threading.Thread(target = server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	return(server, 'http://127.0.0.1:{}/1.1'.format(server.server_address[1]))
+
+
+def read_followers_dir(path):
+	"""Reads a directory of follower csvs into a dict for MockTwitter"""
+	followers = {}
+	for fname in sorted(os.listdir(path)):
+		if fname.endswith('.csv'):
+			df = pd.read_csv(os.path.join(path, fname), dtype = str)
+			followers[fname[:-len('.csv')]] = df['follower_id'].tolist()
+	return(followers)
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--followers', required = True,
+						help = 'a directory of follower csvs to serve')
+	parser.add_argument('--port', type = int, default = 8080)
+	parser.add_argument('--limit', type = int, default = 15,
+						help = 'requests per key, endpoint and window')
+	parser.add_argument('--window', type = float, default = 60.0,
+						help = 'length of a rate-limit window in seconds')
+	parser.add_argument('--protected', nargs = '*', default = [],
+						help = 'screen names whose followers are hidden')
+	parser.add_argument('--fail-rate', type = float, default = 0.0,
+						help = 'share of requests failing')
+	parser.add_argument('--fail-status', type = int, default = 503,
+						help = 'HTTP status of the failures (503: code 130 '
+							   'in json; others: an HTML page)')
+	args = parser.parse_args()
+	api = MockTwitter(read_followers_dir(args.followers), limit = args.limit,
+					  window = args.window, protected = args.protected,
+					  fail_rate = args.fail_rate,
+					  fail_status = args.fail_status)
+	server, url = start_server(api, args.port)
+	print('Serving {} accounts at {}'.format(len(api.followers), url))
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		server.shutdown()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+pruning.py
+Purpose: drop the followers with few follows and the accounts with few
+		 followers from the bipartite matrix, on the sparse matrix, before
+		 the model is fitted in R.
+
+PL-ideo-scaling-model.R kept the followers with more than 50 follows and,
+for alternative models, the politicians with more than 225 followers and
+the media accounts with more than 30, each once and on the dense matrix.
+Dropping accounts lowers the degree of their followers and dropping
+followers lowers the degree of the accounts they follow, so 'prune'
+repeats both until neither drops anything: every row and column left is
+above its threshold in the pruned matrix itself (as in a k-core). Each
+round is two sparse matrix-vector products, whatever the size of the
+matrix.
+
+The scores of accounts in different connected components of the follower
+graph are not on a common scale, so 'components' checks how many
+components are left and 'largest_component' can keep only the largest.
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+
+def prune(mat, min_row, min_col, max_rounds = None):
+	"""
+	Returns which rows and which columns (boolean arrays) are left once the
+	rows with 'min_row' or fewer edges and the columns with 'min_col' or
+	fewer are dropped until none are, and the rows, columns and edges left
+	after each round (list of dicts).
+
+	'mat' = (sparse matrix)  The follower x account matrix (0/1)
+	'min_col' = (int or array)  One threshold for all the columns, or one
+							   per column (e.g. by type of account)
+	'max_rounds' = (int)     Stop after this many rounds, even if there is
+							 still anything to drop (default: no limit)
+	"""
+	# - a copy: csr_matrix can share the data of the caller's matrix
+	mat = sparse.csr_matrix(mat).astype(np.float64, copy = True)
+	mat.data[:] = 1
+	rows = np.ones(mat.shape[0], dtype = bool)
+	cols = np.ones(mat.shape[1], dtype = bool)
+	min_col = np.broadcast_to(np.asarray(min_col), cols.shape)
+	rounds = []
+	while max_rounds is None or len(rounds) < max_rounds:
+		# - degrees counting only the rows and columns still in
+		col_degree = mat.T.dot(rows.astype(np.float64))
+		new_cols = cols & (col_degree > min_col)
+		row_degree = mat.dot(new_cols.astype(np.float64))
+		new_rows = rows & (row_degree > min_row)
+		changed = (new_rows != rows).any() or (new_cols != cols).any()
+		rows, cols = new_rows, new_cols
+		rounds.append({'round': len(rounds) + 1, 'rows': int(rows.sum()),
+					   'cols': int(cols.sum()),
+					   'edges': int(row_degree[rows].sum())})
+		if not changed:
+			break
+	return(rows, cols, rounds)
+
+
+def components(mat):
+	"""
+	Returns the number of connected components of the bipartite graph of
+	'mat' and the component of each row and each column (arrays). Rows and
+	columns without edges are components of their own.
+	"""
+	nrows, ncols = mat.shape
+	mat = sparse.csr_matrix(mat)
+	graph = sparse.bmat([[None, mat], [mat.T, None]], format = 'csr')
+	n, labels = csgraph.connected_components(graph, directed = False)
+	return(n, labels[:nrows], labels[nrows:])
+
+
+def largest_component(mat):
+	"""
+	Returns which rows and which columns (boolean arrays) are in the
+	largest connected component of 'mat', by number of edges
+	"""
+	n, row_labels, col_labels = components(mat)
+	mat = sparse.csr_matrix(mat)
+	edges = np.bincount(row_labels, weights = np.diff(mat.indptr),
+						minlength = n)
+	largest = np.argmax(edges)
+	return(row_labels == largest, col_labels == largest)
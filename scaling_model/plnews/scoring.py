@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+scoring.py
+Purpose: score the ideology of followers (rows of a bipartite matrix)
+		 against the media and politician accounts of a fitted model,
+		 without refitting the model.
+
+The model is the one fitted by 'mediascores' in PL-ideo-scaling-model.R.
+The number of times user i follows account j has a negative binomial
+distribution with mean
+
+	mu_ij = exp(alpha_i + gamma_j - (theta_i - zeta_j)^2)
+
+and variance mu_ij + mu_ij^2 / omega_j, where zeta_j (ideology), gamma_j
+(popularity) and omega_j (dispersion, 'omega_domain' in mediascores) are
+the fitted account parameters, and theta_i (ideology) and alpha_i
+(activity) are the user parameters to estimate, with normal priors. With
+the account parameters fixed, the users are independent of each other, so
+'score_rows' finds the maximum a posteriori (theta_i, alpha_i) of many
+users at once: a batch of rows is taken out of the sparse matrix and all
+users in it take Fisher scoring steps together, with step halving for
+those whose posterior does not improve.
+
+The account parameters are a csv with the columns 'account', 'zeta',
+'gamma' and 'omega' (see the end of PL-ideo-scaling-model.R). The priors
+can be given in a second csv with the columns 'name' and 'value' (names as
+in DEFAULT_HYPER); anything missing keeps its default. Exports from before
+'omega' was added have no dispersion: 'read_params' refuses them unless
+asked for a Poisson model instead ('poisson'), which is not the model R
+fitted, or given one dispersion for all accounts (an 'omega' hyper).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from plnews.handles import HandleRegistry
+
+# - priors of the user parameters, and one dispersion of the negative
+#   binomial for all the accounts, for params without their own (None:
+#   see 'read_params')
+DEFAULT_HYPER = {'mu_alpha': 0.0, 'sigma_alpha': 2.0, 'mu_theta': 0.0,
+				 'sigma_theta': 1.0, 'omega': None}
+BATCH_SIZE = 20000
+MAX_ITER = 50
+TOL = 1e-6
+# - keeps exp() in range for users far from every account
+MAX_ETA = 30.0
+
+
+#==============================================================================
+# PARAMETERS
+#==============================================================================
+class AccountParams(object):
+	"""
+	The fitted parameters of the accounts (the columns of the matrix) and
+	the hyperparameters of the user parameters.
+
+	'accounts' = (list)   Account names, as in the matrix colnames
+	'zeta' = (array)      Ideology of each account
+	'gamma' = (array)     Popularity of each account
+	'omega' = (array)     Dispersion of each account (default: the 'omega'
+						  of 'hyper' for all; None for a Poisson model)
+	'hyper' = (dict)      Priors (see DEFAULT_HYPER)
+	"""
+	def __init__(self, accounts, zeta, gamma, hyper = None, omega = None):
+		self.accounts = list(accounts)
+		self.zeta = np.asarray(zeta, dtype = np.float64)
+		self.gamma = np.asarray(gamma, dtype = np.float64)
+		self.hyper = dict(DEFAULT_HYPER)
+		self.hyper.update(hyper or {})
+		if omega is None and self.hyper['omega'] is not None:
+			omega = np.full(len(self.accounts), self.hyper['omega'])
+		self.omega = None if omega is None else \
+			np.asarray(omega, dtype = np.float64)
+		if self.omega is not None and not (self.omega > 0).all():
+			raise ValueError('the dispersion (omega) of every account must '
+							 'be positive')
+		self.index = dict((x, i) for i, x in enumerate(self.accounts))
+
+	def __len__(self):
+		return(len(self.accounts))
+
+	def align(self, colnames):
+		"""
+		Returns the column of the matrix ('colnames') of each account (-1 if
+		the account is not in the matrix), and the columns of the matrix 
+		that have no fitted parameters. Handles match in any case (see
+		plnews/handles.py).
+		"""
+		cols = HandleRegistry(colnames)
+		positions = np.array([-1 if cols.get(x) is None else cols.get(x) 
+							  for x in self.accounts], dtype = np.int64)
+		accounts = HandleRegistry(self.accounts)
+		missing = [x for x in colnames if x not in accounts]
+		return(positions, missing)
+
+
+def read_params(fname, hyper_fname = None, poisson = False):
+	"""
+	Reads the account parameters exported from R, and optionally the
+	hyperparameters. Returns an AccountParams. Raises a ValueError if
+	there is no dispersion (neither an 'omega' column nor an 'omega'
+	hyperparameter), unless 'poisson' is True: the users are then scored
+	with a Poisson model.
+	"""
+	df = pd.read_csv(fname, dtype = {'account': str})
+	for col in ['account', 'zeta', 'gamma']:
+		if col not in df.columns:
+			raise ValueError('{} has no {!r} column'.format(fname, col))
+	df['account'] = [x.lstrip('@') for x in df['account']]
+	hyper = {}
+	if hyper_fname is not None:
+		hdf = pd.read_csv(hyper_fname)
+		for name, value in zip(hdf['name'], hdf['value']):
+			if name not in DEFAULT_HYPER:
+				raise ValueError('unknown hyperparameter: {}'.format(name))
+			hyper[name] = None if pd.isnull(value) else float(value)
+	omega = None
+	if 'omega' in df.columns:
+		omega = df['omega']
+		if omega.isnull().any():
+			raise ValueError('{} has accounts without omega'.format(fname))
+	elif hyper.get('omega') is None and not poisson:
+		raise ValueError(
+			'{} has no dispersion (an \'omega\' column, from '
+			'omega_domain in PL-ideo-scaling-model.R): export it with the '
+			'other account parameters, or score with a Poisson model, which '
+			'is not the model fitted in R'.format(fname))
+	return(AccountParams(df['account'], df['zeta'], df['gamma'], hyper,
+						 omega))
+
+
+#==============================================================================
+# SCORING
+#==============================================================================
+def score_rows(mat, colnames, params, batch_size = BATCH_SIZE,
+			   max_iter = MAX_ITER, tol = TOL):
+	"""
+	Returns the MAP estimates of the user parameters of each row of 'mat'
+	as a DataFrame with the columns 'theta', 'alpha', 'theta_se' (from the
+	curvature of the posterior at the estimate), 'edges' (the follows of
+	the row among the fitted accounts) and 'iterations'. Rows without any
+	such follows get NaN.
+
+	'mat' = (sparse matrix)    Users x accounts, e.g. from read_matrix
+	'colnames' = (list)        The account of each column of 'mat'
+	'params' = (AccountParams) The fitted account parameters
+	"""
+	positions, missing = params.align(colnames)
+	if np.all(positions < 0):
+		raise ValueError('none of the fitted accounts is in the matrix')
+	keep = positions >= 0
+	zeta = params.zeta[keep]
+	gamma = params.gamma[keep]
+	omega = None if params.omega is None else params.omega[keep]
+	# - a CSR matrix with the fitted accounts as columns, in their order
+	mat = sparse.csr_matrix(mat)[:, positions[keep]]
+	n = mat.shape[0]
+	out = {'theta': np.full(n, np.nan), 'alpha': np.full(n, np.nan),
+		   'theta_se': np.full(n, np.nan),
+		   'edges': np.asarray(mat.getnnz(axis = 1), dtype = np.int64),
+		   'iterations': np.zeros(n, dtype = np.int64)}
+	for start in range(0, n, batch_size):
+		end = min(start + batch_size, n)
+		rows = np.arange(start, end)[out['edges'][start:end] > 0]
+		if len(rows) == 0:
+			continue
+		y = mat[rows].toarray().astype(np.float64)
+		theta, alpha, se, iters = _map_batch(y, zeta, gamma, omega,
+											 params.hyper, max_iter, tol)
+		out['theta'][rows] = theta
+		out['alpha'][rows] = alpha
+		out['theta_se'][rows] = se
+		out['iterations'][rows] = iters
+	return(pd.DataFrame(out))
+
+
+def _map_batch(y, zeta, gamma, omega, hyper, max_iter, tol):
+	"""
+	Fisher scoring for the (theta, alpha) of every row of the dense batch
+	'y' (users x accounts), with the dispersion 'omega' of each account
+	(None for Poisson). Returns theta, alpha, the standard error of theta
+	and the number of iterations of each row.
+	"""
+	if omega is not None:
+		omega = omega[None, :]
+	prec_a = 1.0 / hyper['sigma_alpha'] ** 2
+	prec_t = 1.0 / hyper['sigma_theta'] ** 2
+	# - start from the mean ideology of the accounts followed, and the
+	#   activity that matches the number of follows there
+	total = y.sum(axis = 1)
+	theta = y.dot(zeta) / total
+	dist = (theta[:, None] - zeta[None, :]) ** 2
+	alpha = np.log(total) - np.log(np.exp(gamma[None, :] - dist).sum(axis = 1))
+	logpost = _log_posterior(y, theta, alpha, zeta, gamma, omega, hyper)
+	active = np.ones(len(theta), dtype = bool)
+	iters = np.zeros(len(theta), dtype = np.int64)
+	for it in range(max_iter):
+		idx = np.flatnonzero(active)
+		if len(idx) == 0:
+			break
+		t, a, yy = theta[idx], alpha[idx], y[idx]
+		d = t[:, None] - zeta[None, :]
+		mu = np.exp(np.minimum(a[:, None] + gamma[None, :] - d ** 2, MAX_ETA))
+		if omega is None:
+			# - Poisson: score and information per unit of the log mean
+			r = yy - mu
+			w = mu
+		else:
+			r = omega * (yy - mu) / (mu + omega)
+			w = omega * mu / (mu + omega)
+		g_a = r.sum(axis = 1) - prec_a * (a - hyper['mu_alpha'])
+		g_t = -2.0 * (r * d).sum(axis = 1) - prec_t * (t - hyper['mu_theta'])
+		i_aa = w.sum(axis = 1) + prec_a
+		i_at = -2.0 * (w * d).sum(axis = 1)
+		i_tt = 4.0 * (w * d ** 2).sum(axis = 1) + prec_t
+		det = i_aa * i_tt - i_at ** 2
+		step_a = (i_tt * g_a - i_at * g_t) / det
+		step_t = (i_aa * g_t - i_at * g_a) / det
+		# - halve the steps of the rows whose posterior gets worse
+		scale = np.ones(len(idx))
+		old = logpost[idx]
+		for _ in range(20):
+			new = _log_posterior(yy, t + scale * step_t, a + scale * step_a,
+								 zeta, gamma, omega, hyper)
+			worse = new < old - 1e-12
+			if not worse.any():
+				break
+			scale[worse] *= 0.5
+		better = ~worse
+		theta[idx[better]] = t[better] + scale[better] * step_t[better]
+		alpha[idx[better]] = a[better] + scale[better] * step_a[better]
+		logpost[idx[better]] = new[better]
+		iters[idx] += 1
+		done = (np.abs(scale * step_t) < tol) & (np.abs(scale * step_a) < tol)
+		active[idx[done | worse]] = False
+	# - standard error of theta from the inverse of the information
+	d = theta[:, None] - zeta[None, :]
+	mu = np.exp(np.minimum(alpha[:, None] + gamma[None, :] - d ** 2, MAX_ETA))
+	w = mu if omega is None else omega * mu / (mu + omega)
+	i_aa = w.sum(axis = 1) + prec_a
+	i_at = -2.0 * (w * d).sum(axis = 1)
+	i_tt = 4.0 * (w * d ** 2).sum(axis = 1) + prec_t
+	se = np.sqrt(i_aa / (i_aa * i_tt - i_at ** 2))
+	return(theta, alpha, se, iters)
+
+
+def _log_posterior(y, theta, alpha, zeta, gamma, omega, hyper):
+	"""
+	Returns the log posterior (up to a constant) of each row of 'y' at
+	(theta, alpha); 'omega' is None or a row of the dispersion of each
+	account
+	"""
+	eta = np.minimum(alpha[:, None] + gamma[None, :] -
+					 (theta[:, None] - zeta[None, :]) ** 2, MAX_ETA)
+	mu = np.exp(eta)
+	if omega is None:
+		loglik = (y * eta - mu).sum(axis = 1)
+	else:
+		loglik = (y * eta - (y + omega) * np.log(mu + omega)).sum(axis = 1)
+	prior = ((alpha - hyper['mu_alpha']) / hyper['sigma_alpha']) ** 2 + \
+		((theta - hyper['mu_theta']) / hyper['sigma_theta']) ** 2
+	return(loglik - 0.5 * prior)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+stages.py
+Purpose: time the stages of a long run (e.g. the matrix builder) and keep
+		 track of how much data each of them handles and how much memory
+		 it needs.
+
+'StageLog.stage' is a context manager around one stage. When the stage ends
+it records:
+- 'wall_time' and 'cpu_time' (secs)
+- any counters the stage added with 'Stage.add', e.g. 'rows_read' or
+  'edges_added'
+- 'peak_rss_mb': the memory high-water mark of the process during the
+  stage. On Linux the high-water mark is reset at the start of each stage
+  (through /proc/self/clear_refs); elsewhere it is the peak since the
+  process started
+- 'children_peak_rss_mb': the largest peak of the worker processes that
+  have finished so far
+
+Each record is printed as a short line and, if a file name is given,
+appended to it as one json line. With a profile directory, each stage also
+runs under cProfile and its stats are saved as '<stage>.prof' there (see
+'python -m pstats' or snakeviz). Sampling profilers such as py-spy need no
+hook: run the script under 'py-spy record'.
+"""
+
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class Stage(object):
+	"""The counters of a stage in progress"""
+	def __init__(self, name):
+		self.name = name
+		self.counters = {}
+
+	def add(self, counter, n):
+		"""Adds 'n' to 'counter' (e.g. 'rows_read')"""
+		self.counters[counter] = self.counters.get(counter, 0) + int(n)
+
+
+class StageLog(object):
+	"""
+	Records the stages of a run.
+
+	'fname' = (string)    A file to append one json line per stage to
+	'profile' = (string)  A directory where to save a cProfile of each
+						  stage
+	'info' = (dict)       Added to every record, e.g. the run label
+	"""
+	def __init__(self, fname = None, profile = None, info = None):
+		self.fname = fname
+		self.profile = profile
+		self.info = dict(info or {})
+		self.info.setdefault('started', str(datetime.now()).split('.')[0])
+		self.records = []
+		self.start = time.time()
+		if profile and not os.path.exists(profile):
+			os.makedirs(profile)
+
+	@contextmanager
+	def stage(self, name):
+		"""Times the code in the 'with' block as the stage 'name'"""
+		print(str(datetime.now()).split('.')[0])
+		stage = Stage(name)
+		_reset_peak_rss()
+		profiler = cProfile.Profile() if self.profile else None
+		wall = time.time()
+		cpu = time.process_time()
+		if profiler is not None:
+			profiler.enable()
+		try:
+			yield(stage)
+		finally:
+			if profiler is not None:
+				profiler.disable()
+				profiler.dump_stats(os.path.join(self.profile,
+												 name + '.prof'))
+			record = dict(self.info)
+			record.update({'stage': name,
+						   'wall_time': round(time.time() - wall, 3),
+						   'cpu_time': round(time.process_time() - cpu, 3)})
+			record.update(stage.counters)
+			record['peak_rss_mb'] = round(peak_rss_mb(), 1)
+			record['children_peak_rss_mb'] = round(children_peak_rss_mb(), 1)
+			self.write(record)
+			print('\t [{}] {:.2f} secs, {:.1f} MB peak{}'.format(
+				name, record['wall_time'], record['peak_rss_mb'],
+				''.join(', {} {}'.format(v, k.replace('_', ' '))
+						for k, v in stage.counters.items())))
+
+	def write(self, record):
+		self.records.append(record)
+		if self.fname:
+			with open(self.fname, 'a') as f:
+				f.write(json.dumps(record) + '\n')
+
+	def close(self):
+		"""Records the total time and peak memory of the run"""
+		record = dict(self.info)
+		record.update({'stage': 'total',
+					   'wall_time': round(time.time() - self.start, 3),
+					   'cpu_time': round(time.process_time(), 3)})
+		usage = resource.getrusage(resource.RUSAGE_SELF)
+		record['peak_rss_mb'] = round(max([_maxrss_mb(usage.ru_maxrss)] +
+			[x['peak_rss_mb'] for x in self.records]), 1)
+		record['children_peak_rss_mb'] = round(children_peak_rss_mb(), 1)
+		self.write(record)
+
+
+def _maxrss_mb(maxrss):
+	# - ru_maxrss is in kilobytes on Linux, in bytes on macOS
+	return(maxrss / (1024.0 ** 2 if sys.platform == 'darwin' else 1024.0))
+
+
+def _reset_peak_rss():
+	"""Resets the memory high-water mark of this process, where possible"""
+	try:
+		with open('/proc/self/clear_refs', 'w') as f:
+			f.write('5')
+	except (IOError, OSError):
+		pass
+
+
+def peak_rss_mb():
+	"""
+	Returns the memory high-water mark of this process (MB), since the
+	last reset if it can be reset
+	"""
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith('VmHWM:'):
+					return(int(line.split()[1]) / 1024.0)
+	except (IOError, OSError):
+		pass
+	return(_maxrss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def children_peak_rss_mb():
+	"""Returns the largest peak memory of the finished child processes"""
+	return(_maxrss_mb(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
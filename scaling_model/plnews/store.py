@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+store.py
+Purpose: read the followers of media/politician accounts either from a 
+		 directory with one csv per account, or from a single binary 
+		 follower store that can be memory-mapped.
+
+A follower store is one file made of 8-byte words (little endian):
+
+	[header][ids][index][ids][index] ...
+
+- header: the magic string 'PLFSTOR1', the byte offset of the current index
+  and the number of accounts in it
+- ids: the sorted, unique follower ids (uint64) of one or more accounts
+- index: the length of the names block in bytes, then for each account the
+  position of its first id (in words from the start of the file), its 
+  number of unique ids and its number of rows in the original csv 
+  (duplicates included), and finally the account names separated by '\n'
+
+New accounts are appended at the end of the file together with a new copy
+of the index, and the header is updated last, so an interrupted append 
+leaves the previous contents readable. Appending an account that is already
+in the store replaces it.
+"""
+
+import os
+import struct
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'PLFSTOR1'
+HEADER = struct.Struct('<8sQQQ')
+WORD = 8
+
+
+#==============================================================================
+# READERS
+#==============================================================================
+def open_followers(path):
+	"""
+	Returns a follower source for 'path': a FollowerStore if 'path' is a 
+	file, a FollowerDir if it is a directory of csv files.
+	"""
+	if os.path.isdir(path):
+		return(FollowerDir(path))
+	return(FollowerStore(path))
+
+
+def account_name(fname):
+	"""Returns the account name of a follower csv, e.g. 'a/b/TVN24.csv'"""
+	name = os.path.basename(fname)
+	return(name[:-len('.csv')] if name.endswith('.csv') else name)
+
+
+def read_follower_csv(fname):
+	"""
+	Returns the follower ids in a csv with a 'follower_id' column as an
+	array of uint64, in the order in which they appear in the file.
+	"""
+	df = pd.read_csv(fname, dtype = {'follower_id': np.uint64})
+	return(df['follower_id'].to_numpy(dtype = np.uint64))
+
+
+def count_csv_rows(fname):
+	"""
+	Returns the number of rows of a csv with one follower id per line, 
+	header excluded, without parsing it
+	"""
+	n = 0
+	last = b'\n'
+	with open(fname, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			n += chunk.count(b'\n')
+			last = chunk[-1:]
+	if last != b'\n':
+		n += 1
+	return(max(n - 1, 0))
+
+
+def count_csv_rows_parallel(fnames, workers = 1):
+	"""
+	Returns the number of rows of each csv in 'fnames', counting them in a 
+	pool of 'workers' processes if more than one
+	"""
+	if workers <= 1 or len(fnames) <= 1:
+		return([count_csv_rows(x) for x in fnames])
+	pool = Pool(workers)
+	try:
+		return(pool.map(count_csv_rows, fnames))
+	finally:
+		pool.close()
+		pool.join()
+
+
+def read_accounts(source, accounts, workers = 1):
+	"""
+	Yields (account, number of followers, sorted unique follower ids) for 
+	each of 'accounts' in 'source', in the same order as 'accounts'.
+
+	With more than one worker, the csv files of a FollowerDir are parsed in 
+	a pool of worker processes. A FollowerStore is always read in this 
+	process, since reading it means no parsing and the views are free.
+	"""
+	if workers <= 1 or not isinstance(source, FollowerDir):
+		for account in accounts:
+			n, ids = source.read(account)
+			yield((account, n, ids))
+		return
+	fnames = [source.fnames[x] for x in accounts]
+	pool = Pool(workers)
+	try:
+		results = pool.imap(_read_csv, fnames, chunksize = 1)
+		for account, fname, (n, ids) in zip(accounts, fnames, results):
+			source.bytes_read += os.path.getsize(fname)
+			yield((account, n, ids))
+	finally:
+		pool.close()
+		pool.join()
+
+
+def _read_csv(fname):
+	"""Returns the number of rows and the sorted unique ids of a csv"""
+	ids = read_follower_csv(fname)
+	return(len(ids), np.unique(ids))
+
+
+class FollowerDir(object):
+	"""
+	Follower source backed by a directory with one csv per account, as 
+	written by 'get-twitter-followers.py'. Every call parses the csv again,
+	and 'bytes_read' keeps track of the size of all the files parsed.
+	"""
+	def __init__(self, path):
+		self.path = os.path.join(path, '')
+		self.bytes_read = 0
+		self.fnames = dict((account_name(x), '{}{}'.format(self.path, x))
+						   for x in os.listdir(path) if x.endswith('.csv'))
+		self.accounts = sorted(self.fnames)
+
+	def __len__(self):
+		return(len(self.accounts))
+
+	def __contains__(self, account):
+		return(account in self.fnames)
+
+	def stat(self, account):
+		"""
+		Returns the size and modification time (ns) of the csv of 'account',
+		to tell cheaply whether it changed since an earlier run
+		"""
+		st = os.stat(self.fnames[account])
+		return([int(st.st_size), int(st.st_mtime_ns)])
+
+	def count(self, account):
+		"""Returns the number of rows in the csv of 'account'"""
+		return(self.read(account)[0])
+
+	def followers(self, account):
+		"""Returns the sorted unique follower ids (uint64) of 'account'"""
+		return(self.read(account)[1])
+
+	def read(self, account):
+		"""
+		Returns the number of rows and the sorted unique follower ids 
+		(uint64) of 'account', parsing its csv once
+		"""
+		fname = self.fnames[account]
+		ids = read_follower_csv(fname)
+		self.bytes_read += os.path.getsize(fname)
+		return(len(ids), np.unique(ids))
+
+
+class FollowerStore(object):
+	"""
+	Follower source backed by a binary follower store. The file is memory-
+	mapped and 'followers' returns read-only views into it, so nothing is
+	parsed or copied when reading an account. 'bytes_read' keeps track of
+	the size of the follower ids handed out.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.bytes_read = 0
+		self.data = np.memmap(path, dtype = '<u8', mode = 'r')
+		magic, index_offset, n, _ = HEADER.unpack(self.data[:4].tobytes())
+		if magic != MAGIC:
+			raise ValueError('{} is not a follower store'.format(path))
+		pos = index_offset // WORD
+		names_nbytes = int(self.data[pos])
+		self.starts = self.data[pos + 1:pos + 1 + n]
+		self.lengths = self.data[pos + 1 + n:pos + 1 + 2 * n]
+		self.counts = self.data[pos + 1 + 2 * n:pos + 1 + 3 * n]
+		names_start = (pos + 1 + 3 * n) * WORD
+		names = self.data.base[names_start:names_start + names_nbytes]
+		names = bytes(names).rstrip(b'\0').decode('utf-8')
+		self.accounts = [x for x in names.split('\n') if x != '']
+		self.index = dict((x, i) for i, x in enumerate(self.accounts))
+
+	def __len__(self):
+		return(len(self.accounts))
+
+	def __contains__(self, account):
+		return(account in self.index)
+
+	def stat(self, account):
+		"""
+		Returns the position, number of ids and count of 'account' in the 
+		store. Appending the account again changes its position.
+		"""
+		i = self.index[account]
+		return([int(self.starts[i]), int(self.lengths[i]), 
+				int(self.counts[i])])
+
+	def count(self, account):
+		"""Returns the number of followers of 'account' in the original csv"""
+		return(int(self.counts[self.index[account]]))
+
+	def followers(self, account):
+		"""Returns the sorted unique follower ids (uint64) of 'account'"""
+		i = self.index[account]
+		start = int(self.starts[i])
+		self.bytes_read += int(self.lengths[i]) * WORD
+		return(self.data[start:start + int(self.lengths[i])])
+
+	def read(self, account):
+		"""
+		Returns the number of followers and the sorted unique follower ids 
+		(uint64) of 'account'
+		"""
+		return(self.count(account), self.followers(account))
+
+
+#==============================================================================
+# WRITERS
+#==============================================================================
+def create_store(path):
+	"""Creates an empty follower store at 'path'"""
+	with open(path, 'wb') as f:
+		f.write(HEADER.pack(MAGIC, HEADER.size, 0, 0))
+		f.write(struct.pack('<Q', 0))
+
+
+def append_followers(path, accounts):
+	"""
+	Appends accounts to a follower store, creating the store if needed.
+
+	'path' = (string)     Path to the follower store
+	'accounts' = (list)   Tuples of (account name, follower ids, count), where
+						  'count' is the number of followers as collected,
+						  duplicates included. If None, the number of ids 
+						  is used.
+	"""
+	if not os.path.exists(path):
+		create_store(path)
+	old = FollowerStore(path)
+	entries = dict((x, (int(old.starts[i]), int(old.lengths[i]),
+						int(old.counts[i])))
+				   for i, x in enumerate(old.accounts))
+	names = list(old.accounts)
+	del(old)
+	with open(path, 'r+b') as f:
+		f.seek(0, os.SEEK_END)
+		for account, ids, count in accounts:
+			if '\n' in account:
+				raise ValueError('invalid account name: {!r}'.format(account))
+			ids = np.asarray(ids, dtype = np.uint64)
+			# - the ids read from a source are sorted and unique already
+			if np.any(ids[1:] <= ids[:-1]):
+				ids = np.unique(ids)
+			if count is None:
+				count = len(ids)
+			start = f.tell() // WORD
+			f.write(ids.astype('<u8').tobytes())
+			if account not in entries:
+				names.append(account)
+			entries[account] = (start, len(ids), count)
+		# - write the new index and point the header to it
+		index_offset = f.tell()
+		names_block = '\n'.join(names).encode('utf-8') + b'\n'
+		names_block += b'\0' * (-len(names_block) % WORD)
+		table = np.array([entries[x] for x in names], dtype = '<u8')
+		table = table.reshape(len(names), 3)
+		f.write(struct.pack('<Q', len(names_block)))
+		f.write(table.T.tobytes())
+		f.write(names_block)
+		f.flush()
+		os.fsync(f.fileno())
+		f.seek(0)
+		f.write(HEADER.pack(MAGIC, index_offset, len(names), 0))
+		f.flush()
+		os.fsync(f.fileno())
+
+
+def pack_directory(input_path, path):
+	"""
+	Packs a directory with one follower csv per account into a new follower
+	store at 'path'. Returns the number of accounts packed.
+	"""
+	source = FollowerDir(input_path)
+	create_store(path)
+	append_followers(path, _read_directory(source))
+	return(len(source))
+
+
+def _read_directory(source):
+	"""Yields (account, follower ids, count) for each csv in a FollowerDir"""
+	counter = 0
+	for account in source.accounts:
+		counter += 1
+		if (counter % 10 == 0):
+			print('\t {}/{}'.format(counter, len(source)))
+		ids = read_follower_csv(source.fnames[account])
+		yield((account, ids, len(ids)))
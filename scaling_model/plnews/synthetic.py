@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+synthetic.py
+Purpose: generate synthetic follower directories that look like the real
+		 ones (data/PL-media-followers, data/PL-politicians-followers), at
+		 any scale, to measure the pipeline without the real data.
+
+The stats of a real follower source ('follower_stats') are the number of
+followers of each account and the number of distinct followers over all
+accounts. A synthetic directory at scale 's' has the same accounts with
+'s' times as many followers each, drawn from a pool of 's' times as many
+users as there are distinct followers in the real data. Users differ in
+how many accounts they follow: user k of the pool is picked with a weight
+proportional to (k + 1)^-'exponent', so a few users follow many accounts
+(and become the intense followers of small media) and most follow one or
+two, which gives heavy-tailed degrees and overlap between accounts as in
+the real data. Media and politician directories drawn from the same pool
+(with the same seed) share followers.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from plnews.store import open_followers
+
+# - skew of the number of accounts followed by each user
+EXPONENT = 0.8
+
+
+def follower_stats(path):
+	"""
+	Returns the stats of a follower directory or store: a dict with the
+	number of followers of each account ('counts'), their total ('follows')
+	and the number of distinct followers ('users')
+	"""
+	source = open_followers(path)
+	counts = {}
+	ids = []
+	for account in sorted(source.accounts):
+		n, followers = source.read(account)
+		counts[account] = int(n)
+		ids.append(followers)
+	users = len(np.unique(np.concatenate(ids))) if len(ids) > 0 else 0
+	return({'counts': counts, 'follows': int(sum(counts.values())),
+			'users': int(users)})
+
+
+class UserPool(object):
+	"""
+	The synthetic users that accounts draw their followers from: 'ids' are
+	random Twitter-like ids and 'cumweights' the cumulative share of each
+	user in the draws
+	"""
+	def __init__(self, size, exponent = EXPONENT, seed = None):
+		rng = np.random.default_rng(seed)
+		self.ids = np.unique(rng.integers(10 ** 6, 2 ** 62, size = size,
+										  dtype = np.uint64))
+		rng.shuffle(self.ids)
+		weights = (np.arange(len(self.ids)) + 1.0) ** -exponent
+		self.cumweights = np.cumsum(weights / weights.sum())
+
+	def __len__(self):
+		return(len(self.ids))
+
+	def draw(self, n, rng):
+		"""Returns 'n' distinct users (ids), picked by their weights"""
+		n = min(n, len(self.ids))
+		picked = np.empty(0, dtype = np.int64)
+		while len(picked) < n:
+			# - draw with replacement and top up until there are n distinct
+			extra = int((n - len(picked)) * 1.2) + 16
+			draws = np.searchsorted(self.cumweights, rng.random(extra))
+			draws = np.minimum(draws, len(self.ids) - 1)
+			picked = np.concatenate((picked, draws))
+			_, first = np.unique(picked, return_index = True)
+			picked = picked[np.sort(first)]
+		return(self.ids[picked[:n]])
+
+
+def generate_followers(path, counts, pool, scale = 1.0, seed = None):
+	"""
+	Writes one follower csv per account in 'counts' (account -> number of
+	followers in the real data) to the directory 'path', with 'scale'
+	times as many followers drawn from 'pool' (a UserPool). Returns the
+	number of follower rows written.
+	"""
+	if not os.path.exists(path):
+		os.makedirs(path)
+	rng = np.random.default_rng(seed)
+	rows = 0
+	for account in sorted(counts):
+		n = max(int(round(counts[account] * scale)), 1)
+		followers = pool.draw(n, rng)
+		pd.DataFrame({'follower_id': followers}).to_csv(
+			os.path.join(path, account + '.csv'), index = False)
+		rows += len(followers)
+	return(rows)
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+twitter.py
+Purpose: collect the followers of many Twitter accounts at once, sharing a
+		 list of API keys between threads.
+
+Each key gets one long-lived client and one token bucket per endpoint. The
+buckets start full (the documented limit per 15-minute window) and are
+updated from the 'x-rate-limit-remaining' and 'x-rate-limit-reset' headers
+of every response, so a request only goes out when some key has quota left
+and threads otherwise wait until the earliest reset instead of sleeping
+blindly. The client talks to the v1.1 REST API with plain urllib and OAuth 1
+signatures; 'api_url' can point it to a local mock server (see
+plnews/mock_twitter.py).
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import pickle
+import socket
+import threading
+import time
+import uuid
+
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote, urlencode
+from urllib.request import Request, urlopen
+
+API_URL = 'https://api.twitter.com/1.1'
+# - requests per key and 15-minute window
+LIMITS = {'followers/ids': 15, 'users/show': 900}
+WINDOW = 15 * 60
+# - error codes: rate limit, key/authentication problems, and Twitter
+#   being over capacity, failing or unavailable (any 5xx status, or an
+#   answer that is not json, counts as well; see 'server_error')
+RATE_LIMITED = [88]
+KEY_ERRORS = [32, 89]
+SERVER_ERRORS = [130, 131, 503]
+# - errors about the account itself, which no retry will change: not found
+#   (code 50), suspended (code 63), and the followers of a protected
+#   account (a 401 with this message and no code; see 'user_error')
+USER_ERRORS = [50, 63]
+PROTECTED_MESSAGE = 'Not authorized.'
+# - how long to leave a key alone after an authentication error, and to
+#   wait after a server error
+KEY_COOLDOWN = 15 * 60
+SERVER_BACKOFF = 5
+# - server errors in a row after which a request is given up
+SERVER_RETRIES = 10
+PAGE_SIZE = 5000
+
+
+class TwitterError(Exception):
+	"""
+	An error returned by the API: 'code' is Twitter's error code (None if
+	there was none), 'status' the HTTP status and 'decoded' whether the
+	body of the response was json
+	"""
+	def __init__(self, code, message, status = None, headers = None,
+				 decoded = True):
+		Exception.__init__(self, '[{}] {}'.format(code, message))
+		self.code = code
+		self.message = message
+		self.status = status
+		self.headers = headers or {}
+		self.decoded = decoded
+
+
+def server_error(error):
+	"""
+	Returns True if 'error' (TwitterError) is worth retrying after a pause:
+	Twitter over capacity or failing (codes 130, 131, 503 or any 5xx
+	status), an answer that is not json (e.g. the HTML error page of a
+	proxy) or no answer at all
+	"""
+	return(error.code in SERVER_ERRORS or not error.decoded or
+		   (error.status is not None and error.status >= 500))
+
+
+def user_error(error):
+	"""
+	Returns True if 'error' (TwitterError) says that the account does not
+	exist (404), is suspended, or hides its followers (protected), so that
+	asking again will not help. Anything else may be transient.
+	"""
+	return(error.code in USER_ERRORS or
+		   (error.status == 404 and error.decoded) or
+		   (error.status == 401 and error.code is None and error.decoded
+			and error.message == PROTECTED_MESSAGE))
+
+
+#==============================================================================
+# CLIENT
+#==============================================================================
+def load_key(keys_path, key_name):
+	"""
+	Loads a key from a pickle file with a dictionary with the following
+	keys: 'consumer_key', 'consumer_secret', 'access_token' and
+	'access_token_secret'
+	"""
+	with open('%s%s' % (keys_path, key_name), 'rb') as f:
+		return(pickle.load(f))
+
+
+def _encode(x):
+	"""Percent-encodes a string as required by OAuth 1 (RFC 3986)"""
+	return(quote(str(x).encode('utf-8'), safe = '~'))
+
+
+def oauth_header(method, url, params, key):
+	"""Returns the OAuth 1 'Authorization' header for a request"""
+	oauth = {'oauth_consumer_key': key['consumer_key'],
+			 'oauth_nonce': uuid.uuid4().hex,
+			 'oauth_signature_method': 'HMAC-SHA1',
+			 'oauth_timestamp': str(int(time.time())),
+			 'oauth_token': key['access_token'],
+			 'oauth_version': '1.0'}
+	signed = sorted((_encode(k), _encode(v))
+					for k, v in list(params.items()) + list(oauth.items()))
+	base = '&'.join([method.upper(), _encode(url),
+					 _encode('&'.join('{}={}'.format(k, v) for k, v in signed))])
+	secret = '{}&{}'.format(_encode(key['consumer_secret']),
+							_encode(key['access_token_secret']))
+	digest = hmac.new(secret.encode('utf-8'), base.encode('utf-8'),
+					  hashlib.sha1).digest()
+	oauth['oauth_signature'] = base64.b64encode(digest).decode('ascii')
+	return('OAuth ' + ', '.join('{}="{}"'.format(_encode(k), _encode(v))
+								for k, v in sorted(oauth.items())))
+
+
+def load_clients(keys_path, key_names, api_url = API_URL):
+	"""
+	Loads every key in 'key_names' once and returns one TwitterClient per
+	key, to be shared by all requests of a run
+	"""
+	return([TwitterClient(x, load_key(keys_path, x), api_url)
+			for x in key_names])
+
+
+class TwitterClient(object):
+	"""
+	A client for one key. It holds the credentials and signs every request
+	with them; it keeps no connection state, so threads can share it.
+	"""
+	def __init__(self, name, key, api_url = API_URL, timeout = 60):
+		self.name = name
+		self.key = key
+		self.api_url = api_url.rstrip('/')
+		self.timeout = timeout
+
+	def get(self, endpoint, params):
+		"""
+		Sends a GET request to 'endpoint' (e.g. 'followers/ids'). Returns
+		the decoded json and the response headers (lowercased), or raises a
+		TwitterError.
+		"""
+		url = '{}/{}.json'.format(self.api_url, endpoint)
+		request = Request('{}?{}'.format(url, urlencode(params)), headers = {
+			'Authorization': oauth_header('GET', url, params, self.key)})
+		try:
+			response = urlopen(request, timeout = self.timeout)
+			headers = dict((k.lower(), v) for k, v in response.headers.items())
+			body = response.read()
+		except HTTPError as error:
+			headers = dict((k.lower(), v) for k, v in error.headers.items())
+			code, message, decoded = None, error.reason, True
+			try:
+				body = json.loads(error.read().decode('utf-8'))
+			except (ValueError, UnicodeDecodeError):
+				decoded = False
+			else:
+				try:
+					errors = body['errors']
+					code, message = errors[0]['code'], errors[0]['message']
+				except (KeyError, IndexError, TypeError):
+					if isinstance(body, dict) and 'error' in body:
+						message = body['error']
+			if code is None and error.code == 429:
+				code = RATE_LIMITED[0]
+			raise TwitterError(code, message, error.code, headers, decoded)
+		except (URLError, socket.timeout, socket.error) as error:
+			raise TwitterError(503, str(error))
+		try:
+			return(json.loads(body.decode('utf-8')), headers)
+		except (ValueError, UnicodeDecodeError):
+			raise TwitterError(None, 'the response is not json',
+							   response.status, headers, decoded = False)
+
+
+#==============================================================================
+# RATE LIMITS
+#==============================================================================
+class TokenBucket(object):
+	"""
+	The requests a key has left for one endpoint in the current window.
+	'reset' is the time (epoch seconds) when the window ends and the bucket
+	is full again.
+	"""
+	def __init__(self, limit, window = WINDOW):
+		self.limit = limit
+		self.window = window
+		self.remaining = limit
+		self.reset = 0
+
+	def available(self, now):
+		"""Returns True if a request can go out at time 'now'"""
+		if now >= self.reset and self.remaining <= 0:
+			self.remaining = self.limit
+		return(self.remaining > 0)
+
+	def take(self, now):
+		"""Uses one request; the first one opens a new window"""
+		if now >= self.reset:
+			self.remaining = self.limit
+			self.reset = now + self.window
+		self.remaining -= 1
+
+	def update(self, headers):
+		"""Updates the bucket from the rate-limit headers of a response"""
+		try:
+			remaining = int(headers['x-rate-limit-remaining'])
+			reset = float(headers['x-rate-limit-reset'])
+		except (KeyError, ValueError):
+			return
+		if 'x-rate-limit-limit' in headers:
+			self.limit = int(headers['x-rate-limit-limit'])
+		if reset != self.reset:
+			# - a new window (or the first answer after our own estimate of
+			#   it): trust the server
+			self.remaining = remaining
+		else:
+			# - the same window: requests still in flight are not counted
+			#   by the server yet
+			self.remaining = min(self.remaining, remaining)
+		self.reset = reset
+
+	def exhaust(self, now, headers = None):
+		"""Marks the bucket as empty after a rate-limit error"""
+		self.remaining = 0
+		try:
+			self.reset = float(headers['x-rate-limit-reset'])
+		except (KeyError, ValueError, TypeError):
+			self.reset = max(self.reset, now + self.window)
+
+
+class KeyScheduler(object):
+	"""
+	The pool of keys of a run, handed out to threads. 'call' waits until
+	some key has quota left for the endpoint, sends the request with that
+	key's client and deals with rate-limit, key and server errors by
+	switching key or waiting. Other errors are raised to the caller.
+
+	For each key, 'metrics' keeps the number of requests sent, rate-limit
+	and other errors, how many times a thread had to wait for it and the
+	seconds spent waiting (for quota or after server errors); see
+	'metrics_table'.
+
+	'clients' = (list)  One TwitterClient per key
+	'log' = (function)  Where to report key switches and waits
+	'backoff' = (float) Seconds to wait after a server error
+	'retries' = (int)   Server errors in a row after which a request is
+						given up (the error is raised)
+	"""
+	def __init__(self, clients, limits = LIMITS, window = WINDOW,
+				 log = print, backoff = SERVER_BACKOFF,
+				 retries = SERVER_RETRIES):
+		if len(clients) == 0:
+			raise ValueError('no keys to use')
+		self.clients = clients
+		self.limits = limits
+		self.window = window
+		self.log = log
+		self.backoff = backoff
+		self.retries = retries
+		self.buckets = {}
+		self.cooldown = dict((x.name, 0) for x in clients)
+		self.metrics = dict((x.name, {'requests': 0, 'rate_limited': 0,
+									  'errors': 0, 'waits': 0, 'slept': 0.0})
+							for x in clients)
+		self.lock = threading.Condition()
+
+	def _bucket(self, client, endpoint):
+		bucket = self.buckets.get((client.name, endpoint))
+		if bucket is None:
+			bucket = TokenBucket(self.limits.get(endpoint, 15), self.window)
+			self.buckets[(client.name, endpoint)] = bucket
+		return(bucket)
+
+	def acquire(self, endpoint):
+		"""
+		Waits until a key has a request left for 'endpoint' and returns its
+		client. Among several, picks the key with most requests left.
+		"""
+		with self.lock:
+			start = time.time()
+			while True:
+				now = time.time()
+				best = None
+				wake = now + self.window
+				for client in self.clients:
+					bucket = self._bucket(client, endpoint)
+					if self.cooldown[client.name] > now:
+						wake = min(wake, self.cooldown[client.name])
+					elif bucket.available(now):
+						if best is None or (bucket.remaining >
+								self._bucket(best, endpoint).remaining):
+							best = client
+					else:
+						wake = min(wake, bucket.reset)
+				if best is not None:
+					self._bucket(best, endpoint).take(now)
+					metrics = self.metrics[best.name]
+					metrics['requests'] += 1
+					if now > start + 0.01:
+						metrics['waits'] += 1
+						metrics['slept'] += now - start
+					return(best)
+				self.log('\t\t all keys are exhausted for {}. Waiting {} secs.'
+						 .format(endpoint, int(max(wake - now, 0)) + 1))
+				self.lock.wait(max(wake - now, 0) + 0.01)
+
+	def release(self, client, endpoint, headers = None, error = None):
+		"""Records the outcome of a request sent with 'client'"""
+		with self.lock:
+			now = time.time()
+			bucket = self._bucket(client, endpoint)
+			if error is not None and error.code in RATE_LIMITED:
+				bucket.exhaust(now, error.headers)
+				self.metrics[client.name]['rate_limited'] += 1
+			elif error is not None:
+				self.metrics[client.name]['errors'] += 1
+				# - other errors still count against the window
+				bucket.update(error.headers)
+				if error.code in KEY_ERRORS:
+					self.cooldown[client.name] = now + KEY_COOLDOWN
+			elif headers:
+				bucket.update(headers)
+			self.lock.notify_all()
+
+	def call(self, endpoint, params):
+		"""Sends a request with the first key available and returns the json"""
+		failures = 0
+		while True:
+			client = self.acquire(endpoint)
+			try:
+				result, headers = client.get(endpoint, params)
+			except TwitterError as error:
+				self.release(client, endpoint, error = error)
+				if error.code in RATE_LIMITED:
+					self.log('\t\t reached limit for key {}. Using next key'
+							 .format(client.name))
+				elif error.code in KEY_ERRORS:
+					self.log('\t\t key {} failed ({}). Using next key'
+							 .format(client.name, error))
+				elif server_error(error) and failures < self.retries:
+					failures += 1
+					self.log('\t\t server issues ({}, status {}). Sleeping {} '
+							 'secs'.format(error, error.status, self.backoff))
+					time.sleep(self.backoff)
+					with self.lock:
+						self.metrics[client.name]['slept'] += self.backoff
+				else:
+					raise
+				continue
+			self.release(client, endpoint, headers = headers)
+			return(result)
+
+	def metrics_table(self):
+		"""
+		Returns one dictionary per key with its metrics, the requests it has
+		left for each endpoint used and the seconds left of its cooldown
+		"""
+		with self.lock:
+			now = time.time()
+			table = []
+			for client in self.clients:
+				row = {'key': client.name}
+				row.update(self.metrics[client.name])
+				row['slept'] = round(row['slept'], 1)
+				for (name, endpoint), bucket in sorted(self.buckets.items()):
+					if name == client.name:
+						remaining = bucket.remaining
+						if now >= bucket.reset:
+							remaining = bucket.limit
+						row['{} remaining'.format(endpoint)] = remaining
+				row['cooldown'] = round(max(self.cooldown[client.name] - now,
+											0), 1)
+				table.append(row)
+			return(table)
+
+
+#==============================================================================
+# COLLECTION
+#==============================================================================
+def get_user(scheduler, user):
+	"""
+	Returns the profile of a screen name, or None if it does not exist (or
+	is suspended). Any other error is raised: it says nothing about the
+	account.
+	"""
+	try:
+		return(scheduler.call('users/show', {'screen_name': user}))
+	except TwitterError as error:
+		if not user_error(error):
+			raise
+		scheduler.log('\t\t {}: {}'.format(user, error))
+		return(None)
+
+
+def iter_follower_pages(scheduler, user, cursor = -1):
+	"""
+	Yields the follower ids (strings) of a screen name one page (up to
+	5,000 ids) at a time, with the cursor of the next page (0 after the
+	last page).
+
+	'cursor' = (int)  Where to start; -1 for the first page, or the
+					  'next_cursor' of the last page collected
+	The pages end when the last one has been yielded, or earlier if the
+	followers of the user cannot be seen any more (a protected, suspended
+	or deleted account; see 'user_error'). Any other error is raised, so
+	that a list cut short by a failure is never taken for a complete one.
+	"""
+	while cursor != 0:
+		try:
+			page = scheduler.call('followers/ids', {
+				'screen_name': user, 'cursor': cursor, 'count': PAGE_SIZE,
+				'stringify_ids': 'true'})
+		except TwitterError as error:
+			if not user_error(error):
+				raise
+			scheduler.log('\t\t {}: {}'.format(user, error))
+			return
+		cursor = int(page['next_cursor'])
+		yield([str(x) for x in page['ids']], cursor)
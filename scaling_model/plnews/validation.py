@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+validation.py
+Purpose: the checks of PL-ideo-scaling-validation.R on the fitted ideology
+		 scores of the media and politician accounts, with sparse matrix
+		 operations instead of per-group loops:
+
+[A] Politician scores: how well the scores of the politicians separate
+	their parties ('party_separation'): the mean, median and spread of each
+	party, the share of the variance of the scores between parties (eta
+	squared) and, for each pair of parties, the probability that a member of
+	the first one scores left of a member of the second (AUC).
+
+[B] User exposure: the mean survey ideology of the visitors of each news
+	domain in a browsing panel ('visitor_ideology'), to correlate with the
+	score of its Twitter account ('compare_domains'). The panel (one row per
+	user and host, as in pl_domain_visits_per_user.csv) becomes a sparse
+	users x domains matrix V, and the mean, standard deviation and standard
+	error of every domain come from three products of V' with vectors over
+	the users (1, ideology and ideology^2), whatever the number of rows.
+	Hosts are matched to the listed domains as in plnews/domains.py, so
+	'www.', mobile and other subdomains count for their domain.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+
+from plnews.domains import Domain, DomainIndex, normalize_host
+from plnews.handles import HandleRegistry, normalize
+
+# - parties with fewer scored politicians are left out of the comparisons
+MIN_PARTY = 2
+
+
+#==============================================================================
+# SCORES
+#==============================================================================
+def read_scores(fname):
+	"""
+	Reads the scores of the accounts: a csv with the columns 'account' and
+	'zeta' (e.g. PL-account-params_03.csv, or the accounts csv of
+	bootstrap-scores.py) and optionally 'zeta_lower' and 'zeta_upper'
+	"""
+	df = pd.read_csv(fname, dtype = {'account': str})
+	for col in ['account', 'zeta']:
+		if col not in df.columns:
+			raise ValueError('{} has no {!r} column'.format(fname, col))
+	cols = [x for x in ['account', 'zeta', 'zeta_lower', 'zeta_upper']
+			if x in df.columns]
+	return(df[cols])
+
+
+def account_table(colnames, followers, scores, media, pols):
+	"""
+	Returns one row per column of the matrix with its 'account', 'type'
+	('media', 'politician' or None if in neither list), number of
+	'followers' in the matrix and the columns of 'scores' (NaN for accounts
+	without a score). Handles match in any case (see plnews/handles.py).
+
+	'colnames' = (list)         The account of each column of the matrix
+	'followers' = (array)       The number of followers of each column
+	'scores' = (DataFrame)      From 'read_scores'
+	'media', 'pols' = (HandleRegistry)  The handles of the media and
+								politician accounts (see 'read_handles')
+	"""
+	scored = HandleRegistry(scores['account'])
+	rows = [scored.get(x) for x in colnames]
+	out = pd.DataFrame({'account': list(colnames)})
+	out['type'] = ['politician' if x in pols else 'media' if x in media
+				   else None for x in colnames]
+	out['followers'] = np.asarray(followers, dtype = np.int64)
+	for col in scores.columns[1:]:
+		values = scores[col].to_numpy(dtype = np.float64)
+		out[col] = [np.nan if i is None else values[i] for i in rows]
+	return(out)
+
+
+#==============================================================================
+# [A] POLITICIANS
+#==============================================================================
+def party_separation(accounts, politicians, min_party = MIN_PARTY):
+	"""
+	Returns the stats of each party (DataFrame), the AUC of each pair of
+	parties (DataFrame) and the eta squared of the scores by party.
+
+	'accounts' = (DataFrame)     From 'account_table'
+	'politicians' = (DataFrame)  PL-politicians-twitter.csv: 'twitter',
+								 'party' and any other columns
+	"""
+	pols = politicians.dropna(subset = ['twitter', 'party'])
+	party = dict((normalize(x), y) for x, y in zip(pols['twitter'],
+												   pols['party']))
+	df = accounts[accounts['type'] == 'politician'].dropna(subset = ['zeta'])
+	df = df.assign(party = [party.get(normalize(x)) for x in df['account']])
+	df = df.dropna(subset = ['party'])
+	sizes = df['party'].value_counts()
+	df = df[df['party'].isin(sizes.index[sizes >= min_party])]
+	groups = df.groupby('party')['zeta']
+	parties = pd.DataFrame({'n': groups.size(), 'mean': groups.mean(),
+							'median': groups.median(), 'sd': groups.std(),
+							'min': groups.min(), 'max': groups.max()})
+	parties = parties.sort_values('mean').reset_index()
+	# - share of the variance between parties
+	total = ((df['zeta'] - df['zeta'].mean()) ** 2).sum()
+	between = (parties['n'] * (parties['mean'] - df['zeta'].mean()) ** 2).sum()
+	eta_squared = between / total if total > 0 else np.nan
+	# - AUC from the ranks of each pair of parties together (Mann-Whitney)
+	pairs = []
+	names = list(parties['party'])
+	values = dict((x, y.to_numpy()) for x, y in groups)
+	for i, a in enumerate(names):
+		for b in names[i + 1:]:
+			x, y = values[a], values[b]
+			ranks = stats.rankdata(np.concatenate((x, y)))
+			u = ranks[len(x):].sum() - len(y) * (len(y) + 1) / 2.0
+			pairs.append({'party_a': a, 'party_b': b, 'n_a': len(x),
+						  'n_b': len(y), 'mean_diff': y.mean() - x.mean(),
+						  'auc': u / (len(x) * len(y))})
+	pairs = pd.DataFrame(pairs, columns = ['party_a', 'party_b', 'n_a', 'n_b',
+										   'mean_diff', 'auc'])
+	return(parties, pairs, eta_squared)
+
+
+#==============================================================================
+# [B] VISITORS
+#==============================================================================
+def domain_index(domains):
+	"""Returns a DomainIndex of a list of domains, to match hosts with"""
+	return(DomainIndex([Domain(x, None, None, None, None, None)
+						for x in domains]))
+
+
+def visit_matrix(users, hosts, index, counts = None):
+	"""
+	Returns the sparse users x domains matrix of a browsing panel, the
+	user of each row and the domain of each column. Hosts that are not on
+	a domain of 'index' (a DomainIndex) are left out. Each host is looked
+	up once, however many rows it has.
+
+	'users', 'hosts' = (array)  The user and the host of each row
+	'counts' = (array)          The visits of each row (default: 1 each).
+								A user with several rows for the same
+								domain gets their sum.
+	"""
+	user_codes, user_ids = pd.factorize(pd.Series(users), sort = False)
+	host_codes, host_names = pd.factorize(pd.Series(hosts), sort = False)
+	matched = [index.lookup_host(normalize_host(str(x))) for x in host_names]
+	# - hosts listed with paths cannot be matched without the urls
+	matched = [x if isinstance(x, Domain) else None for x in matched]
+	domains = {}
+	host_domain = np.array([-1 if x is None else
+							domains.setdefault(x.domain, len(domains))
+							for x in matched] + [-1], dtype = np.int64)
+	cols = host_domain[host_codes]
+	keep = (cols >= 0) & (user_codes >= 0)
+	values = np.ones(len(cols)) if counts is None else \
+		np.asarray(counts, dtype = np.float64)
+	mat = sparse.csr_matrix((values[keep], (user_codes[keep], cols[keep])),
+							shape = (len(user_ids), len(domains)))
+	mat.sum_duplicates()
+	return(mat, np.asarray(user_ids), list(domains))
+
+
+def visitor_ideology(visits, user_ids, domains, ideology, weight = 'visitors'):
+	"""
+	Returns the 'mean', 'sd' and 'se' of the ideology of the visitors of
+	each domain, and their number ('n'), from the visit matrix (see
+	'visit_matrix').
+
+	'ideology' = (Series)  The ideology of each user, by user id. Users
+						   without one are left out.
+	'weight' = (string)    'visitors' counts each visitor of a domain once,
+						   as PL-ideo-scaling-validation.R does; 'visits'
+						   weights them by their number of visits
+	"""
+	x = pd.Series(ideology).reindex(user_ids).to_numpy(dtype = np.float64)
+	known = ~np.isnan(x)
+	v = visits[known]
+	x = x[known]
+	if weight == 'visitors':
+		v = v.copy()
+		v.data[:] = 1
+	elif weight != 'visits':
+		raise ValueError('unknown weight: {}'.format(weight))
+	# - one sparse product for the sums of the weights, the ideology and the
+	#   squared ideology of the visitors of every domain
+	sums = v.T.dot(np.column_stack((np.ones(len(x)), x, x ** 2)))
+	w, s1, s2 = sums[:, 0], sums[:, 1], sums[:, 2]
+	n = np.asarray((v > 0).sum(axis = 0)).ravel()
+	with np.errstate(invalid = 'ignore', divide = 'ignore'):
+		mean = s1 / w
+		var = (s2 - w * mean ** 2) / (w - 1)
+		sd = np.sqrt(np.maximum(var, 0))
+		se = sd / np.sqrt(n)
+	return(pd.DataFrame({'domain': domains, 'n': n, 'mean': mean, 'sd': sd,
+						 'se': se}))
+
+
+def compare_domains(visitors, accounts, handles):
+	"""
+	Joins the ideology of the visitors of each domain (from
+	'visitor_ideology') to the score of its Twitter account, and returns
+	the joined table and the Pearson and Spearman correlations between
+	'mean' and 'zeta'.
+
+	'accounts' = (DataFrame)  From 'account_table'
+	'handles' = (DataFrame)   PL-domains-twitter.csv: 'domain', 'twitter'
+	"""
+	handles = handles.dropna(subset = ['domain', 'twitter'])
+	handle = dict(zip(handles['domain'], handles['twitter']))
+	scored = HandleRegistry(accounts['account'])
+	out = visitors.assign(twitter = [handle.get(x) for x in
+									 visitors['domain']])
+	rows = [scored.get(x) for x in out['twitter']]
+	for col in accounts.columns:
+		if col.startswith('zeta'):
+			values = accounts[col].to_numpy(dtype = np.float64)
+			out[col] = [np.nan if i is None else values[i] for i in rows]
+	both = out.dropna(subset = ['mean', 'zeta'])
+	both = both[both['n'] > 1]
+	if len(both) < 3:
+		return(out, {'domains': len(both), 'pearson': np.nan,
+					 'spearman': np.nan})
+	return(out, {'domains': len(both),
+				 'pearson': stats.pearsonr(both['mean'], both['zeta'])[0],
+				 'spearman': stats.spearmanr(both['mean'],
+											 both['zeta'])[0]})
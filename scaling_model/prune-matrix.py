@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+prune-matrix.py
+Purpose: drop the followers with few follows and the accounts with few
+         followers from a bipartite matrix, on the sparse matrix and until
+         every row and column left is above its threshold, and save the
+         pruned matrix for PL-ideo-scaling-model.R, which then only has to
+         make the pruned matrix dense. See plnews/pruning.py.
+
+The pruned matrix is saved under the run label --output-run (default
+'<run>-pruned', e.g. 'PL-indices-3-pruned.txt'), with a json report of the
+thresholds and of what each round dropped
+('<country>-pruning-<output-run>.json'). The rows and columns keep their
+order.
+
+Parameters:
+    [REQUIRED] --input:       The directory with the matrix (text or binary
+                                files, as written by the matrix builder)
+    [REQUIRED] --run:         The run label in the matrix file names
+    [REQUIRED] --country:     The country prefix in the matrix file names
+    [OPTIONAL] --output:      The directory where to save the pruned matrix
+                                (default: --input)
+    [OPTIONAL] --output-run:  The run label of the pruned matrix (default:
+                                '<run>-pruned')
+    [OPTIONAL] --min-edges:   Keep the followers with more follows than this
+                                (default 50, as in the R script)
+    [OPTIONAL] --min-media:   Keep the media accounts with more followers
+                                than this (default 0; 30 in the alternative
+                                models of the R script)
+    [OPTIONAL] --min-pol:     Keep the politician accounts with more
+                                followers than this (default 0; 225 in the
+                                alternative models of the R script)
+    [OPTIONAL] --pol:         The handles of the politicians (default:
+                                data/PL-politicians-twitter.csv). The other
+                                columns are media accounts.
+    [OPTIONAL] --largest-component: Keep only the largest connected
+                                component of the pruned matrix
+    [OPTIONAL] --format:      'text' (default), 'binary' or 'both', as in
+                                the matrix builder
+
+Example:
+python prune-matrix.py \
+    --input data/PL-graph/ \
+    --run 3 \
+    --country PL \
+    --min-edges 50 \
+    --min-media 30 \
+    --min-pol 225
+"""
+
+#==============================================================================
+# MODULES -- DEPENDENCIES
+#==============================================================================
+import argparse
+import json
+import os
+import time
+import numpy as np
+from plnews.handles import read_handles
+from plnews.matrix import matrix_file, read_matrix, write_matrix
+from plnews.pruning import components, largest_component, prune
+
+#==============================================================================
+# COMMAND LINE ARGUMENTS
+#==============================================================================
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--input',
+                        help='the directory with the matrix',
+                        required = True)
+    parser.add_argument('--run',
+                        help='the run label in the matrix file names',
+                        required = True)
+    parser.add_argument('--country',
+                        help='the country prefix in the matrix file names',
+                        required = True)
+    parser.add_argument('--output',
+                        help='the directory where to save the pruned matrix',
+                        required = False)
+    parser.add_argument('--output-run',
+                        help='the run label of the pruned matrix',
+                        required = False)
+    parser.add_argument('--min-edges',
+                        help='keep the followers with more follows than this',
+                        type = int,
+                        default = 50)
+    parser.add_argument('--min-media',
+                        help='keep the media accounts with more followers',
+                        type = int,
+                        default = 0)
+    parser.add_argument('--min-pol',
+                        help='keep the politicians with more followers',
+                        type = int,
+                        default = 0)
+    parser.add_argument('--pol',
+                        help='the handles of the politicians',
+                        default = 'data/PL-politicians-twitter.csv')
+    parser.add_argument('--largest-component',
+                        help='keep only the largest connected component',
+                        action = 'store_true')
+    parser.add_argument('--format',
+                        help='the output format: text, binary or both',
+                        choices = ['text', 'binary', 'both'],
+                        default = 'text')
+    return(parser.parse_args(argv))
+
+#==============================================================================
+# MAIN
+#==============================================================================
+def main(args):
+    run_number = str(args.run)
+    output_path = os.path.join(args.output if args.output else args.input,
+                               '')
+    output_run = args.output_run if args.output_run else \
+        run_number + '-pruned'
+    mat, rownames, colnames = read_matrix(args.input, args.country,
+                                          run_number)
+    print('{} x {} matrix, {} edges'.format(mat.shape[0], mat.shape[1],
+                                            mat.nnz))
+    pols = read_handles(args.pol)
+    is_pol = np.array([x in pols for x in colnames], dtype = bool)
+    min_col = np.where(is_pol, args.min_pol, args.min_media)
+    print('{} media and {} politician accounts'.format(
+        (~is_pol).sum(), is_pol.sum()))
+
+    start = time.time()
+    rows, cols, rounds = prune(mat, args.min_edges, min_col)
+    for x in rounds:
+        print('\t round {round}: {rows} x {cols}, {edges} edges'.format(**x))
+    print('Pruned in {} rounds, {:.2f} secs'.format(len(rounds),
+                                                   time.time() - start))
+    pruned = mat.tocsr()[rows][:, cols]
+    if pruned.nnz == 0:
+        raise ValueError('nothing is left with these thresholds')
+
+    # - accounts scored in separate components are not on a common scale
+    n, row_labels, col_labels = components(pruned)
+    print('{} connected component(s)'.format(n))
+    if n > 1:
+        sizes = np.bincount(col_labels, minlength = n)
+        print('\t accounts in each component: {}'.format(
+            ', '.join(str(x) for x in sorted(sizes, reverse = True))))
+        if args.largest_component:
+            keep_rows, keep_cols = largest_component(pruned)
+            rows[rows] = keep_rows
+            cols[cols] = keep_cols
+            pruned = pruned[keep_rows][:, keep_cols]
+            print('Kept the largest component: {} x {}, {} edges'.format(
+                pruned.shape[0], pruned.shape[1], pruned.nnz))
+        else:
+            print('WARNING: the scores of accounts in different components '
+                  'are not comparable (see --largest-component)')
+    # - the R script anchors the model on the first and last columns
+    if not (cols[0] and cols[-1]):
+        print('WARNING: the first or last column was pruned, so the model '
+              'is anchored on other accounts')
+    dropped = [x for x, keep in zip(colnames, cols) if not keep]
+    if dropped:
+        print('Dropped {} accounts: {}'.format(len(dropped),
+                                               ', '.join(dropped)))
+
+    rownames = [x for x, keep in zip(rownames, rows) if keep]
+    colnames = [x for x, keep in zip(colnames, cols) if keep]
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    write_matrix(output_path, args.country, output_run, pruned, rownames,
+                 colnames, args.format)
+    write_report(matrix_file(output_path, args.country, output_run,
+                             'pruning', 'json'),
+                 args, rounds, n, dropped, pruned.shape, mat.shape)
+    print('Saved the {} x {} matrix as run {} in {}'.format(
+        pruned.shape[0], pruned.shape[1], output_run, output_path))
+
+
+#==============================================================================
+# FUNCTIONS
+#==============================================================================
+def write_report(fname, args, rounds, n_components, dropped, shape,
+                 input_shape):
+    """
+    Saves to 'fname' the thresholds in 'args' and what each round of the
+    pruning left
+    """
+    report = {'input': {'run': str(args.run), 'shape': list(input_shape)},
+              'min_edges': args.min_edges, 'min_media': args.min_media,
+              'min_pol': args.min_pol,
+              'largest_component': args.largest_component,
+              'rounds': rounds, 'components': int(n_components),
+              'dropped_accounts': dropped, 'shape': list(shape)}
+    with open(fname, 'w') as f:
+        json.dump(report, f, indent = 1)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+score-followers.py
+Purpose: estimate the ideology of the followers in a bipartite matrix from 
+		 the media and politician parameters of a model fitted in R 
+		 (PL-ideo-scaling-model.R), without refitting the model. See 
+		 plnews/scoring.py for the model and the estimator.
+
+Parameters: 
+    [REQUIRED] --params:     A csv with the fitted account parameters 
+                               ('account', 'zeta', 'gamma', 'omega')
+    [REQUIRED] --input:      The directory with the matrix (text or binary
+                               files, as written by the matrix builder)
+    [REQUIRED] --run:        The run label in the matrix file names
+    [REQUIRED] --country:    The country prefix in the matrix file names
+    [REQUIRED] --output:     A csv where to write the score of each follower
+    [OPTIONAL] --hyper:      A csv with the priors of the users ('name',
+                               'value')
+    [OPTIONAL] --poisson:    Score with a Poisson model if --params has no
+                               dispersion ('omega'), as exported before it
+                               was added; otherwise such params are refused
+    [OPTIONAL] --batch-size: Number of followers scored at the same time
+                               (default 20000)
+
+Example:
+python score-followers.py \
+    --params data/PL-account-params_03.csv \
+    --hyper data/PL-model-hyper_03.csv \
+    --input data/PL-graph/ \
+    --run 3 \
+    --country PL \
+    --output data/PL-follower-scores-3.csv
+"""
+
+#==============================================================================    
+# MODULES -- DEPENDENCIES
+#==============================================================================
+import argparse
+import time
+from plnews.matrix import read_matrix
+from plnews.scoring import BATCH_SIZE, read_params, score_rows
+
+#==============================================================================    
+# COMMAND LINE ARGUMENTS
+#==============================================================================
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--params', 
+                        help='a csv with the fitted account parameters',
+                        required = True)
+    parser.add_argument('--input', 
+                        help='the directory with the matrix',
+                        required = True)
+    parser.add_argument('--run', 
+                        help='the run label in the matrix file names',
+                        required = True)
+    parser.add_argument('--country', 
+                        help='the country prefix in the matrix file names',
+                        required = True)
+    parser.add_argument('--output', 
+                        help='a csv where to write the follower scores',
+                        required = True)
+    parser.add_argument('--hyper', 
+                        help='a csv with the priors of the users',
+                        required = False)
+    parser.add_argument('--poisson',
+                        help='a Poisson model if the params have no omega',
+                        action = 'store_true')
+    parser.add_argument('--batch-size', 
+                        help='number of followers scored at the same time',
+                        type = int,
+                        default = BATCH_SIZE)
+    return(parser.parse_args(argv))
+
+#==============================================================================    
+# MAIN
+#==============================================================================
+def main(args):
+    params = read_params(args.params, args.hyper, poisson = args.poisson)
+    mat, rownames, colnames = read_matrix(args.input, args.country, 
+                                          str(args.run))
+    positions, missing = params.align(colnames)
+    print('{} x {} matrix; {} of {} fitted accounts in it'.format(
+        mat.shape[0], mat.shape[1], (positions >= 0).sum(), len(params)))
+    if len(missing) > 0:
+        print('{} columns without fitted parameters are left out'.format(
+            len(missing)))
+    start = time.time()
+    scores = score_rows(mat, colnames, params, batch_size = args.batch_size)
+    elapsed = time.time() - start
+    scores.insert(0, 'follower_id', rownames)
+    scores.to_csv(args.output, index = False)
+    scored = scores['theta'].notnull().sum()
+    print('Scored {} followers in {:.1f} secs ({:.0f} per minute)'.format(
+        scored, elapsed, scored / max(elapsed, 1e-9) * 60))
+
+
+if __name__ == "__main__":
+    main(parse_args())
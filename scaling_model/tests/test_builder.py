@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Tests of build-bipartite-matrix-media-politician-followers.py"""
+
+import json
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import plnews.store
+from plnews.cli import load_script
+from plnews.stages import StageLog
+from plnews.store import open_followers
+
+builder = load_script('build')
+
+# - small media have 20 to 60 followers, big media 300 and more
+PARAMS = {'min_followers': 10, 'thres': 150, 'min_degree': 2,
+		  'sample_size': 20}
+
+
+def write_followers(path, sizes, rng):
+	os.makedirs(str(path))
+	for account, n in sizes.items():
+		ids = rng.integers(1, 300, n)
+		with open(str(path / (account + '.csv')), 'w') as f:
+			f.write('follower_id\n')
+			f.write(''.join('{}\n'.format(x) for x in ids))
+	return(str(path))
+
+
+@pytest.fixture
+def followers(tmp_path):
+	rng = np.random.default_rng(1)
+	media = dict(('small{}'.format(i), 20 + 8 * i) for i in range(6))
+	media.update({'big1': 300, 'big2': 450, 'tiny': 5})
+	pols = {'pol1': 40, 'pol2': 80, 'pol3': 8}
+	return(write_followers(tmp_path / 'media', media, rng),
+		   write_followers(tmp_path / 'pols', pols, rng))
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+	"""Counts how many times each follower csv is parsed"""
+	counts = Counter()
+	read_follower_csv = plnews.store.read_follower_csv
+	def counting(fname):
+		counts[fname] += 1
+		return(read_follower_csv(fname))
+	monkeypatch.setattr(plnews.store, 'read_follower_csv', counting)
+	return(counts)
+
+
+def test_full_build_parses_each_file_once(followers, parsed, tmp_path):
+	media_source = open_followers(followers[0])
+	pol_source = open_followers(followers[1])
+	params = builder.build_params(1, **PARAMS)
+	mat, rownames, colnames, manifest = builder.build_full(
+		media_source, pol_source, params, StageLog(), tmp_path = str(tmp_path))
+	fnames = list(media_source.fnames.values()) + \
+		list(pol_source.fnames.values())
+	assert sorted(parsed) == sorted(fnames)
+	assert set(parsed.values()) == {1}
+	assert media_source.bytes_read + pol_source.bytes_read == \
+		sum(os.path.getsize(x) for x in fnames)
+	assert mat.shape == (len(rownames), len(colnames))
+	assert 'tiny' not in colnames and 'pol3' not in colnames
+	assert mat.nnz > 0
+	# - nothing is left in the temporary directory
+	assert sorted(os.listdir(str(tmp_path))) == ['media', 'pols']
+
+
+def test_batch_reads_accounts_once(followers, parsed, tmp_path):
+	# - 4 variants of the same followers: each file is parsed once for the
+	#   batch, not once for each variant
+	config = str(tmp_path / 'grid.json')
+	with open(config, 'w') as f:
+		json.dump({'grid': {'thres': [100, 150], 'min_degree': [1, 2],
+						   'min_followers': [10], 'sample_size': [20]}}, f)
+	output = str(tmp_path / 'out')
+	os.makedirs(output)
+	args = ['--output', output, '--config', config, '--country', 'PL',
+			'--media', followers[0], '--pol', followers[1], '--seed', '1',
+			'--tmpdir', str(tmp_path)]
+	builder.main(builder.parse_args(args))
+	assert len(parsed) == 12
+	assert set(parsed.values()) == {1}
+	colnames = [x for x in os.listdir(output) if '-colnames-' in x]
+	assert len(colnames) == 4
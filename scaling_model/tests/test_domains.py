@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Tests of plnews/domains.py"""
+
+from plnews.domains import load_index
+
+
+def write(path, name, text):
+	fname = str(path / name)
+	with open(fname, 'w') as f:
+		f.write(text)
+	return(fname)
+
+
+def test_accounts_only_domain(tmp_path):
+	# - fakty.tvn24.pl has accounts but no ideology: its URLs must not be
+	#   taken for those of tvn24.pl
+	domains = write(tmp_path, 'domains.csv',
+					'domain,ideology,ideology_lower,ideology_upper\n'
+					'tvn24.pl,-0.5,-0.6,-0.4\n')
+	twitter = write(tmp_path, 'twitter.csv', 'domain,twitter_handle\n'
+					'tvn24.pl,tvn24\nfakty.tvn24.pl,FaktyTVN\n')
+	facebook = write(tmp_path, 'facebook.csv', 'domain,facebook_page\n'
+					 'fakty.tvn24.pl,Fakty.TVN\n')
+	index = load_index(domains, twitter, facebook)
+	record = index.lookup('https://fakty.tvn24.pl/wiadomosci/1')
+	assert record.domain == 'fakty.tvn24.pl'
+	assert record.ideology is None
+	assert record.twitter_handle == 'FaktyTVN'
+	assert record.facebook_page == 'Fakty.TVN'
+	record = index.lookup('https://www.tvn24.pl/polska/2')
+	assert record.domain == 'tvn24.pl'
+	assert record.ideology == -0.5
+	assert record.facebook_page is None
+	assert list(index.annotate(['//fakty.tvn24.pl/x']))[0].domain == \
+		'fakty.tvn24.pl'
+
+
+def test_bundled_lists():
+	index = load_index()
+	record = index.lookup('https://fakty.tvn24.pl/x')
+	assert record.domain == 'fakty.tvn24.pl'
+	assert record.ideology is None
+	assert index.lookup('https://tvn24.pl/x').domain == 'tvn24.pl'
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+validate-scores.py
+Purpose: the checks of PL-ideo-scaling-validation.R on the ideology scores
+         of the accounts in a bipartite matrix: [A] how well they separate
+         the parties of the politicians and [B] how they correlate with the
+         mean survey ideology of the visitors of each news domain in a
+         browsing panel. See plnews/validation.py.
+
+Saves, named after --country and --run in the --output directory:
+- <country>-validation-accounts-<run>.csv: every column of the matrix, with
+  its type (media or politician), followers and score
+- <country>-validation-parties-<run>.csv: the scores of each party
+- <country>-validation-party-pairs-<run>.csv: the AUC of each pair of
+  parties
+- <country>-validation-domains-<run>.csv: with --visits, the ideology of the
+  visitors of each domain next to the score of its account
+
+Parameters:
+    [REQUIRED] --input:       The directory with the matrix (text or binary
+                                files, as written by the matrix builder)
+    [REQUIRED] --run:         The run label in the matrix file names
+    [REQUIRED] --country:     The country prefix in the matrix file names
+    [REQUIRED] --scores:      A csv with the scores of the accounts ('account',
+                                'zeta'; e.g. PL-account-params_03.csv or the
+                                --accounts output of bootstrap-scores.py)
+    [REQUIRED] --output:      The directory where to save the results
+    [OPTIONAL] --media:       The handles of the media accounts ('domain',
+                                'twitter'; default:
+                                data/PL-domains-twitter.csv)
+    [OPTIONAL] --pol:         The handles and parties of the politicians
+                                (default: data/PL-politicians-twitter.csv)
+    [OPTIONAL] --visits:      A csv with one row per user and host of a
+                                browsing panel, e.g.
+                                pl_domain_visits_per_user.csv
+    [OPTIONAL] --survey:      A csv with the ideology of the users of the
+                                panel (required with --visits)
+    [OPTIONAL] --user-col:    The user column of --visits (default id_txt)
+    [OPTIONAL] --host-col:    The host column of --visits (default url_host)
+    [OPTIONAL] --count-col:   A column of --visits with the number of visits
+                                of each row (default: none)
+    [OPTIONAL] --survey-id:   The user column of --survey (default
+                                external_id)
+    [OPTIONAL] --ideology-col: The ideology column of --survey (default
+                                ideology)
+    [OPTIONAL] --standardize: Standardize the survey ideology first, as
+                                scale() in the R script
+    [OPTIONAL] --weight:      'visitors' (default) counts each visitor of a
+                                domain once, as the R script; 'visits'
+                                weights them by their visits (--count-col)
+
+Example:
+python validate-scores.py \
+    --input data/PL-graph/ \
+    --run 3 \
+    --country PL \
+    --scores data/PL-account-params_03.csv \
+    --visits data/pl_domain_visits_per_user.csv \
+    --survey data/PL-survey-ideology.csv \
+    --standardize \
+    --output data/PL-validation/
+"""
+
+#==============================================================================
+# MODULES -- DEPENDENCIES
+#==============================================================================
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from plnews.handles import read_handles
+from plnews.matrix import matrix_file, read_matrix
+from plnews.validation import (account_table, compare_domains, domain_index,
+                               party_separation, read_scores, visit_matrix,
+                               visitor_ideology)
+
+#==============================================================================
+# COMMAND LINE ARGUMENTS
+#==============================================================================
+def parse_args(argv = None, prog = None):
+    """
+    Returns the arguments in 'argv' (default: the command line), with 'prog'
+    as the name of the command in the usage (default: the script)
+    """
+    parser = argparse.ArgumentParser(prog = prog)
+    parser.add_argument('--input',
+                        help='the directory with the matrix',
+                        required = True)
+    parser.add_argument('--run',
+                        help='the run label in the matrix file names',
+                        required = True)
+    parser.add_argument('--country',
+                        help='the country prefix in the matrix file names',
+                        required = True)
+    parser.add_argument('--scores',
+                        help='a csv with the scores of the accounts',
+                        required = True)
+    parser.add_argument('--output',
+                        help='the directory where to save the results',
+                        required = True)
+    parser.add_argument('--media',
+                        help='the handles of the media accounts',
+                        default = 'data/PL-domains-twitter.csv')
+    parser.add_argument('--pol',
+                        help='the handles and parties of the politicians',
+                        default = 'data/PL-politicians-twitter.csv')
+    parser.add_argument('--visits',
+                        help='a csv with the hosts visited by each user',
+                        required = False)
+    parser.add_argument('--survey',
+                        help='a csv with the ideology of each user',
+                        required = False)
+    parser.add_argument('--user-col',
+                        help='the user column of --visits',
+                        default = 'id_txt')
+    parser.add_argument('--host-col',
+                        help='the host column of --visits',
+                        default = 'url_host')
+    parser.add_argument('--count-col',
+                        help='a column of --visits with the number of visits',
+                        required = False)
+    parser.add_argument('--survey-id',
+                        help='the user column of --survey',
+                        default = 'external_id')
+    parser.add_argument('--ideology-col',
+                        help='the ideology column of --survey',
+                        default = 'ideology')
+    parser.add_argument('--standardize',
+                        help='standardize the survey ideology',
+                        action = 'store_true')
+    parser.add_argument('--weight',
+                        help='count each visitor once, or each visit',
+                        choices = ['visitors', 'visits'],
+                        default = 'visitors')
+    args = parser.parse_args(argv)
+    if args.visits and not args.survey:
+        parser.error('--survey is required with --visits')
+    return(args)
+
+#==============================================================================
+# MAIN
+#==============================================================================
+def main(args):
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    mat, rownames, colnames = read_matrix(args.input, args.country,
+                                          str(args.run))
+    followers = np.asarray(mat.getnnz(axis = 0))
+    accounts = account_table(colnames, followers, read_scores(args.scores),
+                             read_handles(args.media),
+                             read_handles(args.pol))
+    save(args, accounts, 'accounts')
+    print('{} accounts: {} media, {} politicians, {} with a score'.format(
+        len(accounts), (accounts['type'] == 'media').sum(),
+        (accounts['type'] == 'politician').sum(),
+        accounts['zeta'].notnull().sum()))
+
+    # [A] politicians: do the scores separate the parties?
+    print('\n[A] Politician scores by party')
+    parties, pairs, eta_squared = party_separation(accounts,
+                                                   pd.read_csv(args.pol))
+    save(args, parties, 'parties')
+    save(args, pairs, 'party-pairs')
+    print(parties.to_string(index = False))
+    print('eta squared (share of the variance between parties): '
+          '{:.3f}'.format(eta_squared))
+    if len(pairs) > 0:
+        top = pairs.loc[(pairs['n_a'] * pairs['n_b']).idxmax()]
+        print('AUC {} vs {}: {:.3f}'.format(top['party_a'], top['party_b'],
+                                           top['auc']))
+
+    # [B] visitors: does the score of a domain follow the ideology of the
+    #   people who visit it?
+    if args.visits:
+        print('\n[B] Ideology of the visitors of each domain')
+        start = time.time()
+        domains, stats = visitors_validation(args, accounts)
+        save(args, domains, 'domains')
+        print('{} domains with visitors; correlation with the scores over '
+              '{} domains: {:.3f} (Pearson), {:.3f} (Spearman)'.format(
+                  domains['n'].gt(0).sum(), stats['domains'],
+                  stats['pearson'], stats['spearman']))
+        print('{:.1f} secs'.format(time.time() - start))
+
+
+#==============================================================================
+# FUNCTIONS
+#==============================================================================
+def visitors_validation(args, accounts):
+    """
+    Reads the browsing panel and the survey of 'args', and returns the
+    ideology of the visitors of each domain next to its score, and the
+    correlations
+    """
+    cols = [args.user_col, args.host_col] + \
+        ([args.count_col] if args.count_col else [])
+    visits = pd.read_csv(args.visits, usecols = cols,
+                         dtype = {args.user_col: str, args.host_col: str})
+    survey = pd.read_csv(args.survey, usecols = [args.survey_id,
+                                                 args.ideology_col],
+                         dtype = {args.survey_id: str})
+    survey[args.survey_id] = survey[args.survey_id].str.strip()
+    survey = survey.dropna().drop_duplicates(args.survey_id)
+    ideology = survey.set_index(args.survey_id)[args.ideology_col]
+    if args.standardize:
+        ideology = (ideology - ideology.mean()) / ideology.std()
+    handles = pd.read_csv(args.media, dtype = str)
+    index = domain_index(handles['domain'].dropna())
+    users = visits[args.user_col].str.strip()
+    counts = visits[args.count_col] if args.count_col else None
+    mat, user_ids, domains = visit_matrix(users, visits[args.host_col],
+                                          index, counts)
+    print('{} rows: {} users x {} domains, {} user-domain pairs'.format(
+        len(visits), mat.shape[0], mat.shape[1], mat.nnz))
+    table = visitor_ideology(mat, user_ids, domains, ideology, args.weight)
+    return(compare_domains(table, accounts, handles))
+
+
+def save(args, df, name):
+    """Saves a table of the validation of the matrix of 'args'"""
+    df.to_csv(matrix_file(args.output, args.country, str(args.run),
+                          'validation-' + name, 'csv'), index = False)
+
+
+if __name__ == "__main__":
+    main(parse_args())